@@ -0,0 +1,309 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+DEFAULT_RATES = [250, 1000, 2048, 4096, 8192, 16384]
+DEFAULT_CHANNELS = [8, 32, 64, 128, 256]
+
+def percentiles(values):
+    """p50/p95/p99/max of a list of milliseconds, None when empty."""
+    if len(values) == 0:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(values.max())}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # Linux reports kilobytes, macOS bytes
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def produce(name, rate, n_channels, chunk, ready, stop, results):
+    """
+    Outlet process: noise on every channel but the first, which carries the
+    sample counter so the consumer can count lost samples. Pushes are paced
+    against absolute deadlines; the achieved rate and worst lateness are
+    reported when `stop` is set.
+    """
+    from pylsl import StreamInfo, StreamOutlet
+    info = StreamInfo(name, 'EEG', n_channels, rate, 'float32', name)
+    channels = info.desc().append_child("channels")
+    for k in range(n_channels):
+        channels.append_child("channel").append_child_value("label", f"EEG_{k:03d}")
+    outlet = StreamOutlet(info, chunk_size=chunk)
+
+    # One second of noise, reused cyclically
+    block = (np.random.default_rng(0).standard_normal((int(rate), n_channels)) * 10).astype(np.float32)
+    period = chunk / rate
+    sent = 0
+    max_late = 0.0
+    ready.set()
+    start_time = time.perf_counter()
+    while not stop.is_set():
+        deadline = start_time + (sent + chunk) / rate
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        max_late = max(max_late, time.perf_counter() - deadline)
+        rows = np.arange(sent, sent + chunk) % len(block)
+        data = block[rows]
+        data[:, 0] = np.arange(sent, sent + chunk) % (1 << 24) # Exact in float32
+        outlet.push_chunk(data)
+        sent += chunk
+    elapsed = time.perf_counter() - start_time
+    results.put({'sent': sent, 'rate': sent / elapsed, 'max_late_ms': max_late * 1e3, 'period_ms': period * 1e3})
+
+
+class CountingClient:
+    """LSLClient wrapper checking the counter channel of every chunk it hands out."""
+
+    def __init__(self, client):
+        self.client = client
+        self.last = None
+        self.received = 0
+        self.lost = 0
+        self.timestamps = np.zeros(0) # Of the last chunk handed out
+
+    def get_data(self):
+        data, timestamps = self.client.get_data()
+        self.timestamps = timestamps
+        if len(data):
+            counter = data[:, 0].astype(np.int64)
+            steps = np.diff(counter) % (1 << 24)
+            self.lost += int(np.sum(steps - 1))
+            if self.last is not None:
+                self.lost += int((counter[0] - self.last - 1) % (1 << 24))
+            self.last = int(counter[-1])
+            self.received += len(data)
+        return data, timestamps
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def run_config(name, rate, n_channels, duration, poll_interval, n_trials, model_path,
+               overflow="block", buffer_seconds=30.0, stall_ms=0.0, stall_every=1.0):
+    """
+    Consumer process: the real LSLClient -> ExperimentSession._poll_data ->
+    DataLogger path for `duration` seconds, then `n_trials` feedback
+    decisions through the Qt event loop while polling continues.
+
+    With `stall_ms`, the polling thread is blocked for that long every
+    `stall_every` seconds, like a GUI thread busy redrawing.
+    """
+    from pylsl import resolve_byprop, local_clock
+    from PyQt6.QtCore import QCoreApplication, QTimer
+    from src.config import ExperimentConfig, TaskType
+    from src.core.lsl_client import LSLClient
+    from src.core.data_handler import DataLogger
+    from src.core.experiment import ExperimentSession, ExperimentState
+    from src.core.classifier import CSPSVMClassifier
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    streams = resolve_byprop('name', name, timeout=10.0)
+    if not streams:
+        raise RuntimeError(f"Stream {name} not found")
+
+    save_dir = tempfile.mkdtemp(prefix="bench_acq_")
+    quiet = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(quiet):
+            lsl_client = LSLClient(buffer_duration=buffer_seconds, overflow=overflow)
+            lsl_client.connect(streams[0])
+            client = CountingClient(lsl_client)
+            data_logger = DataLogger(save_dir=save_dir)
+            data_logger.set_stream_info(lsl_client.get_info())
+            config = ExperimentConfig()
+            classifier = CSPSVMClassifier(model_path) if model_path else None
+            session = ExperimentSession(config, client, data_logger, classifier=classifier)
+            if session.preprocessor is not None:
+                session.preprocessor.reset()
+
+        # Phase 1: sustained acquisition, polled like the session's poll timer
+        lsl_client.start_recording()
+        poll_ms = []
+        sample_latency_ms = []
+        newest_latency_ms = []
+        stored = 0
+        first_poll = None # perf_counter() of the first poll that returned data
+        start_time = time.perf_counter()
+        n_polls = int(duration / poll_interval)
+        stall_polls = max(1, int(round(stall_every / poll_interval)))
+        for k in range(n_polls):
+            deadline = start_time + (k + 1) * poll_interval
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            if stall_ms > 0 and k % stall_polls == stall_polls - 1:
+                time.sleep(stall_ms / 1000.0)
+            t0 = time.perf_counter()
+            session._poll_data()
+            poll_ms.append((time.perf_counter() - t0) * 1e3)
+            stored_now = local_clock()
+            if len(client.timestamps):
+                # Timestamps were taken at push time, on this machine's clock
+                latency = (stored_now - client.timestamps) * 1e3
+                sample_latency_ms.extend(latency)
+                newest_latency_ms.append(latency[-1])
+                # Throughput counts from the first data, not from subscribing
+                if first_poll is None:
+                    first_poll = t0
+                else:
+                    stored += len(latency)
+        end_time = time.perf_counter()
+        elapsed = end_time - start_time
+        throughput = stored / (end_time - first_poll) if first_poll is not None and end_time > first_poll else 0.0
+
+        # Phase 2: timer fire -> feedback emit, with the poll timer running
+        decision_ms = []
+        errors = []
+        if n_trials > 0:
+            session.running = True
+            session.current_task = TaskType.LEFT_HAND
+            fired = {}
+
+            def fire():
+                session.timer.stop() # Feedback timer of the previous trial
+                session.state = ExperimentState.RECORDING
+                fired['t0'] = time.perf_counter()
+                session._on_timeout()
+
+            def on_feedback(prediction, correct):
+                decision_ms.append((time.perf_counter() - fired['t0']) * 1e3)
+                errors.append(prediction == TaskType.ERROR.name)
+                if len(decision_ms) < n_trials:
+                    QTimer.singleShot(int(poll_interval * 2500), fire)
+                else:
+                    QTimer.singleShot(0, app.quit)
+
+            session.feedback_ready.connect(on_feedback)
+            session.poll_timer.start(poll_interval)
+            QTimer.singleShot(0, fire)
+            with contextlib.redirect_stdout(quiet):
+                app.exec()
+            session.poll_timer.stop()
+            session.timer.stop()
+
+        lsl_client.stop_recording()
+        lsl_client.clock.stop()
+        session.worker.shutdown()
+        data_logger.writer.discard()
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+    return {
+        'elapsed_s': elapsed,
+        'received': client.received,
+        'stored': stored,
+        'throughput_sps': throughput,
+        'lost_samples': client.lost,
+        'ring_dropped': int(lsl_client.dropped_samples),
+        'poll_ms': percentiles(poll_ms),
+        'sample_latency_ms': percentiles(sample_latency_ms),
+        'newest_latency_ms': percentiles(newest_latency_ms),
+        'classification_ms': percentiles(decision_ms),
+        'classification_errors': int(sum(errors)),
+        'classifier': type(session.classifier).__name__,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def benchmark(rate, n_channels, args, ctx):
+    name = f"bench_{rate}_{n_channels}_{os.getpid()}"
+    chunk = max(1, int(round(rate * args.chunk_ms / 1000.0)))
+    ready, stop, results = ctx.Event(), ctx.Event(), ctx.Queue()
+    producer = ctx.Process(target=produce, args=(name, rate, n_channels, chunk, ready, stop, results), daemon=True)
+    producer.start()
+    ready.wait(30)
+    try:
+        # A fresh process per configuration, so its peak RSS is its own
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            result = pool.submit(run_config, name, rate, n_channels, args.duration, args.poll_interval,
+                                 args.trials, args.model, args.overflow, args.buffer_seconds,
+                                 args.stall_ms, args.stall_every).result()
+    finally:
+        stop.set()
+    producer_stats = results.get(timeout=30)
+    producer.join(10)
+
+    result.update({'rate': rate, 'channels': n_channels, 'chunk': chunk, 'producer': producer_stats})
+    # Sustained: everything produced on time was stored, nothing was lost on the way
+    result['sustained'] = bool(result['lost_samples'] == 0 and result['ring_dropped'] == 0
+                               and producer_stats['rate'] >= 0.99 * rate
+                               and result['throughput_sps'] >= 0.98 * rate)
+    return result
+
+def print_result(r):
+    poll = r['poll_ms'] or {}
+    latency = r['sample_latency_ms'] or {}
+    decision = r['classification_ms'] or {}
+    print(f"{r['rate']:>6} | {r['channels']:>4} | {r['throughput_sps']:>10.0f} | {r['lost_samples'] + r['ring_dropped']:>7} | "
+          f"{poll.get('p50', np.nan):>8.2f} | {poll.get('p99', np.nan):>8.2f} | {latency.get('p99', np.nan):>10.1f} | "
+          f"{decision.get('p50', np.nan):>8.1f} | {r['peak_rss_mb'] or np.nan:>7.0f} | {'yes' if r['sustained'] else 'NO'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of LSLClient -> ExperimentSession._poll_data -> DataLogger "
+                                                 "and of the feedback decision, against a local LSL outlet.")
+    parser.add_argument("--rates", type=int, nargs="+", default=DEFAULT_RATES)
+    parser.add_argument("--channels", type=int, nargs="+", default=DEFAULT_CHANNELS)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of acquisition per configuration")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Seconds, as the session's poll timer")
+    parser.add_argument("--chunk-ms", type=float, default=4.0, help="Outlet push interval")
+    parser.add_argument("--trials", type=int, default=20, help="Feedback decisions timed per configuration (0: skip)")
+    parser.add_argument("--model", default=None, help="Model for CSPSVMClassifier (default: mock classifier)")
+    parser.add_argument("--overflow", choices=["block", "drop_oldest"], default="block", help="LSLClient ring policy")
+    parser.add_argument("--buffer-seconds", type=float, default=30.0, help="LSLClient ring length")
+    parser.add_argument("--stall-ms", type=float, default=0.0, help="Block the polling thread this long ...")
+    parser.add_argument("--stall-every", type=float, default=1.0, help="... every this many seconds (a busy GUI)")
+    parser.add_argument("--output", default=os.path.join(tempfile.gettempdir(), "benchmark_acquisition.json"),
+                        help="JSON report (default: in the temp directory, outside the working tree)")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = []
+    print(f"{'Hz':>6} | {'ch':>4} | {'samples/s':>10} | {'dropped':>7} | {'poll p50':>8} | {'poll p99':>8} | "
+          f"{'latency p99':>10} | {'dec p50':>8} | {'RSS MB':>7} | sustained")
+    for rate in args.rates:
+        for n_channels in args.channels:
+            try:
+                result = benchmark(rate, n_channels, args, ctx)
+            except Exception as e:
+                print(f"{rate:>6} | {n_channels:>4} | failed: {e}")
+                results.append({'rate': rate, 'channels': n_channels, 'error': str(e)})
+                continue
+            print_result(result)
+            results.append(result)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(),
+                 'numpy': np.__version__, 'cpus': os.cpu_count()},
+        'settings': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
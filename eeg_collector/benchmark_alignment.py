@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.alignment import find_gaps, fit_clock, events_to_samples
+
+def make_clock(n_samples, sfreq, drift_ppm, jitter, chunk_size, n_gaps, rng):
+    """
+    Synthetic LSL clock: true sample times with linear drift, per-chunk
+    timestamp jitter and dropped sample ranges.
+
+    Returns:
+        (times, true_times, kept): recorded (jittered) timestamps, the exact
+        time of every kept sample and the original index of every kept sample.
+    """
+    true_times = 1000.0 + np.arange(n_samples) * (1.0 + drift_ppm * 1e-6) / sfreq
+    # Every chunk is shifted by its own transport jitter
+    n_chunks = -(-n_samples // chunk_size)
+    chunk_jitter = rng.normal(0.0, jitter, n_chunks)
+    times = true_times + np.repeat(chunk_jitter, chunk_size)[:n_samples]
+
+    keep = np.ones(n_samples, dtype=bool)
+    for start in rng.integers(0, n_samples - 4096, n_gaps):
+        keep[start:start + rng.integers(16, 2048)] = False
+    kept = np.flatnonzero(keep)
+    return times[kept], true_times[kept], kept
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy and speed of event-to-sample alignment on a synthetic jittered clock.")
+    parser.add_argument("--samples", type=int, default=10_000_000)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--sfreq", type=float, default=2048.0)
+    parser.add_argument("--drift-ppm", type=float, default=50.0)
+    parser.add_argument("--jitter", type=float, default=0.0005, help="Per-chunk timestamp jitter (s)")
+    parser.add_argument("--chunk-size", type=int, default=128)
+    parser.add_argument("--gaps", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    times, true_times, kept = make_clock(args.samples, args.sfreq, args.drift_ppm, args.jitter,
+                                         args.chunk_size, args.gaps, rng)
+    # Events happen exactly at kept samples, on the true clock
+    true_samples = np.sort(rng.choice(len(times), args.events, replace=False))
+    event_times = true_times[true_samples]
+
+    t0 = time.perf_counter()
+    gap_samples, _ = find_gaps(times, args.sfreq)
+    t_gaps = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    clock = fit_clock(times, args.sfreq, gap_samples)
+    t_fit = time.perf_counter() - t0
+
+    injected = np.flatnonzero(np.diff(kept) > 1) + 1
+    print(f"{len(times)} samples, {args.events} events")
+    print(f"Gaps: {len(gap_samples)} found, {len(injected)} injected, "
+          f"{len(np.intersect1d(gap_samples, injected))} found at the injected sample")
+    # Gap detection and the clock fit run once per save
+    print(f"Gap detection: {t_gaps*1e3:.1f} ms, clock fit: {t_fit*1e3:.1f} ms")
+
+    # Found gaps go into every saved recording as BAD_gap annotations and split the clock fit
+    missed = np.setdiff1d(injected, gap_samples)
+    false = np.setdiff1d(gap_samples, injected)
+    if len(missed) or len(false):
+        print(f"FAIL: found gaps differ from the injected ones, missed {missed.tolist()}, false {false.tolist()}")
+
+    for name, model in (("nearest timestamp", None), ("drift fit", clock)):
+        t0 = time.perf_counter()
+        samples = events_to_samples(event_times, times, args.sfreq, clock=model)
+        elapsed = time.perf_counter() - t0
+        error = samples - true_samples
+        print(f"{name:<17} | {elapsed*1e3:7.3f} ms | exact: {np.mean(error == 0)*100:6.2f}% | "
+              f"max |error|: {np.abs(error).max()} samples")
+    if len(missed) or len(false):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+from PyQt6.QtCore import QCoreApplication
+
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.scheduler import SimulatedScheduler
+from src.core.replay import SyntheticSource
+from src.core.experiment import ExperimentSession
+from src.core.data_handler import DataLogger
+from src.core.classifier import CSPSVMClassifier, MockClassifier
+from src.core.continuous import WindowModel
+from src.core.metrics import metrics
+from src.config import ExperimentConfig
+
+def run(args, full_window, duration=None):
+    """
+    One session on simulated time with continuous decoding on. Compute times
+    are real (perf_counter), so they show what a live session would cost.
+    Returns the predictions and the metrics snapshot.
+    """
+    scheduler = SimulatedScheduler()
+    source = SyntheticSource(scheduler.clock, n_channels=args.channels, sfreq=args.rate, seed=args.seed)
+    config = ExperimentConfig()
+    config.random_seed = args.seed
+    config.sampling_rate = int(args.rate)
+    config.continuous_decoding = True
+    config.continuous_window = args.window
+    config.continuous_hop = args.hop
+    config.continuous_outlet = None
+    # Decode from the causally filtered history, which CSPWindowModel keeps features of
+    config.online_preprocessing = True
+    classifier = CSPSVMClassifier(args.model) if args.model else MockClassifier(seed=args.seed)
+    if full_window:
+        # Predict on the whole window every hop, the reference for the incremental model
+        # (raw windows must also cover the filters' settling time)
+        classifier.make_window_model = lambda n, preprocessed: WindowModel(
+            classifier, n if preprocessed else max(n, getattr(classifier, 'filter_samples', n)), preprocessed)
+
+    save_dir = tempfile.mkdtemp(prefix="bench_cont_")
+    predictions = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            logger = DataLogger(save_dir=save_dir)
+            logger.set_stream_info(source.get_info())
+            session = ExperimentSession(config, source, logger, classifier=classifier, scheduler=scheduler)
+            session.prediction_updated.connect(lambda t, name, probs: predictions.append((t, name, probs)))
+            session.start()
+            scheduler.run(until=duration or args.duration)
+            session.stop()
+        logger.writer.discard()
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    return predictions, metrics.snapshot(), session.decoder
+
+def report(name, snapshot, decoder, duration):
+    hist = snapshot['histograms']
+    hop = hist.get('decoder.hop_ms', {'count': 0})
+    predict = hist.get('decoder.predict_ms', {})
+    poll = hist.get('session.poll_ms', {'count': 0})
+    # Share of one core spent on acquisition, filtering and decoding
+    busy_ms = hop.get('mean', 0) * hop['count'] + poll.get('mean', 0) * poll['count']
+    print(f"{name:<12} | {hop['count']:>5} | {hop.get('p50', np.nan):>8.2f} | {hop.get('p95', np.nan):>8.2f} | "
+          f"{hop.get('p99', np.nan):>8.2f} | {hop.get('max', np.nan):>8.2f} | {predict.get('p50', np.nan):>10.3f} | "
+          f"{decoder.missed_deadlines:>6} | "
+          f"{busy_ms / (duration * 1e3) * 100:>6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-hop cost of continuous decoding (ExperimentSession on simulated time, "
+                                                 "synthetic data, real compute times).")
+    parser.add_argument("--model", default=None, help="Model for CSPSVMClassifier (default: mock classifier, timings only)")
+    parser.add_argument("--rate", type=float, default=2048.0)
+    parser.add_argument("--channels", type=int, default=17, help="Trigger + 16 EEG")
+    parser.add_argument("--window", type=float, default=5.0, help="Seconds per prediction")
+    parser.add_argument("--hop", type=float, default=0.125, help="Seconds between predictions")
+    parser.add_argument("--duration", type=float, default=60.0, help="Simulated seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    print(f"{args.rate:g} Hz x {args.channels} ch, {args.window:g} s window every {args.hop*1000:g} ms, "
+          f"{args.duration:g} s simulated")
+    print(f"{'model':<12} | {'hops':>5} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'max ms':>8} | {'predict ms':>10} | {'missed':>6} | {'CPU':>7}")
+    # Imports and first-call allocations of the model, not part of a hop
+    run(args, False, duration=args.window + 1.0)
+    runs = {}
+    for name, full_window in (("incremental", False), ("full window", True)):
+        predictions, snapshot, decoder = run(args, full_window)
+        report(name, snapshot, decoder, args.duration)
+        runs[name] = predictions
+
+    incremental, full = runs["incremental"], runs["full window"]
+    n = min(len(incremental), len(full))
+    if args.model is None:
+        print("Mock classifier: its predictions do not depend on the data, pass --model to compare the two models")
+    elif n:
+        same = sum(a[1] == b[1] for a, b in zip(incremental, full))
+        diff = max(np.nanmax(np.abs(np.asarray(a[2]) - np.asarray(b[2]))) for a, b in zip(incremental, full))
+        print(f"Predictions: {same}/{n} identical, max probability difference {diff:.2e}")
+
+if __name__ == "__main__":
+    main()
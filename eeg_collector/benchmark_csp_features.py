@@ -0,0 +1,73 @@
+import argparse
+import os
+import sys
+import time
+import joblib
+import numpy as np
+
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.csp_features import CSPFeatureEngine
+
+def time_hops(step, n_hops):
+    """Median and p99 milliseconds of step(k) over n_hops calls."""
+    times = []
+    for k in range(n_hops):
+        t0 = time.perf_counter()
+        step(k)
+        times.append((time.perf_counter() - t0) * 1e3)
+    return np.median(times), np.percentile(times, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-update cost and parity of CSPFeatureEngine against model.predict_proba "
+                                                 "on the full window.")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), 'models', 'csp_svm_mati_model.pkl'))
+    parser.add_argument("--fs", type=int, default=256, help="Sampling rate of the (filtered) classifier input")
+    parser.add_argument("--windows", type=float, nargs="+", default=[1.0, 5.0, 10.0], help="Seconds")
+    parser.add_argument("--hops", type=float, nargs="+", default=[0.03125, 0.125, 0.5], help="Seconds")
+    parser.add_argument("--n-hops", type=int, default=400)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    if not CSPFeatureEngine.supports(model):
+        print("Model does not start with a CSP step producing log band power")
+        return
+    n_channels = model.steps[0][1].filters_.shape[1]
+    rng = np.random.default_rng(0)
+
+    print(f"{'window s':>8} | {'hop ms':>6} | {'engine ms':>9} | {'p99':>6} | {'full ms':>7} | {'p99':>6} | {'speed-up':>8} | "
+          f"{'max |dfeat|':>11} | {'max |dprob|':>11} | same labels")
+    for window in args.windows:
+        window_samples = int(window * args.fs)
+        for hop in args.hops:
+            hop_samples = max(1, int(round(hop * args.fs)))
+            n_samples = window_samples + hop_samples * args.n_hops
+            data = rng.standard_normal((n_channels, n_samples)) * 1e-5
+            engine = CSPFeatureEngine(model, window_samples)
+            engine.update(data[:, :window_samples])
+            outputs = []
+
+            def engine_step(k):
+                end = window_samples + (k + 1) * hop_samples
+                engine.update(data[:, end - hop_samples:end])
+                features = engine.features()
+                outputs.append((features,) + engine.predict(features[np.newaxis]))
+
+            reference = []
+
+            def full_step(k):
+                end = window_samples + (k + 1) * hop_samples
+                window_data = data[np.newaxis, :, end - window_samples:end]
+                reference.append((model[0].transform(window_data)[0], model.predict(window_data), model.predict_proba(window_data)))
+
+            engine_p50, engine_p99 = time_hops(engine_step, args.n_hops)
+            full_p50, full_p99 = time_hops(full_step, args.n_hops)
+            feature_diff = max(np.max(np.abs(a[0] - b[0])) for a, b in zip(outputs, reference))
+            prob_diff = max(np.max(np.abs(a[2] - b[2])) for a, b in zip(outputs, reference))
+            same = sum(int(a[1][0] == b[1][0]) for a, b in zip(outputs, reference))
+            print(f"{window:>8g} | {hop * 1000:>6g} | {engine_p50:>9.3f} | {engine_p99:>6.3f} | {full_p50:>7.3f} | {full_p99:>6.3f} | "
+                  f"{full_p50 / engine_p50:>7.1f}x | {feature_diff:>11.1e} | {prob_diff:>11.1e} | {same}/{args.n_hops}")
+
+if __name__ == "__main__":
+    main()
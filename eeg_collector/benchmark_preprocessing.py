@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from scipy import signal
+
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.preprocessing import Preprocessor
+
+# Parity with the old pipeline on the samples the classifier consumes, relative to their RMS
+TOLERANCE = 5e-3
+
+def legacy_preprocess(data, fs_in=2048, fs_out=256, lowcut=8, highcut=32):
+    """The original CSPSVMClassifier._preprocess, filters designed on every call."""
+    data = data[1:17]
+    data_seconds = data.shape[1] / fs_in
+    data = signal.resample(data, int(data_seconds * fs_out), axis=1)
+    b_notch, a_notch = signal.iirnotch(50.0, 30.0, fs_out)
+    data = signal.filtfilt(b_notch, a_notch, data, axis=-1)
+    nyquist = 0.5 * fs_out
+    b_band, a_band = signal.butter(5, [lowcut / nyquist, highcut / nyquist], btype='band')
+    return signal.filtfilt(b_band, a_band, data, axis=-1)
+
+def synthetic_eeg(n_channels, n_samples, fs, rng):
+    """1/f background, 10 Hz rhythm, 50 Hz line noise and per-channel DC offsets."""
+    spectrum = rng.normal(size=(n_channels, n_samples // 2 + 1)) + 1j * rng.normal(size=(n_channels, n_samples // 2 + 1))
+    freqs = np.fft.rfftfreq(n_samples, 1 / fs)
+    spectrum /= np.maximum(freqs, 0.5)
+    data = np.fft.irfft(spectrum, n_samples, axis=1)
+    data /= data.std(axis=1, keepdims=True)
+    t = np.arange(n_samples) / fs
+    data += 0.5 * np.sin(2 * np.pi * 10 * t) + 0.3 * np.sin(2 * np.pi * 50 * t)
+    data += rng.normal(0, 20, size=(n_channels, 1))
+    return data * 1e-5
+
+def time_call(func, data, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = func(data)
+        times.append(time.perf_counter() - t0)
+    return out, np.array(times) * 1e3
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and parity of the classifier preprocessing.")
+    parser.add_argument("--seconds", type=float, default=50.0, help="Window length fed to preprocessing")
+    parser.add_argument("--channels", type=int, default=17, help="Recorded channels (trigger + 16 EEG)")
+    parser.add_argument("--fs", type=int, default=2048)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--tail", type=int, default=1280, help="Output samples compared (classifier window)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    data = synthetic_eeg(args.channels, int(args.seconds * args.fs), args.fs, rng)
+    preprocessor = Preprocessor(args.fs, 256, 8, 32)
+
+    legacy_out, legacy_ms = time_call(lambda d: legacy_preprocess(d, args.fs), data, args.repeats)
+    full_out, full_ms = time_call(preprocessor, data, args.repeats)
+    # As CSPSVMClassifier: the window ends edge_samples before the newest output sample
+    edge = preprocessor.edge_samples
+    new_out, new_ms = time_call(lambda d: preprocessor(d, n_out=args.tail + edge), data, args.repeats)
+
+    print(f"Window: 16 of {args.channels} channels x {args.seconds:.0f} s at {args.fs} Hz, {args.repeats} repeats")
+    print(f"{'Pipeline':<28} | {'median ms':>10} | {'min ms':>8}")
+    print(f"{'resample + filtfilt (old)':<28} | {np.median(legacy_ms):10.2f} | {legacy_ms.min():8.2f}")
+    print(f"{'resample_poly + sosfiltfilt':<28} | {np.median(full_ms):10.2f} | {full_ms.min():8.2f}")
+    print(f"{'  cropped to needed output':<28} | {np.median(new_ms):10.2f} | {new_ms.min():8.2f}")
+    print(f"Speed-up: {np.median(legacy_ms) / np.median(new_ms):.1f}x")
+
+    # Compare on the samples the classifier actually consumes, relative to their RMS
+    window = slice(-args.tail - edge, -edge)
+    rms = np.sqrt(np.mean(legacy_out[:, window] ** 2))
+    error = np.abs(new_out[:, window] - legacy_out[:, window])
+    print(f"Classifier window ({args.tail} samples, ending {edge} before the newest): "
+          f"max |error| / RMS = {error.max() / rms:.2e} (tolerance {TOLERANCE:.0e}), "
+          f"mean |error| / RMS = {error.mean() / rms:.2e}")
+    # Left out of the window: there each pipeline shows its own edge handling
+    last = slice(-edge, None)
+    print(f"Final {edge} samples (not consumed): max |error| / RMS = "
+          f"{np.abs(new_out[:, last] - legacy_out[:, last]).max() / rms:.2e}")
+    crop_error = np.abs(new_out[:, window] - full_out[:, window]).max() / rms
+    print(f"Cropped vs full-window polyphase output: max |error| / RMS = {crop_error:.2e}")
+    if error.max() / rms >= TOLERANCE:
+        print(f"FAIL: preprocessing differs from the old pipeline by more than {TOLERANCE:.0e} of the RMS")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
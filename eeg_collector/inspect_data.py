@@ -1,8 +1,14 @@
 import mne
 import os
+import sys
 import glob
 import matplotlib.pyplot as plt
 
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.epochs import EpochReader
+
 def main():
     # Search in data/ directory
     search_dir = "data"
@@ -41,22 +47,27 @@ def main():
         print(f"Loading latest file: {latest_file}")
     
     try:
-        # Load data
-        raw = mne.io.read_raw_fif(latest_file, preload=True)
+        # Open lazily, the browser reads only the part on screen
+        reader = EpochReader(latest_file)
+        raw = reader.raw
         print(raw.info)
         
-        raw.filter(l_freq=1.0, h_freq=40.0, fir_design='firwin')
-        raw.notch_filter(freqs=[50.0])
-
-        # Extract events from annotations
-        # MNE stores our string descriptions in annotations, we convert them back to events for plotting
-        events, event_id = mne.events_from_annotations(raw)
+        # Events come from annotations (MNE stores our string descriptions there),
+        # indexed once when the file is opened
+        events, event_id = reader.events, reader.event_id
+        # Plot positions count from the first recorded sample, like the index
+        events = events.copy()
+        events[:, 0] += raw.first_samp
         print(f"Found {len(events)} events.")
         print(f"Event IDs: {event_id}")
         
         # Plot
         # scalings='auto' helps if signals are small/large
-        raw.plot(events=events, event_id=event_id, block=True, title=f"Inspection: {os.path.basename(latest_file)}")
+        # Band-pass is applied per displayed page instead of filtering the whole
+        # preloaded file; the 40 Hz low-pass also removes 50 Hz line noise
+        raw.plot(events=events, event_id=event_id, highpass=1.0, lowpass=40.0, block=True,
+                 title=f"Inspection: {os.path.basename(latest_file)}")
+        reader.close()
         
     except Exception as e:
         print(f"Error loading/plotting file: {e}")
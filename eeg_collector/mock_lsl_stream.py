@@ -1,49 +1,167 @@
+import argparse
+import os
+import sys
 import time
 import numpy as np
 from pylsl import StreamInfo, StreamOutlet
 
-def main():
-    # Define stream parameters
-    srate = 250  # Sampling rate in Hz
-    n_channels = 8
-    name = 'MockEEG'
-    type = 'EEG'
-    
-    # Create stream info
-    info = StreamInfo(name, type, n_channels, srate, 'float32', 'myuid12345')
-    
-    # Append some meta-data
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.synthetic import SyntheticEEG
+from src.config import ExperimentConfig
+
+# LSL channel formats and the integer range they can carry
+DTYPES = {
+    'float32': (np.float32, None),
+    'double64': (np.float64, None),
+    'int32': (np.int32, np.iinfo(np.int32)),
+    'int16': (np.int16, np.iinfo(np.int16)),
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthetic EEG over LSL, for load testing acquisition and classification.")
+    parser.add_argument("--name", default="MockEEG")
+    parser.add_argument("--rate", type=float, default=2048.0, help="Nominal sampling rate (Hz)")
+    parser.add_argument("--channels", type=int, default=17, help="Channel count (trigger + 16 EEG, then extra channels)")
+    parser.add_argument("--chunk", type=int, default=64, help="Samples per push")
+    parser.add_argument("--dtype", choices=list(DTYPES), default='float32')
+    parser.add_argument("--scale", type=float, default=1.0, help="Counts per microvolt for integer formats")
+    parser.add_argument("--seed", type=int, default=0, help="Seeds the signal and the injected faults")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds to stream (0: until Ctrl+C)")
+    parser.add_argument("--ramp", action="store_true", help="Send the sample counter on every channel instead of EEG")
+
+    content = parser.add_argument_group("signal content (microvolts)")
+    content.add_argument("--background", type=float, default=10.0, help="1/f background RMS")
+    content.add_argument("--alpha", type=float, default=8.0, help="Occipital alpha RMS")
+    content.add_argument("--mu", type=float, default=6.0, help="Sensorimotor mu RMS")
+    content.add_argument("--line", type=float, default=5.0, help="Line noise amplitude")
+    content.add_argument("--line-freq", type=float, default=50.0)
+    content.add_argument("--erd", type=float, default=0.6, help="Fraction of mu suppressed during imagery")
+    content.add_argument("--task-seconds", type=float, default=4.0,
+                         help="Length of each imagery block, tasks cycle in seeded random order (0: always rest)")
+
+    faults = parser.add_argument_group("timing faults")
+    faults.add_argument("--jitter-ms", type=float, default=0.0, help="Std of the random delay of every push")
+    faults.add_argument("--dropout-rate", type=float, default=0.0, help="Dropouts per minute (samples are lost)")
+    faults.add_argument("--dropout-ms", type=float, default=100.0, help="Length of each dropout")
+    faults.add_argument("--drift-ppm", type=float, default=0.0,
+                        help="Sample clock error: the stream runs at rate * (1 + ppm/1e6) but advertises rate")
+    return parser.parse_args()
+
+def make_outlet(args, labels):
+    info = StreamInfo(args.name, 'EEG', args.channels, args.rate, args.dtype, f"{args.name}_{args.seed}")
     channels = info.desc().append_child("channels")
-    for c in ["Fp1", "Fp2", "C3", "C4", "P7", "P8", "O1", "O2"]:
-        channels.append_child("channel").append_child_value("label", c)
-        
-    # Create outlet
-    outlet = StreamOutlet(info)
-    
-    print(f"Sending data... Press Ctrl+C to stop.")
-    
-    start_time = time.time()
-    sent_samples = 0
-    
+    for label in labels:
+        channels.append_child("channel").append_child_value("label", label)
+    return StreamOutlet(info, chunk_size=args.chunk)
+
+def to_dtype(data, dtype, scale):
+    np_dtype, limits = DTYPES[dtype]
+    if limits is None:
+        return data.astype(np_dtype)
+    return np.clip(np.round(data * scale), limits.min, limits.max).astype(np_dtype)
+
+class TaskCycle:
+    """Imagery blocks of fixed length, tasks in seeded random order."""
+
+    def __init__(self, generator, block_samples, rng):
+        self.generator = generator
+        self.block_samples = block_samples
+        self.rng = rng
+        self.tasks = ExperimentConfig().tasks
+        self.order = []
+        self.next_switch = 0
+
+    def generate(self, n):
+        """Like SyntheticEEG.generate, switching task exactly at block boundaries."""
+        if self.block_samples <= 0:
+            return self.generator.generate(n)
+        parts = []
+        while n > 0:
+            if self.generator.sample == self.next_switch:
+                if not self.order:
+                    self.order = list(self.rng.permutation(len(self.tasks)))
+                self.generator.set_task(self.tasks[self.order.pop()])
+                self.next_switch += self.block_samples
+            k = min(n, self.next_switch - self.generator.sample)
+            parts.append(self.generator.generate(k))
+            n -= k
+        return np.vstack(parts)
+
+def sleep_until(deadline):
+    """Sleep to within ~1 ms, then spin, so pushes land on their deadline."""
+    remaining = deadline - time.perf_counter()
+    if remaining > 0.002:
+        time.sleep(remaining - 0.001)
+    while time.perf_counter() < deadline:
+        pass
+
+def main():
+    args = parse_args()
+    # Signal and faults draw from separate streams: enabling a fault does not change the data
+    generator = SyntheticEEG(args.channels, args.rate, seed=args.seed,
+                             background=args.background, alpha=args.alpha, mu=args.mu,
+                             line=args.line, line_freq=args.line_freq, erd=args.erd)
+    source = TaskCycle(generator, int(round(args.task_seconds * args.rate)), np.random.default_rng([args.seed, 1]))
+    faults = np.random.default_rng([args.seed, 2])
+    outlet = make_outlet(args, generator.labels)
+
+    actual_rate = args.rate * (1 + args.drift_ppm * 1e-6)
+    chunk_period = args.chunk / actual_rate
+    dropout_chance = args.dropout_rate / 60.0 * chunk_period
+    dropout_chunks = max(1, int(round(args.dropout_ms / 1000.0 / chunk_period)))
+
+    print(f"Sending {args.channels} channels at {args.rate:g} Hz ({args.dtype}, {args.chunk} samples per push) "
+          f"as '{args.name}'. Press Ctrl+C to stop.")
+    if args.jitter_ms or args.dropout_rate or args.drift_ppm:
+        print(f"Faults: jitter {args.jitter_ms:g} ms, {args.dropout_rate:g} dropouts/min of {args.dropout_ms:g} ms, "
+              f"drift {args.drift_ppm:g} ppm")
+
+    n_chunks = int(args.duration * actual_rate / args.chunk) if args.duration > 0 else None
+    sent = 0
+    lost = 0
+    dropout_left = 0
+    max_late = 0.0
+    report_every = max(1, int(round(10.0 / chunk_period)))
+    start_time = time.perf_counter()
+    k = 0
+
     try:
-        while True:
-            elapsed_time = time.time() - start_time
-            required_samples = int(srate * elapsed_time) - sent_samples
-            
-            if required_samples > 0:
-                # Generate random data
-                # data = np.random.randn(required_samples, n_channels).astype(np.float32)
-                data = (np.arange(sent_samples, sent_samples + required_samples)[:, None] * 1.0).astype(np.float32)
-                data = np.tile(data, (1, n_channels))
-
-                # Push chunk
-                outlet.push_chunk(data)
-                sent_samples += required_samples
-            
-            time.sleep(0.01)
-            
+        while n_chunks is None or k < n_chunks:
+            # Deadlines count from the start, so neither sleep error nor jitter accumulates
+            deadline = start_time + (k + 1) * chunk_period
+            if args.jitter_ms > 0:
+                deadline += abs(faults.normal(0.0, args.jitter_ms / 1000.0))
+            sleep_until(deadline)
+            max_late = max(max_late, time.perf_counter() - deadline)
+
+            if args.ramp:
+                data = np.tile(np.arange(k * args.chunk, (k + 1) * args.chunk, dtype=np.float64)[:, None], (1, args.channels))
+            else:
+                data = source.generate(args.chunk)
+
+            if dropout_left == 0 and dropout_chance > 0 and faults.random() < dropout_chance:
+                dropout_left = dropout_chunks
+            if dropout_left > 0:
+                dropout_left -= 1
+                lost += args.chunk
+            else:
+                outlet.push_chunk(to_dtype(data, args.dtype, args.scale))
+                sent += args.chunk
+            k += 1
+
+            if k % report_every == 0:
+                elapsed = time.perf_counter() - start_time
+                print(f"{elapsed:7.1f} s: {sent} samples sent ({(sent + lost) / elapsed:.1f} Hz), "
+                      f"{lost} lost, max push delay {max_late * 1000:.2f} ms")
+                max_late = 0.0
+
     except KeyboardInterrupt:
         print("Stopping stream...")
 
+    elapsed = time.perf_counter() - start_time
+    print(f"Sent {sent} samples in {elapsed:.1f} s, {lost} lost to dropouts")
+
 if __name__ == '__main__':
     main()
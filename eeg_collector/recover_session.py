@@ -0,0 +1,34 @@
+import argparse
+import glob
+import os
+import sys
+
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.data_handler import recover_spool
+
+def main():
+    parser = argparse.ArgumentParser(description="Recover interrupted sessions (*.spool directories) into .fif files.")
+    parser.add_argument("spools", nargs="*", help="Spool directories to recover (default: all in --data-dir)")
+    parser.add_argument("--data-dir", default="data", help="Where to look for spools and save recovered files")
+    parser.add_argument("--subject", default="recovered", help="Subject ID used in the output filename")
+    parser.add_argument("--run", default="recovered", help="Run ID used in the output filename")
+    args = parser.parse_args()
+
+    spools = args.spools or sorted(glob.glob(os.path.join(args.data_dir, "*.spool")))
+    if not spools:
+        print(f"No spools found in '{args.data_dir}'.")
+        return
+
+    for spool_dir in spools:
+        print(f"Recovering {spool_dir}...")
+        try:
+            recover_spool(spool_dir, args.data_dir, args.subject, args.run)
+        except Exception as e:
+            print(f"Failed to recover {spool_dir}: {e}")
+            continue
+        print(f"Check the recovered file, then delete {spool_dir}")
+
+if __name__ == "__main__":
+    main()
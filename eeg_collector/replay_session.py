@@ -0,0 +1,139 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from PyQt6.QtCore import QCoreApplication
+
+# Add current dir to path
+sys.path.append(os.getcwd())
+
+from src.core.replay import ReplaySource
+from src.core.scheduler import SimulatedScheduler
+from src.core.experiment import ExperimentSession
+from src.core.data_handler import DataLogger
+from src.core.classifier import CSPSVMClassifier, MockClassifier
+from src.config import ExperimentConfig
+
+def build_script(events, config):
+    """(cue_time, TaskType) of every trial in the original recording."""
+    marker_to_task = {v: k for k, v in config.markers.items()}
+    return [(t, marker_to_task[m]) for t, m in events if m in marker_to_task]
+
+def split_trials(events, config):
+    """
+    Group events into trials: each cue marker starts one, followed by its
+    feedback (prediction) and correct/wrong markers.
+
+    Returns:
+        List of dicts with cue_time, cue, feedback_time, feedback, correct.
+    """
+    cues = set(config.markers.values())
+    feedbacks = set(config.feedback_markers.values())
+    trials = []
+    for t, m in sorted(events):
+        if m in cues:
+            trials.append({'cue_time': t, 'cue': m, 'feedback_time': np.nan, 'feedback': None, 'correct': None})
+        elif trials and m in feedbacks and trials[-1]['feedback'] is None:
+            trials[-1]['feedback_time'] = t
+            trials[-1]['feedback'] = m
+        elif trials and m in (config.marker_correct, config.marker_wrong) and trials[-1]['correct'] is None:
+            trials[-1]['correct'] = (m == config.marker_correct)
+    return trials
+
+def compare_markers(original, replayed, config, verbose=False):
+    """Print how the replayed session's markers line up with the recording's."""
+    orig_trials = split_trials(original, config)
+    new_trials = split_trials(replayed, config)
+    n = min(len(orig_trials), len(new_trials))
+    print("\n" + "=" * 60)
+    print("MARKER COMPARISON (replay vs original)")
+    print("=" * 60)
+    print(f"Trials: {len(new_trials)} replayed, {len(orig_trials)} in recording")
+    if n == 0:
+        return
+
+    if verbose:
+        print(f"{'Trial':<6} | {'Cue':<4} | {'Cue dt ms':>9} | {'Orig pred':>9} | {'New pred':>8} | {'Fb dt ms':>8}")
+    cue_dt = []
+    feedback_dt = []
+    same_cue = 0
+    same_prediction = 0
+    with_prediction = 0
+    for k in range(n):
+        o, r = orig_trials[k], new_trials[k]
+        cue_dt.append(r['cue_time'] - o['cue_time'])
+        feedback_dt.append(r['feedback_time'] - o['feedback_time'])
+        same_cue += o['cue'] == r['cue']
+        if o['feedback'] is not None:
+            with_prediction += 1
+            same_prediction += o['feedback'] == r['feedback']
+        if verbose:
+            print(f"{k + 1:<6} | {o['cue']:<4} | {cue_dt[-1]*1e3:9.1f} | {str(o['feedback']):>9} | {str(r['feedback']):>8} | {feedback_dt[-1]*1e3:8.1f}")
+
+    cue_dt = np.abs(np.array(cue_dt)) * 1e3
+    feedback_dt = np.abs(np.array(feedback_dt)) * 1e3
+    print(f"Cue markers matching: {same_cue}/{n}")
+    print(f"Cue time |difference|: median {np.median(cue_dt):.1f} ms, max {cue_dt.max():.1f} ms")
+    if np.isfinite(feedback_dt).any():
+        print(f"Feedback time |difference|: median {np.nanmedian(feedback_dt):.1f} ms, max {np.nanmax(feedback_dt):.1f} ms")
+    if with_prediction:
+        print(f"Same prediction as original: {same_prediction}/{with_prediction}")
+
+    def accuracy(trials):
+        scored = [t['correct'] for t in trials if t['correct'] is not None]
+        return f"{np.mean(scored)*100:.2f}% ({sum(scored)}/{len(scored)})" if scored else "N/A"
+    print(f"Original accuracy: {accuracy(orig_trials[:n])}")
+    print(f"Replay accuracy:   {accuracy(new_trials[:n])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run a recorded session faster than real time, without LSL.")
+    parser.add_argument("recording", help="Recorded _raw.fif")
+    parser.add_argument("--speed", type=float, default=50.0, help="Virtual seconds per real second")
+    parser.add_argument("--model", default=None, help="Model for CSPSVMClassifier (default: mock classifier)")
+    parser.add_argument("--mock-accuracy", type=float, default=0.5)
+    parser.add_argument("--data-dir", default=os.path.join("data", "replay"), help="Where the replayed session is saved")
+    parser.add_argument("--subject", default="replay")
+    parser.add_argument("--verbose", action="store_true", help="Print every trial")
+    parser.add_argument("--simulated", action="store_true",
+                        help="Run on a discrete-event scheduler: exact timing, as fast as the CPU allows (ignores --speed)")
+    args = parser.parse_args()
+
+    config = ExperimentConfig()
+    scheduler = SimulatedScheduler() if args.simulated else None
+    source = ReplaySource(args.recording, speed=args.speed, clock=scheduler.clock if scheduler else None)
+    original = source.original_events()
+    script = build_script(original, config)
+    if not script:
+        print(f"No cue markers in {args.recording}")
+        return
+    print(f"Replaying {len(script)} trials, {source.duration:.0f} s of data "
+          f"{'on simulated time' if scheduler else f'at {args.speed:g}x'}")
+
+    classifier = CSPSVMClassifier(args.model) if args.model else MockClassifier(accuracy=args.mock_accuracy)
+
+    app = QCoreApplication(sys.argv)
+    logger = DataLogger(save_dir=args.data_dir)
+    source.connect()
+    logger.set_stream_info(source.get_info())
+    session = ExperimentSession(config, source, logger, clock=source.clock, script=script, classifier=classifier,
+                                scheduler=scheduler)
+    session.finished.connect(app.quit)
+
+    t0 = time.perf_counter()
+    session.start()
+    if scheduler is not None:
+        scheduler.run()
+    else:
+        app.exec()
+    elapsed = time.perf_counter() - t0
+    virtual = source.clock.now()
+    print(f"\nReplayed {virtual:.0f} s in {elapsed:.1f} s ({virtual / elapsed:.0f}x real time)")
+
+    replayed = [(float(t), int(m)) for t, m in logger.events]
+    logger.save(args.subject, "replay")
+    compare_markers(original, replayed, config, args.verbose)
+    source.close()
+
+if __name__ == "__main__":
+    main()
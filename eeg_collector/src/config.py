@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 
 class TaskType(Enum):
     RELAX = auto()
@@ -26,7 +26,29 @@ class ExperimentConfig:
     # Classifier
     mock_classifier_accuracy: float = 0.5
     use_mock_classifier: bool = True
+    model_name: str = "csp_svm_mati_model" # <name>.pkl in models_dir, used when not mocking
+    models_dir: Optional[str] = None # None for the bundled models/ directory
+    model_cache_size: int = 3 # loaded models kept warm, see ModelRegistry
+    shadow_models: Tuple[str, ...] = () # models evaluated alongside for comparison, recorded in trials.csv only
     sampling_rate: int = 2048
+    # Filter incrementally (causally) while recording instead of zero-phase at feedback. Only for models
+    # trained on the causal filter's output; in-session calibration and models whose metadata says
+    # filter_mode "causal" always use it.
+    online_preprocessing: bool = False
+    classification_deadline: float = 0.5 # seconds, a later prediction is shown as ERROR
+    random_seed: Optional[int] = None # fixes trial order, relax durations and mock predictions
+    metrics_enabled: bool = True # hot-path timing histograms, saved as <base>_metrics.json
+    overflow_policy: str = "block" # LSL ring full: "block" (samples wait in the inlet) or "drop_oldest"
+    
+    # Continuous (sliding-window) decoding alongside the trials
+    continuous_decoding: bool = False
+    continuous_window: float = 5.0 # seconds of data per prediction
+    continuous_hop: float = 0.125 # seconds between predictions
+    continuous_outlet: Optional[str] = "EEGCollector_Decoder" # LSL stream of the predictions, None for none
+    
+    # In-session calibration: mock feedback until a CSP+SVM model is fitted on the session's first trials
+    calibration_trials: int = 0 # trials before the first fit, 0 to use the pre-trained model
+    recalibrate_every: int = 5 # refit on all trials after this many new ones, 0 to keep the first model
     
     # Markers for LSL/Events
     markers: Dict[TaskType, int] = None
@@ -0,0 +1,148 @@
+import re
+import threading
+import time
+import numpy as np
+from pylsl import StreamInlet, local_clock
+from .lsl_client import LSLClient, CHANNEL_FORMAT_DTYPES
+from .clock_sync import ClockOffsetTracker
+
+
+def stream_key(stream_info) -> str:
+    """File- and dict-friendly name of a stream, e.g. "Tobii_Gaze"."""
+    return re.sub(r"\W+", "_", stream_info.name()).strip("_") or "stream"
+
+
+def is_marker_stream(stream_info) -> bool:
+    """String streams and irregular-rate streams carry events, not samples."""
+    return stream_info.channel_format() not in CHANNEL_FORMAT_DTYPES or stream_info.nominal_srate() == 0
+
+
+class MarkerInlet:
+    """
+    Irregular (marker) stream: pulled on its own thread into a list of
+    (value, timestamp), where value is the first channel as a string.
+    """
+
+    def __init__(self, stream_info, idle_sleep: float = 0.005):
+        self.inlet = StreamInlet(stream_info)
+        self.info = self.inlet.info()
+        self.idle_sleep = idle_sleep
+        self.clock = ClockOffsetTracker(self.inlet)
+        self.clock.start()
+        self.values = []
+        self.timestamps = []
+        self.read_cursor = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start_recording(self):
+        with self.lock:
+            self.values, self.timestamps, self.read_cursor = [], [], 0
+        self.running = True
+        self.thread = threading.Thread(target=self._record_loop, daemon=True)
+        self.thread.start()
+
+    def stop_recording(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _record_loop(self):
+        while self.running:
+            samples, timestamps = self.inlet.pull_chunk(timeout=0.0)
+            if timestamps:
+                with self.lock:
+                    self.values.extend(str(sample[0]) for sample in samples)
+                    self.timestamps.extend(timestamps)
+            else:
+                time.sleep(self.idle_sleep)
+
+    def get_data(self):
+        """(values, timestamps) received since the previous call."""
+        with self.lock:
+            values = self.values[self.read_cursor:]
+            timestamps = np.array(self.timestamps[self.read_cursor:], dtype=np.float64)
+            self.read_cursor = len(self.values)
+        return values, timestamps
+
+    @property
+    def lsl_offset(self):
+        return self.clock.offset_at(local_clock())
+
+
+class AcquisitionManager(LSLClient):
+    """
+    LSLClient for the primary (EEG) stream plus any number of auxiliary
+    streams: EMG, eye tracking, external markers.
+
+    The primary stream is handled exactly as by LSLClient, so
+    ExperimentSession uses this class unchanged. Every auxiliary stream gets
+    its own inlet, puller thread, ring buffer (or marker list) and clock
+    offset tracker; auxiliary threads sleep longer when idle, so they add
+    little contention to the primary path.
+
+    get_aux_data() returns the auxiliary samples received since the previous
+    call with timestamps already moved into the primary stream's clock
+    (stream -> local via the auxiliary tracker, local -> primary via the
+    primary one), the time domain that events and EEG samples are stored in.
+    """
+
+    def __init__(self, stream_name=None, buffer_duration=30, max_chunk_samples=1024, aux_idle_sleep: float = 0.005,
+                 overflow="block"):
+        super().__init__(stream_name, buffer_duration, max_chunk_samples, overflow=overflow)
+        self.aux_idle_sleep = aux_idle_sleep
+        self.aux = {} # Key -> LSLClient (sampled) or MarkerInlet
+
+    def add_aux_stream(self, stream_info) -> str:
+        """Connect an auxiliary stream, returns the key its data is reported under."""
+        key = stream_key(stream_info)
+        while key in self.aux:
+            key += "_"
+        if is_marker_stream(stream_info):
+            client = MarkerInlet(stream_info, idle_sleep=self.aux_idle_sleep)
+        else:
+            client = LSLClient(buffer_duration=self.buffer_duration, max_chunk_samples=self.max_chunk_samples,
+                               idle_sleep=self.aux_idle_sleep, overflow=self.overflow)
+            client.metrics_prefix = f"lsl.{key}"
+            client.connect(stream_info)
+        self.aux[key] = client
+        print(f"Auxiliary stream {key}: {client.info.channel_count()} channels at {client.info.nominal_srate()} Hz")
+        return key
+
+    def remove_aux_streams(self):
+        for client in self.aux.values():
+            client.stop_recording()
+            if client.clock is not None:
+                client.clock.stop()
+        self.aux = {}
+
+    def get_aux_info(self):
+        """Key -> pylsl StreamInfo of every auxiliary stream."""
+        return {key: client.info for key, client in self.aux.items()}
+
+    def start_recording(self):
+        super().start_recording()
+        for client in self.aux.values():
+            client.start_recording()
+
+    def stop_recording(self):
+        for client in self.aux.values():
+            client.stop_recording()
+        super().stop_recording()
+
+    def get_aux_data(self):
+        """
+        Key -> (data, timestamps) received since the previous call, in the
+        primary stream's clock. data is (n_samples, n_channels) float32 for
+        sampled streams and a list of strings for marker streams.
+        """
+        result = {}
+        for key, client in self.aux.items():
+            data, timestamps = client.get_data()
+            if len(timestamps) == 0:
+                continue
+            # Offsets change slowly, one correction per chunk is enough
+            result[key] = (data, self.to_stream_time(timestamps + client.lsl_offset))
+        return result
@@ -0,0 +1,184 @@
+import numpy as np
+
+
+def find_gaps(times: np.ndarray, sfreq: float, threshold: float = 1.5, window: int = 8192, block: int = 256):
+    """
+    Find dropped-sample gaps in a timestamp vector.
+
+    A single step longer than threshold / sfreq is only a candidate: chunk
+    timestamps jitter by a sample or more, and a late chunk is followed by an
+    early one. A candidate is a gap when the clock stays shifted, i.e. when the
+    mean timestamp residual over `window` samples after it is later than the
+    one before it. The shift must exceed both threshold / sfreq and the noise
+    level of the same statistic measured over the whole recording.
+
+    Residual means are taken over blocks of `block` samples, so the scan is
+    one pass over the timestamps plus work proportional to n / block. Gaps in
+    the first or last block have no window on one side and are not reported.
+
+    Near the ends or another gap the windows are shorter, and the noise level
+    is raised to match. The windows of a candidate are cut at the neighbouring gaps, which are
+    only known once found: the test is repeated with the windows cut at the
+    gaps of the previous round until the set of gaps no longer changes.
+
+    Args:
+        times: LSL timestamps of shape (n_samples,).
+        sfreq: Nominal sampling rate.
+        threshold: Minimal gap length, in samples.
+        window: Samples averaged on each side of a candidate.
+        block: Block size used for the residual means.
+
+    Returns:
+        (gap_samples, gap_durations): index of the first sample after each gap
+        and the estimated missing time in seconds.
+    """
+    n = len(times)
+    steps = np.diff(times)
+    candidates = np.flatnonzero(steps > threshold / sfreq) + 1
+    if len(candidates) == 0:
+        return candidates, np.zeros(0)
+
+    # Timestamp residual against the nominal clock, averaged per block
+    n_blocks = n // block
+    block_res = times[:n_blocks * block].reshape(n_blocks, block).mean(axis=1) - times[0]
+    block_res -= (np.arange(n_blocks) * block + (block - 1) / 2.0) / sfreq
+    prefix = np.concatenate(([0.0], np.cumsum(block_res)))
+    k = max(1, window // block)
+
+    def jump_at(before_end, after_start, lo=0, hi=n_blocks):
+        # Mean residual of up to k blocks after minus up to k blocks before,
+        # both sides kept within blocks lo..hi
+        after_start = np.minimum(after_start, hi)
+        b0 = np.maximum(before_end - k, lo)
+        a1 = np.minimum(after_start + k, hi)
+        n_before = before_end - b0
+        n_after = a1 - after_start
+        valid = (n_before > 0) & (n_after > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            jump = ((prefix[a1] - prefix[after_start]) / n_after
+                    - (prefix[before_end] - prefix[b0]) / n_before)
+            # Noise of the jump relative to full windows of k blocks on both sides
+            scale = np.sqrt((1.0 / n_before + 1.0 / n_after) * k / 2.0)
+        return jump, valid, scale
+
+    # Noise level of the statistic, measured at every block boundary
+    all_blocks = np.arange(n_blocks + 1)
+    noise, valid, scale = jump_at(all_blocks, all_blocks)
+    valid &= np.isclose(scale, 1.0)
+    noise = noise[valid]
+    if len(noise):
+        floor = 6 * 1.4826 * np.median(np.abs(noise - np.median(noise)))
+    else:
+        floor = 0.0
+
+    def select(lo, hi, merge):
+        # The block holding the candidate itself is left out on both sides
+        cand_block = candidates // block
+        jumps, valid, scale = jump_at(cand_block, cand_block + 1, lo, hi)
+        # No window on one side: in the first or last block, where a gap cannot
+        # be told from chunk jitter, or squeezed out by a gap in the next block,
+        # whose jittered neighbour it is
+        jumps = np.where(valid, jumps, -np.inf)
+        # Shorter windows (near the ends or another gap) average less jitter away
+        is_gap = jumps > np.maximum(threshold / sfreq, floor * np.where(valid, scale, 1.0))
+        gap_samples, jumps = candidates[is_gap], jumps[is_gap]
+        gap_steps = steps[gap_samples - 1]
+
+        # Jittered chunks next to a real gap see the same jump, keep the largest step
+        keep = []
+        for i in range(len(gap_samples)):
+            if keep and gap_samples[i] - gap_samples[keep[-1]] < merge:
+                if gap_steps[i] > gap_steps[keep[-1]]:
+                    keep[-1] = i
+            else:
+                keep.append(i)
+        return gap_samples[keep], jumps[keep]
+
+    gap_samples, jumps = select(0, n_blocks, window)
+    # A window reaching across another gap sees that gap's shift too, which
+    # makes false gaps up to a window after a real one and blurs gaps closer
+    # than a window: redo the test with every window cut at the neighbouring
+    # gaps found so far, until the set of gaps no longer changes.
+    for _ in range(10):
+        if len(gap_samples) == 0:
+            break
+        prev = np.searchsorted(gap_samples, candidates, side='left') - 1
+        nxt = np.searchsorted(gap_samples, candidates, side='right')
+        lo = np.where(prev >= 0, gap_samples[np.maximum(prev, 0)] // block + 1, 0)
+        hi = np.where(nxt < len(gap_samples), gap_samples[np.minimum(nxt, len(gap_samples) - 1)] // block, n_blocks)
+        new_samples, new_jumps = select(lo, hi, 2 * block)
+        if np.array_equal(new_samples, gap_samples):
+            break
+        gap_samples, jumps = new_samples, new_jumps
+    return gap_samples, jumps
+
+
+def fit_clock(times: np.ndarray, sfreq: float, gap_samples: np.ndarray, stride: int = 256):
+    """
+    Fit time = intercept + slope * (index - start) on every continuous segment.
+
+    Only every `stride`-th sample takes part in the fit, which is plenty for a
+    linear clock model and keeps the fit cheap on long sessions.
+
+    Returns:
+        (starts, slopes, intercepts), one entry per segment.
+    """
+    starts = np.concatenate(([0], gap_samples)).astype(np.int64)
+    ends = np.concatenate((gap_samples, [len(times)])).astype(np.int64)
+    slopes = np.full(len(starts), 1.0 / sfreq)
+    intercepts = times[starts].astype(np.float64)
+
+    for k, (start, end) in enumerate(zip(starts, ends)):
+        idx = np.arange(0, end - start, stride)
+        if idx[-1] != end - start - 1:
+            idx = np.append(idx, end - start - 1)
+        if len(idx) < 2:
+            continue
+        # Fit relative to the first sample to keep float64 precision
+        slope, offset = np.polyfit(idx, times[start + idx] - times[start], 1)
+        slopes[k] = slope
+        intercepts[k] = times[start] + offset
+    return starts, slopes, intercepts
+
+
+def events_to_samples(event_times, times: np.ndarray, sfreq: float, clock=None) -> np.ndarray:
+    """
+    Map event timestamps to sample indices using the recorded LSL timestamps.
+
+    Without `clock` every event goes to the sample with the nearest timestamp
+    (one searchsorted over all events). With a `fit_clock` result the events
+    are placed on the fitted clock of their segment instead, which removes
+    per-chunk jitter and follows slow clock drift. Either way the cost is
+    O(n_events * log(n_samples)).
+
+    Args:
+        event_times: Event timestamps, in the same clock as `times`.
+        times: Sample timestamps of shape (n_samples,), increasing.
+        sfreq: Nominal sampling rate.
+        clock: Optional (starts, slopes, intercepts) from `fit_clock`.
+
+    Returns:
+        Sample index per event, -1 for events outside the recording.
+    """
+    event_times = np.asarray(event_times, dtype=np.float64)
+    n = len(times)
+    if n == 0:
+        return np.full(len(event_times), -1, dtype=np.int64)
+
+    if clock is not None:
+        starts, slopes, intercepts = clock
+        ends = np.append(starts[1:], n)
+        seg = np.clip(np.searchsorted(times[starts], event_times, side='right') - 1, 0, len(starts) - 1)
+        local = np.rint((event_times - intercepts[seg]) / slopes[seg]).astype(np.int64)
+        samples = starts[seg] + np.clip(local, 0, ends[seg] - starts[seg] - 1)
+    else:
+        right = np.clip(np.searchsorted(times, event_times), 0, n - 1)
+        left = np.clip(right - 1, 0, n - 1)
+        closer_left = np.abs(event_times - times[left]) <= np.abs(times[right] - event_times)
+        samples = np.where(closer_left, left, right).astype(np.int64)
+
+    # Events more than half a sample outside the recording are dropped
+    half = 0.5 / sfreq
+    outside = (event_times < times[0] - half) | (event_times > times[-1] + half)
+    samples[outside] = -1
+    return samples
@@ -0,0 +1,140 @@
+import time
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+from .classifier import CSPSVMClassifier
+
+
+def make_pipeline(n_components: int = 4, seed=None):
+    """Unfitted CSP + SVM pipeline, the structure of the bundled model."""
+    from mne.decoding import CSP
+    from sklearn.pipeline import Pipeline
+    from sklearn.svm import SVC
+    return Pipeline([('csp', CSP(n_components=n_components)), ('svm', SVC(probability=True, random_state=seed))])
+
+
+def _import_fit_dependencies():
+    # Run once in the worker process, so the first fit does not pay for the imports
+    make_pipeline()
+
+
+def fit_model(epochs: np.ndarray, labels: np.ndarray, n_components: int = 4, seed=None) -> dict:
+    """
+    Fit CSP + SVM on filtered epochs. Runs in the worker process.
+
+    Args:
+        epochs: (n_trials, n_channels, n_samples) at the classifier's sampling rate.
+        labels: Marker id of the cued task of every trial.
+
+    Returns:
+        dict with the fitted model, its cross-validated accuracy (NaN when a
+        class has fewer than 2 trials) and the fit time in seconds.
+    """
+    import mne
+    from sklearn.model_selection import StratifiedKFold, cross_val_score
+    mne.set_log_level("WARNING")
+    t0 = time.perf_counter()
+    model = make_pipeline(n_components, seed)
+    cv_accuracy = float('nan')
+    folds = min(5, int(np.min(np.unique(labels, return_counts=True)[1])))
+    if folds >= 2:
+        cv = StratifiedKFold(folds, shuffle=True, random_state=seed)
+        cv_accuracy = float(np.mean(cross_val_score(model, epochs, labels, cv=cv)))
+    model.fit(epochs, labels)
+    return {'model': model, 'cv_accuracy': cv_accuracy, 'fit_s': time.perf_counter() - t0}
+
+
+class Calibrator(QObject):
+    """
+    In-session calibration of a CSP + SVM model.
+
+    The session hands over the filtered decision window of every trial with
+    its cued task; once `min_trials` trials (of at least two tasks) are in, a
+    model is fitted on them in the background worker, and refitted on all
+    trials so far every `refit_every` new ones. Each fitted model comes back
+    through `model_ready` on the GUI thread, numbered from 1, for the session
+    to swap in.
+
+    The windows are cut from the session's online preprocessor, i.e. they are
+    exactly what the fitted model classifies live, and nothing is filtered
+    again for training. The worker process is started, and its imports done,
+    when calibration starts, so a refit on a few dozen trials takes about a
+    second.
+    """
+
+    # Fitted model: dict with version, model, n_epochs, cv_accuracy, fit_s and wait_s
+    model_ready = pyqtSignal(object)
+
+    def __init__(self, worker, min_trials: int, refit_every: int = 0, n_components: int = 4, seed=None):
+        super().__init__()
+        # Preprocessing and window length of the models to be fitted
+        self.template = CSPSVMClassifier(model=make_pipeline(n_components, seed), filter_mode="causal")
+        self.worker = worker
+        self.worker.result_ready.connect(self._on_fit_done)
+        self.min_trials = min_trials
+        self.refit_every = refit_every
+        self.n_components = n_components
+        self.seed = seed
+        self.epochs = [] # (n_channels, target_samples) per trial
+        self.labels = [] # Marker id of every trial's cued task
+        self.versions = [] # Fitted models, as emitted by model_ready
+        self.fitted_epochs = 0 # Trials used by the latest successful fit
+        self.pending = None # Request id of the running fit
+        self.pending_epochs = 0 # and the trials it was given
+
+    def start(self):
+        """Forget collected trials and fitted models, and get the worker process ready."""
+        self.epochs = []
+        self.labels = []
+        self.versions = []
+        self.fitted_epochs = 0
+        self.pending = None
+        self.pending_epochs = 0
+        self.worker.submit(_import_fit_dependencies)
+
+    def shutdown(self):
+        self.pending = None
+        self.worker.shutdown()
+
+    def add_epoch(self, window: np.ndarray, label: int):
+        """Filtered window of a trial, (n_channels, >= target_samples), with its cued task's marker."""
+        n = self.template.target_samples
+        window = np.asarray(window)
+        if window.ndim != 2 or window.shape[-1] < n:
+            print(f"Warning: calibration window shape {window.shape}, need {n} samples")
+            return
+        self.epochs.append(np.array(window[:, -n:], dtype=np.float64))
+        self.labels.append(label)
+        self._maybe_fit()
+
+    def training_data(self):
+        """(epochs, labels) of all trials collected so far."""
+        if not self.epochs:
+            return np.zeros((0, 0, 0)), np.zeros(0, dtype=int)
+        return np.stack(self.epochs), np.array(self.labels)
+
+    def _maybe_fit(self):
+        if self.pending is not None or len(self.epochs) < self.min_trials or len(set(self.labels)) < 2:
+            return
+        if self.fitted_epochs and (not self.refit_every or len(self.epochs) - self.fitted_epochs < self.refit_every):
+            return
+        epochs, labels = self.training_data()
+        self.pending_epochs = len(labels)
+        self.pending = self.worker.submit(fit_model, epochs, labels, self.n_components, self.seed)
+
+    def _on_fit_done(self, request_id, result, elapsed):
+        if request_id != self.pending:
+            return # The warm-up job, or a fit from before start()
+        self.pending = None
+        if result is None:
+            # The trials it was given do not count as fitted, the next trial retries
+            print("Calibration fit failed, keeping the current classifier")
+            return
+        self.fitted_epochs = self.pending_epochs
+        version = dict(result, version=len(self.versions) + 1, n_epochs=self.fitted_epochs, wait_s=elapsed)
+        self.versions.append(version)
+        print(f"Calibration model v{version['version']}: {version['n_epochs']} trials, "
+              f"cross-validated accuracy {version['cv_accuracy']:.2f}, fitted in {version['fit_s']:.2f} s "
+              f"({elapsed:.2f} s after submission)")
+        self.model_ready.emit(version)
+        # Trials that came in during the fit may already warrant the next one
+        self._maybe_fit()
@@ -1,13 +1,39 @@
 from abc import ABC, abstractmethod
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from ..config import TaskType, ExperimentConfig
 import numpy as np
 import joblib
-from scipy import signal
 import os
+from .preprocessing import Preprocessor, OnlinePreprocessor
+from .continuous import WindowModel, CSPWindowModel
+from .metrics import metrics
+
+# How a model's training data was filtered: "zero-phase" (Preprocessor, offline) or
+# "causal" (OnlinePreprocessor, e.g. in-session calibration). A model must be fed the same
+FILTER_MODES = ("zero-phase", "causal")
 
 class BaseClassifier(ABC):
+    # TaskType of every column of the probabilities returned by predict_batch
+    classes = [TaskType.RELAX, TaskType.LEFT_HAND, TaskType.RIGHT_HAND, TaskType.BOTH_HANDS, TaskType.FEET]
+
     @abstractmethod
+    def predict_batch(self, windows, true_labels):
+        """
+        Predict the classes of several windows in one pass.
+        
+        Args:
+            windows: The EEG data, numpy array of shape (n_trials, n_channels, n_samples).
+            true_labels: The actual task type of every window (for mock behavior).
+            
+        Returns:
+            (labels, probabilities): list of n_trials TaskType and an array of
+            shape (n_trials, len(classes)), NaN where no probability is known.
+        """
+        pass
+
     def predict(self, data, true_label: TaskType) -> TaskType:
         """
         Predict the class for the given data.
@@ -19,18 +45,59 @@ class BaseClassifier(ABC):
         Returns:
             The predicted TaskType.
         """
-        pass
+        labels, _ = self.predict_batch(np.asarray(data)[np.newaxis], [true_label])
+        return labels[0]
+
+    def make_online_preprocessor(self):
+        """
+        Return an OnlinePreprocessor to be fed from the acquisition loop, or
+        None if the classifier works on raw data (see predict_preprocessed_batch).
+        """
+        return None
+
+    def predict_preprocessed_batch(self, windows, true_labels):
+        """
+        Same as predict_batch, for data already filtered by make_online_preprocessor().
+        Classifiers that return a preprocessor override it; without one there
+        is no preprocessing, and the windows are the raw data predict_batch takes.
+        """
+        return self.predict_batch(windows, true_labels)
+
+    def warm_up(self):
+        """
+        Run a throwaway prediction so the first real one does not pay for
+        lazy imports, allocations and caches. Nothing to do by default.
+        """
+
+    def make_window_model(self, window_samples: int, preprocessed: bool):
+        """
+        Model for continuous decoding, fed the new samples of every hop (see
+        continuous.py). The default keeps the window and calls
+        predict_batch/predict_preprocessed_batch on it.
+        """
+        return WindowModel(self, window_samples, preprocessed)
+
+    def _error_batch(self, n_trials):
+        return [TaskType.ERROR] * n_trials, np.full((n_trials, len(self.classes)), np.nan)
 
 class MockClassifier(BaseClassifier):
-    def __init__(self, accuracy=0.5):
+    def __init__(self, accuracy=0.5, seed=None):
         """
         Args:
             accuracy (float): Probability of correct classification (0.0 to 1.0).
+            seed: Seed of the classifier's own random generator, for reproducible runs.
         """
         self.accuracy = accuracy
+        self.rng = random.Random(seed)
         
-    def predict(self, data, true_label: TaskType) -> TaskType:
-        if random.random() < self.accuracy:
+    def predict_batch(self, windows, true_labels):
+        labels = [self._predict_one(true_label) for true_label in true_labels]
+        # All the mass on the drawn label
+        probabilities = np.array([[1.0 if c == label else 0.0 for c in self.classes] for label in labels])
+        return labels, probabilities.reshape(len(labels), len(self.classes))
+
+    def _predict_one(self, true_label: TaskType) -> TaskType:
+        if self.rng.random() < self.accuracy:
             return true_label
         else:
             # Return a random WRONG label
@@ -43,12 +110,24 @@ class MockClassifier(BaseClassifier):
             if not wrong_choices:
                  # Should not happen if >1 tasks
                 return true_label
-            return random.choice(wrong_choices)
+            return self.rng.choice(wrong_choices)
 
 
 class CSPSVMClassifier(BaseClassifier):
-    def __init__(self, model_path: str = None):
-        if model_path is None:
+    def __init__(self, model_path: str = None, model=None, filter_mode: str = "zero-phase"):
+        """
+        Args:
+            model_path: Pickled model to load (the bundled one by default).
+            model: Already loaded (e.g. freshly calibrated) model to use instead of loading one.
+            filter_mode: How the model's training data was filtered, one of
+                FILTER_MODES; raw windows are filtered the same way.
+        """
+        if filter_mode not in FILTER_MODES:
+            raise ValueError(f"Unknown filter mode: {filter_mode}")
+        self.filter_mode = filter_mode
+        if model is not None:
+            self.model_path = None
+        elif model_path is None:
             self.model_path = os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'csp_svm_mati_model.pkl')
         else:
             self.model_path = model_path
@@ -58,9 +137,16 @@ class CSPSVMClassifier(BaseClassifier):
         self.device_sampling_rate: int = self.config.sampling_rate
         self.target_time: int = 5
         self.target_samples: int = self.classifier_sampling_rate * self.target_time
-        self.filter_samples: int = self.device_sampling_rate * self.target_time * 10
         self.lowcut: int = 8
         self.highcut: int = 32
+        # Filters are designed once here instead of on every prediction
+        self.preprocessor = Preprocessor(self.device_sampling_rate, self.classifier_sampling_rate,
+                                         self.lowcut, self.highcut, channels=slice(1, 17))
+        # The zero-phase window ends this many filtered samples before the newest one, where
+        # the output depends on edge handling (see Preprocessor); a causal filter has no such edge
+        self.edge_samples: int = self.preprocessor.edge_samples if filter_mode == "zero-phase" else 0
+        # Raw samples the preprocessing consumes: the window, its edge and the filters' settling time
+        self.filter_samples: int = self.preprocessor.input_samples(self.target_samples + self.edge_samples)
 
         self.mapping = {
             1: TaskType.RELAX,
@@ -70,64 +156,238 @@ class CSPSVMClassifier(BaseClassifier):
             5: TaskType.FEET
         }
 
+        if model is not None:
+            self.model = model
+            return
         try:
             self.model = joblib.load(self.model_path)
         except Exception as e:
             print(f"Failed to load model from {self.model_path}: {e}")
             raise
 
+    def preprocessing_signature(self) -> str:
+        """What the model's input must have gone through, models trained otherwise do not fit this classifier."""
+        channels = self.preprocessor.channels
+        return (f"resample {self.device_sampling_rate}->{self.classifier_sampling_rate} Hz, notch 50 Hz, "
+                f"band-pass {self.lowcut}-{self.highcut} Hz, channels {channels.start}-{channels.stop - 1}, "
+                f"{self.filter_mode}")
+
+    def metadata(self) -> dict:
+        """Description of the loaded model as indexed by the model registry."""
+        channels = self.preprocessor.channels
+        return {
+            'classes': [self.mapping.get(c, TaskType.ERROR).name for c in getattr(self.model, 'classes_', [])],
+            'sfreq': self.classifier_sampling_rate,
+            'device_sfreq': self.device_sampling_rate,
+            'channels': list(range(channels.start, channels.stop)),
+            'window_samples': self.target_samples,
+            'filter_mode': self.filter_mode,
+            'preprocessing': self.preprocessing_signature(),
+        }
+
+    def warm_up(self):
+        # A seeded noise window through the raw path: filters, CSP and SVM
+        rng = np.random.default_rng(0)
+        window = rng.standard_normal((1, self.preprocessor.channels.stop, self.filter_samples)) * 1e-5
+        self.predict_batch(window, [TaskType.RELAX])
+
     def _preprocess(self, data: np.ndarray) -> np.ndarray:
         """
-        Apply 50Hz notch filter and 8-32Hz bandpass filter.
+        Resample to 256 Hz, apply 50Hz notch filter and 8-32Hz bandpass filter,
+        zero-phase or causally as the model was trained (filter_mode).
         
         Args:
-            data: EEG data of shape (n_channels, n_samples)
-            fs: Sampling frequency
+            data: EEG data of shape (..., n_channels, n_samples)
             
         Returns:
             Filtered data
         """
         # Pick channels A1-16 and only recent samples
         # 0: trigger, 1: A1, 2: A2, ... 16: A16 
-        data = data[1:17, -self.filter_samples:]
-
-        # Resample to target samples
-        data_seconds = data.shape[1] / self.device_sampling_rate
-        target_samples = int(data_seconds * self.classifier_sampling_rate)
-        data = signal.resample(data, target_samples, axis=1)
-
-        # Notch filter at 50Hz
-        # Quality factor Q = 30
-        b_notch, a_notch = signal.iirnotch(50.0, 30.0, self.classifier_sampling_rate)
-        data_notch = signal.filtfilt(b_notch, a_notch, data, axis=-1)
-
-        # Bandpass filter
-        # Using butterworth filter
-        nyquist = 0.5 * self.classifier_sampling_rate
-        low = self.lowcut / nyquist
-        high = self.highcut / nyquist
-        b_band, a_band = signal.butter(5, [low, high], btype='band')
-        data_filtered = signal.filtfilt(b_band, a_band, data_notch, axis=-1)
-        
-        return data_filtered
+        data = data[..., -self.filter_samples:]
+        if self.filter_mode == "causal":
+            # The filter the model was trained behind, run over each window from its start
+            return np.stack([self._filter_causal(window) for window in data.reshape(-1, *data.shape[-2:])]
+                            ).reshape(*data.shape[:-2], -1, self.target_samples)
+        filtered = self.preprocessor(data, n_out=self.target_samples + self.edge_samples)
+        return filtered[..., :filtered.shape[-1] - self.edge_samples]
 
-    def predict(self, data: np.ndarray, true_label: TaskType) -> TaskType:
-        n_samples = data.shape[1]
+    def _filter_causal(self, window: np.ndarray) -> np.ndarray:
+        online = self.make_online_preprocessor()
+        online.process(window.T, np.arange(window.shape[-1], dtype=np.float64))
+        return online.latest(self.target_samples)
+
+    def make_online_preprocessor(self) -> OnlinePreprocessor:
+        return OnlinePreprocessor(self.device_sampling_rate, self.classifier_sampling_rate,
+                                  self.lowcut, self.highcut, channels=slice(1, 17))
+
+    def predict_batch(self, windows: np.ndarray, true_labels):
+        windows = np.asarray(windows)
         
-        if n_samples < self.filter_samples:
-            print(f"Warning: data length {n_samples} < {self.filter_samples}")
-            return TaskType.ERROR
+        data_filtered = self.preprocess_batch(windows)
+        if data_filtered is None:
+            return self._error_batch(len(windows))
+        return self.predict_preprocessed_batch(data_filtered, true_labels)
+
+    def preprocess_batch(self, windows: np.ndarray):
+        """Raw windows filtered as predict_batch does, for predict_preprocessed_batch; None if too short."""
+        windows = np.asarray(windows)
+        if windows.ndim != 3 or windows.shape[-1] < self.filter_samples:
+            print(f"Warning: data shape {windows.shape}, need {self.filter_samples} samples")
+            return None
+        return self._preprocess(windows)
 
-        data_filtered = self._preprocess(data)
-        X = data_filtered[np.newaxis, :, -self.target_samples:] # (1, ch, time)
+    def predict_preprocessed_batch(self, windows: np.ndarray, true_labels):
+        """
+        Args:
+            windows: Filtered data of shape (n_trials, 16, n_samples) at
+                classifier_sampling_rate, at least target_samples long.
+        """
+        windows = np.asarray(windows)
+        if windows.ndim != 3 or windows.shape[-1] < self.target_samples:
+            print(f"Warning: filtered data shape {windows.shape}, need {self.target_samples} samples")
+            return self._error_batch(len(windows))
+
+        X = windows[:, :, -self.target_samples:] # (n_trials, ch, time)
         
         try:
-            prediction = self.model.predict(X)[0] # Returns class ID (e.g. 7)
+            class_ids, probs = self._predict_with_proba(X)
+        except Exception as e:
+            print(f"Prediction error: {e}")
+            return self._error_batch(len(X))
+        return self._to_tasks(class_ids, probs)
+
+    def _to_tasks(self, class_ids, probs):
+        """Model class ids -> TaskType, probability columns from model.classes_ to self.classes."""
+        probabilities = np.full((len(class_ids), len(self.classes)), np.nan)
+        for column, class_id in enumerate(self.model.classes_):
+            task = self.mapping.get(class_id)
+            if task in self.classes:
+                probabilities[:, self.classes.index(task)] = probs[:, column]
+        return [self.mapping.get(c, TaskType.ERROR) for c in class_ids], probabilities
+
+    def make_window_model(self, window_samples: int, preprocessed: bool):
+        # CSP features can be kept up to date sample by sample, on filtered data only
+        if preprocessed and CSPWindowModel.supports(self.model):
+            return CSPWindowModel(self, window_samples)
+        if not preprocessed:
+            window_samples = max(window_samples, self.filter_samples)
+        return WindowModel(self, window_samples, preprocessed)
+
+    def _predict_with_proba(self, X: np.ndarray):
+        """
+        Class ids and predict_proba of the model, transforming X only once.
+        For a Pipeline the transform steps (CSP) run once and both predictions
+        are taken from the final estimator, so the labels stay identical to
+        model.predict (for an SVM they can differ from argmax(predict_proba)).
+        """
+        with metrics.timer("classifier.inference_ms"):
+            if hasattr(self.model, 'steps') and len(self.model.steps) > 1:
+                features = self.model[:-1].transform(X)
+                final = self.model.steps[-1][1]
+                return final.predict(features), final.predict_proba(features)
             probs = self.model.predict_proba(X)
-            print(probs)
+            return self.model.classes_[np.argmax(probs, axis=1)], probs
 
 
-            return self.mapping[prediction]
-        except Exception as e:
-            print(f"Prediction error: {e}")
-            return TaskType.ERROR
+class ShadowClassifier(BaseClassifier):
+    """
+    A primary classifier, whose predictions are returned (and drive the
+    feedback), plus shadow classifiers evaluated on exactly the same windows
+    for comparison only.
+
+    Raw windows are filtered once, by the primary, and every model gets the
+    same filtered array, so a shadow model costs only its inference (shadows
+    must therefore apply the primary's preprocessing). The shadows are
+    submitted to their own thread pool after the primary has predicted, so
+    they never delay its result. Their results come back as futures, which
+    take_shadows() hands to the caller on the thread that made the prediction.
+    """
+
+    def __init__(self, primary: BaseClassifier, shadows: dict):
+        """
+        Args:
+            primary: Classifier whose predictions are used.
+            shadows: name -> classifier of the models evaluated alongside.
+        """
+        signature = getattr(primary, 'preprocessing_signature', None)
+        for name, shadow in shadows.items():
+            other = getattr(shadow, 'preprocessing_signature', None)
+            if signature is not None and other is not None and other() != signature():
+                raise ValueError(f"Shadow model {name} expects \"{other()}\", the primary provides \"{signature()}\"")
+        self.primary = primary
+        self.shadows = dict(shadows)
+        self.executor = None
+        self.local = threading.local() # Futures of the latest prediction of every thread
+
+    def __getattr__(self, name):
+        # Window lengths, metadata etc. are the primary's
+        if name == 'primary':
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    @property
+    def classes(self):
+        return self.primary.classes
+
+    def make_online_preprocessor(self):
+        return self.primary.make_online_preprocessor()
+
+    def make_window_model(self, window_samples: int, preprocessed: bool):
+        # Continuous decoding runs the primary only
+        return self.primary.make_window_model(window_samples, preprocessed)
+
+    def warm_up(self):
+        self.primary.warm_up()
+        for shadow in self.shadows.values():
+            shadow.warm_up()
+
+    def predict_batch(self, windows, true_labels):
+        preprocess = getattr(self.primary, 'preprocess_batch', None)
+        if preprocess is None:
+            # Nothing to share, every model gets the raw windows
+            result = self.primary.predict_batch(windows, true_labels)
+            self._submit_shadows('predict_batch', windows, true_labels)
+            return result
+        filtered = preprocess(windows)
+        if filtered is None:
+            self.local.futures = {}
+            return self._error_batch(len(windows))
+        return self.predict_preprocessed_batch(filtered, true_labels)
+
+    def predict_preprocessed_batch(self, windows, true_labels):
+        result = self.primary.predict_preprocessed_batch(windows, true_labels)
+        self._submit_shadows('predict_preprocessed_batch', windows, true_labels)
+        return result
+
+    def take_shadows(self) -> dict:
+        """
+        name -> Future of the shadow predictions started by this thread's
+        latest predict call, each resolving to (labels, probabilities,
+        inference seconds), or raising what the shadow raised.
+        """
+        futures = getattr(self.local, 'futures', {})
+        self.local.futures = {}
+        return futures
+
+    def shutdown(self, wait: bool = True):
+        """Finish (or with wait=False drop) the shadow predictions still running."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
+            self.executor = None
+
+    def _submit_shadows(self, method, windows, true_labels):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.shadows)), thread_name_prefix="shadow")
+        t0 = time.perf_counter()
+        self.local.futures = {name: self.executor.submit(self._run_shadow, name, getattr(shadow, method), windows, true_labels)
+                              for name, shadow in self.shadows.items()}
+        metrics.observe("shadow.submit_ms", (time.perf_counter() - t0) * 1e3)
+
+    @staticmethod
+    def _run_shadow(name, predict, windows, true_labels):
+        t0 = time.perf_counter()
+        labels, probabilities = predict(windows, true_labels)
+        elapsed = time.perf_counter() - t0
+        metrics.observe(f"shadow.{name}.inference_ms", elapsed * 1e3)
+        return labels, probabilities, elapsed
@@ -0,0 +1,85 @@
+import threading
+import numpy as np
+from pylsl import local_clock
+
+
+class ClockOffsetTracker:
+    """
+    Tracks the offset between the local LSL clock and a stream's clock.
+
+    `inlet.time_correction()` is sampled every `interval` seconds on a
+    background thread. A line offset(t) = a + b * t is fitted to the last
+    `window` samples (outliers beyond 3 MAD removed), so both measurement noise
+    and slow drift are followed. The fitted model is swapped in as one tuple,
+    which makes `to_stream_time` a constant-time, lock-free call.
+
+    Every raw sample is kept in `samples` so recordings can be re-aligned later.
+    """
+
+    def __init__(self, inlet, interval: float = 5.0, window: int = 24, timeout: float = 2.0):
+        self.inlet = inlet
+        self.interval = interval
+        self.window = window
+        self.timeout = timeout
+        self.samples = [] # List of (local_time, offset)
+        self.model = (0.0, 0.0, 0.0) # (t_ref, offset at t_ref, slope)
+        self.read_cursor = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Take a first (blocking) measurement and start periodic sampling."""
+        self._measure()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _sample_loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self._measure()
+            except Exception as e:
+                # Timeouts happen when the network hiccups, keep the last model
+                print(f"Clock offset measurement failed: {e}")
+
+    def _measure(self):
+        offset = self.inlet.time_correction(timeout=self.timeout)
+        self.samples.append((local_clock(), offset))
+        self._fit()
+
+    def _fit(self):
+        recent = np.array(self.samples[-self.window:])
+        t, offset = recent[:, 0], recent[:, 1]
+        t_ref = t[-1]
+        if len(recent) < 3:
+            self.model = (t_ref, float(np.median(offset)), 0.0)
+            return
+
+        slope, intercept = np.polyfit(t - t_ref, offset, 1)
+        residuals = offset - (intercept + slope * (t - t_ref))
+        mad = np.median(np.abs(residuals - np.median(residuals)))
+        inliers = np.abs(residuals) <= 3 * 1.4826 * mad
+        if 3 <= inliers.sum() < len(recent):
+            slope, intercept = np.polyfit(t[inliers] - t_ref, offset[inliers], 1)
+        self.model = (t_ref, float(intercept), float(slope))
+
+    def offset_at(self, local_ts: float) -> float:
+        """Offset to add to a stream timestamp to get local time, at local time local_ts."""
+        t_ref, offset, slope = self.model
+        return offset + slope * (local_ts - t_ref)
+
+    def to_stream_time(self, local_ts: float) -> float:
+        """Convert a local_clock() timestamp into the stream's clock."""
+        return local_ts - self.offset_at(local_ts)
+
+    def get_samples(self):
+        """Return offset samples measured since the previous call."""
+        samples = self.samples[self.read_cursor:]
+        self.read_cursor += len(samples)
+        return samples
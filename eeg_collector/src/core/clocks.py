@@ -0,0 +1,101 @@
+import time
+from pylsl import local_clock
+
+
+class WallClock:
+    """
+    The real LSL clock. ExperimentSession reads the time and converts timer
+    durations through a clock object, so a replay can substitute a VirtualClock.
+    """
+
+    def now(self) -> float:
+        return local_clock()
+
+    def to_wall_ms(self, seconds: float) -> int:
+        """Timer interval, in real milliseconds, for `seconds` on this clock."""
+        return max(0, int(round(seconds * 1000)))
+
+    def timer_interval(self, seconds: float) -> int:
+        """Like to_wall_ms, for the timer that drives the trial states."""
+        return self.to_wall_ms(seconds)
+
+    def timer_expired(self):
+        """Called when the trial timer started with timer_interval fires."""
+        pass
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+
+class VirtualClock(WallClock):
+    """
+    A clock running `speed` times faster than real time, starting at `start`.
+
+    Timer intervals are divided by `speed`, so Qt timers fire on the virtual
+    timeline. Two things keep that timeline exact even when the event loop
+    stalls (which at 50x turns a 20 ms hiccup into a second):
+
+    - Virtual time never passes the deadline of the pending trial timer
+      (timer_interval); when the timer fires the clock is set to exactly that
+      deadline, so every state change happens at its nominal virtual time.
+    - While paused (e.g. during classification) virtual time stands still,
+      which makes replay results independent of how fast the machine is.
+    """
+
+    def __init__(self, speed: float = 50.0, start: float = 0.0):
+        self.speed = float(speed)
+        self.start_time = float(start)
+        self.base = self.start_time # Virtual time at wall_start
+        self.wall_start = None # perf_counter() when base was taken, None while stopped
+        self.pause_depth = 0
+        self.barrier = None # Deadline of the pending trial timer
+
+    def start(self):
+        self.base = self.start_time
+        self.pause_depth = 0
+        self.barrier = None
+        self.wall_start = time.perf_counter()
+
+    def _free_running(self) -> float:
+        if self.wall_start is None:
+            return self.base
+        return self.base + (time.perf_counter() - self.wall_start) * self.speed
+
+    def _rebase(self, virtual_time: float, running: bool):
+        self.base = virtual_time
+        self.wall_start = time.perf_counter() if running else None
+
+    def now(self) -> float:
+        t = self._free_running()
+        return t if self.barrier is None else min(t, self.barrier)
+
+    def to_wall_ms(self, seconds: float) -> int:
+        return max(0, int(round(seconds * 1000 / self.speed)))
+
+    def timer_interval(self, seconds: float) -> int:
+        now = self.now()
+        self._rebase(now, self.wall_start is not None)
+        self.barrier = now + max(0.0, seconds)
+        return self.to_wall_ms(seconds)
+
+    def timer_expired(self):
+        if self.barrier is None:
+            return
+        # Late (stalled) or early (timer resolution): either way, exactly on time
+        self._rebase(max(self.barrier, self.base), self.wall_start is not None)
+        self.barrier = None
+
+    def pause(self):
+        if self.pause_depth == 0 and self.wall_start is not None:
+            self._rebase(self.now(), running=False)
+        self.pause_depth += 1
+
+    def resume(self):
+        if self.pause_depth == 0:
+            return
+        self.pause_depth -= 1
+        if self.pause_depth == 0:
+            self._rebase(self.base, running=True)
@@ -0,0 +1,208 @@
+import time
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+from pylsl import StreamInfo, StreamOutlet
+from .ring_buffer import HistoryBuffer
+from .csp_features import CSPFeatureEngine
+from .metrics import metrics, Histogram
+
+
+class WindowModel:
+    """
+    Keeps the newest `window_samples` samples and runs the classifier on the
+    whole window at every prediction. Works with any classifier.
+    """
+
+    def __init__(self, classifier, window_samples: int, preprocessed: bool):
+        self.classifier = classifier
+        self.window_samples = int(window_samples)
+        self.predict_batch = classifier.predict_preprocessed_batch if preprocessed else classifier.predict_batch
+        self.history = None
+
+    def _append(self, data: np.ndarray, timestamps: np.ndarray):
+        if self.history is None:
+            self.history = HistoryBuffer(self.window_samples, data.shape[0])
+        self.history.append(data.T, timestamps)
+
+    def update(self, data: np.ndarray, timestamps: np.ndarray):
+        """New samples of shape (n_channels, n_samples)."""
+        self._append(data, timestamps)
+
+    def ready(self) -> bool:
+        return self.history is not None and len(self.history) >= self.window_samples
+
+    def predict(self, true_label):
+        """(TaskType, probabilities) of the current window."""
+        labels, probabilities = self.predict_batch(self.history.latest(self.window_samples)[np.newaxis], [true_label])
+        return labels[0], probabilities[0]
+
+
+class CSPWindowModel:
+    """
+    Pipeline of CSP (log band power) and a classifier, decoded incrementally
+    with a CSPFeatureEngine: a hop costs the CSP projection of its own
+    samples and one prediction of the steps after CSP, whatever the window
+    length.
+    """
+
+    supports = staticmethod(CSPFeatureEngine.supports)
+
+    def __init__(self, classifier, window_samples: int):
+        self.classifier = classifier
+        self.engine = CSPFeatureEngine(classifier.model, window_samples)
+
+    def update(self, data: np.ndarray, timestamps: np.ndarray):
+        self.engine.update(data)
+
+    def ready(self) -> bool:
+        return self.engine.ready()
+
+    def predict(self, true_label):
+        with metrics.timer("classifier.inference_ms"):
+            class_ids, probs = self.engine.predict(self.engine.features()[np.newaxis])
+        labels, probabilities = self.classifier._to_tasks(class_ids, probs)
+        return labels[0], probabilities[0]
+
+
+class ContinuousDecoder(QObject):
+    """
+    Sliding-window decoding for neurofeedback and asynchronous control.
+
+    Every `hop` seconds the samples that arrived since the previous hop are
+    read from an existing HistoryBuffer (the session's online preprocessor,
+    or the logger's raw history, so nothing is filtered twice), passed to the
+    classifier's window model (see BaseClassifier.make_window_model), and a
+    prediction over the last `window` seconds is emitted through
+    `prediction_ready` and, with `outlet_name`, pushed to an LSL outlet.
+
+    Hops are timed: `decoder.hop_ms` is the compute time of a hop (polling
+    included), `decoder.predict_ms` the window model's share of it,
+    `decoder.latency_ms` the age of the newest sample when its prediction is
+    emitted and `decoder.hop_late_ms` how much longer than `hop` the timer
+    took to fire. A hop that ends after the next one was due counts as a
+    missed deadline.
+    """
+
+    # Stream timestamp of the newest sample in the window, predicted class name, probabilities
+    prediction_ready = pyqtSignal(float, str, object)
+
+    def __init__(self, classifier, source, scheduler, window: float = 5.0, hop: float = 0.125,
+                 preprocessed: bool = True, poll=None, stream_time=None, true_label=None, outlet_name=None):
+        """
+        Args:
+            source: Callable returning the HistoryBuffer to decode from (None until data arrives).
+            scheduler: Provides the hop timer and the clock.
+            preprocessed: The source holds data filtered by the classifier's online preprocessor.
+            poll: Called at the start of every hop, to drain newly acquired samples into the source.
+            stream_time: Callable returning the current time on the stream's clock.
+            true_label: Callable returning the TaskType passed to the classifier (for mock behavior).
+            outlet_name: Name of the LSL stream the predictions are pushed to, None for no outlet.
+        """
+        super().__init__()
+        self.classifier = classifier
+        self.source = source
+        self.scheduler = scheduler
+        self.clock = scheduler.clock
+        self.window = window
+        self.hop = hop
+        self.preprocessed = preprocessed
+        self.poll = poll
+        self.stream_time = stream_time
+        self.true_label = true_label if true_label is not None else (lambda: None)
+        self.outlet_name = outlet_name
+        self.outlet = None
+        self.timer = scheduler.timer(self._on_hop)
+
+        self.model = None
+        self.window_samples = 0
+        self.history = None # Source buffer being read and the position reached in it
+        self.position = 0
+        self.newest = None # Timestamp of the newest sample passed to the model
+        self.last_hop = 0.0 # Clock time the previous hop fired (or decoding started)
+        self.hops = 0
+        self.missed_deadlines = 0
+        self.hop_ms = Histogram()
+
+    def start(self, sfreq: float):
+        """Start decoding windows of data sampled at `sfreq` (that of the source)."""
+        self.window_samples = int(round(self.window * sfreq))
+        self.model = self.classifier.make_window_model(self.window_samples, self.preprocessed)
+        self.history = None
+        self.position = 0
+        self.newest = None
+        self.hops = 0
+        self.missed_deadlines = 0
+        self.hop_ms = Histogram()
+        if self.outlet_name and self.outlet is None:
+            self.outlet = self._make_outlet()
+        self.last_hop = self.clock.now()
+        self.timer.start(self.hop)
+
+    def set_classifier(self, classifier):
+        """Decode with another classifier from the next hop on, its window refilled from the source's history."""
+        self.classifier = classifier
+        if self.model is not None:
+            self.model = classifier.make_window_model(self.window_samples, self.preprocessed)
+            self.history = None
+
+    def stop(self):
+        if not self.timer.isActive():
+            return
+        self.timer.stop()
+        summary = self.hop_ms.summary()
+        if self.hops:
+            print(f"Continuous decoding: {self.hops} hops of {self.hop*1000:.0f} ms, compute p50 "
+                  f"{summary['p50']:.2f} ms, p99 {summary['p99']:.2f} ms, {self.missed_deadlines} missed deadlines")
+
+    def _make_outlet(self):
+        classes = self.classifier.classes
+        info = StreamInfo(self.outlet_name, 'Classifier', len(classes) + 1, 1.0 / self.hop, 'float32',
+                          f"{self.outlet_name}_decoder")
+        channels = info.desc().append_child("channels")
+        for label in ["class"] + [f"prob_{task.name}" for task in classes]:
+            channels.append_child("channel").append_child_value("label", label)
+        return StreamOutlet(info)
+
+    def _read_new(self):
+        history = self.source()
+        if history is None:
+            return
+        if history is not self.history:
+            # First data, or the source started over
+            self.history = history
+            self.position = 0
+        data, timestamps, self.position = history.read_since(self.position)
+        if len(timestamps):
+            self.model.update(data, timestamps)
+            self.newest = timestamps[-1]
+
+    def _on_hop(self):
+        t0 = time.perf_counter()
+        now = self.clock.now()
+        # Delay on a hop after the previous one
+        late = max(0.0, now - self.last_hop - self.hop)
+        self.last_hop = now
+        if self.poll is not None:
+            self.poll()
+        t1 = time.perf_counter()
+        self._read_new()
+        if self.model.ready():
+            label, probabilities = self.model.predict(self.true_label())
+            metrics.observe("decoder.predict_ms", (time.perf_counter() - t1) * 1e3)
+            self.prediction_ready.emit(float(self.newest), label.name, probabilities)
+            if self.outlet is not None:
+                classes = self.classifier.classes
+                index = classes.index(label) if label in classes else -1
+                self.outlet.push_sample([float(index)] + [float(p) for p in probabilities])
+            if self.stream_time is not None and metrics.enabled:
+                metrics.observe("decoder.latency_ms", (self.stream_time() - self.newest) * 1e3)
+
+        elapsed = time.perf_counter() - t0
+        self.hops += 1
+        self.hop_ms.observe(elapsed * 1e3)
+        metrics.observe("decoder.hop_ms", elapsed * 1e3)
+        metrics.observe("decoder.hop_late_ms", late * 1e3)
+        if late + elapsed > self.hop:
+            # The next hop was due before this one was done
+            self.missed_deadlines += 1
+            metrics.increment("decoder.missed_deadlines")
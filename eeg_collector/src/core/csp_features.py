@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class CSPFeatureEngine:
+    """
+    CSP log band power features of a fitted pipeline, kept up to date over a
+    sliding window.
+
+    The spatial filters are taken from the pipeline's CSP step once. update()
+    projects only the new samples and keeps a running sum of their squares
+    over the last `window_samples` samples (adding what enters, subtracting
+    what leaves), so an update costs O(new samples) whatever the window
+    length. features() is log(sum / window_samples), what CSP.transform
+    computes on the same window. The sums are recomputed from the stored
+    squares once per window, so rounding errors cannot build up. predict()
+    runs only the pipeline steps after CSP, on the feature vector.
+    """
+
+    def __init__(self, model, window_samples: int):
+        if not self.supports(model):
+            raise ValueError("Model does not start with a CSP step producing log band power")
+        csp = model.steps[0][1]
+        self.filters = np.asarray(csp.filters_[:csp.n_components], dtype=np.float64)
+        self.rest = model[1:] # Everything after CSP, fed the features
+        self.window_samples = int(window_samples)
+        self.squares = np.zeros((len(self.filters), self.window_samples)) # Ring of squared projections
+        self.total = np.zeros(len(self.filters)) # Sum of squares over the ring
+        self.position = 0 # Samples seen so far
+        self.since_resum = 0
+
+    @staticmethod
+    def find_csp(model):
+        """Index of the pipeline step holding the CSP filters (filters_ and n_components), or None."""
+        for k, (_, step) in enumerate(getattr(model, 'steps', [])):
+            if hasattr(step, 'filters_') and hasattr(step, 'n_components'):
+                return k
+        return None
+
+    @classmethod
+    def supports(cls, model) -> bool:
+        """
+        True for a fitted Pipeline whose first step is an MNE CSP producing log
+        average power, followed by at least one step. Steps before CSP would
+        have to see the whole window, so they are not supported.
+        """
+        if cls.find_csp(model) != 0 or len(model.steps) < 2:
+            return False
+        csp = model.steps[0][1]
+        return (getattr(csp, 'transform_into', 'average_power') == 'average_power'
+                and getattr(csp, 'dec_type', 'single') == 'single'
+                and getattr(csp, 'log', None) in (None, True))
+
+    def reset(self):
+        self.squares[:] = 0.0
+        self.total[:] = 0.0
+        self.position = 0
+        self.since_resum = 0
+
+    def update(self, data: np.ndarray):
+        """Slide the window over new samples of shape (n_channels, n_samples)."""
+        n = data.shape[-1]
+        if n == 0:
+            return
+        if n > self.window_samples:
+            # Only the newest samples stay in the window
+            self.position += n - self.window_samples
+            data = data[:, -self.window_samples:]
+            n = self.window_samples
+        projected = self.filters @ data
+        squares = projected * projected
+
+        start = self.position % self.window_samples
+        first = min(n, self.window_samples - start)
+        for dst, src, k in ((start, 0, first), (0, first, n - first)):
+            if k == 0:
+                continue
+            # Not yet written slots hold zeros, subtracting them is harmless
+            self.total -= self.squares[:, dst:dst + k].sum(axis=1)
+            self.squares[:, dst:dst + k] = squares[:, src:src + k]
+            self.total += squares[:, src:src + k].sum(axis=1)
+        self.position += n
+
+        self.since_resum += n
+        if self.since_resum >= self.window_samples:
+            self.total = self.squares.sum(axis=1)
+            self.since_resum = 0
+
+    def ready(self) -> bool:
+        """The window has been filled once."""
+        return self.position >= self.window_samples
+
+    def features(self) -> np.ndarray:
+        """Log band power of every CSP component over the current window, shape (n_components,)."""
+        return np.log(self.total / self.window_samples)
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Features of whole windows (n_windows, n_channels, n_samples), as CSP.transform."""
+        projected = self.filters @ X
+        return np.log(np.mean(projected * projected, axis=-1))
+
+    def predict(self, features: np.ndarray):
+        """
+        Class ids and probabilities of the steps after CSP for features of
+        shape (n_windows, n_components), the final estimator predicting once.
+        """
+        if len(self.rest.steps) > 1:
+            features = self.rest[:-1].transform(features)
+        final = self.rest.steps[-1][1]
+        return final.predict(features), final.predict_proba(features)
@@ -2,155 +2,419 @@ import mne
 import numpy as np
 import pandas as pd
 from datetime import datetime
+import json
 import os
+import time
+from .sample_store import SampleStore
+from .ring_buffer import HistoryBuffer
+from .stream_writer import StreamWriter, read_spool, read_spool_clock
+from .alignment import find_gaps, fit_clock, events_to_samples
+from .metrics import metrics
+from .acquisition import is_marker_stream
+
+# LSL stream type -> MNE channel type of auxiliary streams
+AUX_CHANNEL_TYPES = {'EEG': 'eeg', 'EMG': 'emg', 'EOG': 'eog', 'ECG': 'ecg', 'GAZE': 'eyegaze'}
+
+
+def create_raw(data, times, events, info, drift_fit=True):
+    """
+    Build an MNE Raw object with event annotations.
+
+    Events are placed using the recorded LSL timestamps (see alignment.py),
+    and every dropped-sample gap is annotated as BAD_gap.
+
+    Args:
+        data: Samples of shape (n_channels, n_samples).
+        times: LSL timestamps of shape (n_samples,).
+        events: List of (timestamp, marker).
+        info: MNE info matching data.
+        drift_fit: Place events on a linear fit of the sample clock instead of
+            the raw (jittery) timestamps.
+    """
+    raw = mne.io.RawArray(data, info)
+    sfreq = info['sfreq']
+    
+    gap_samples, gap_durations = find_gaps(times, sfreq)
+    
+    onset = []
+    duration = []
+    description = []
+    
+    if events:
+        event_times = np.array([ts for ts, _ in events])
+        markers = np.array([marker for _, marker in events])
+        clock = fit_clock(times, sfreq, gap_samples) if drift_fit else None
+        samples = events_to_samples(event_times, times, sfreq, clock=clock)
+        
+        valid = samples >= 0 # Events before or after the recording are dropped
+        onset.extend(samples[valid] / sfreq)
+        duration.extend(np.zeros(valid.sum()))
+        description.extend(str(m) for m in markers[valid])
+        
+    if len(gap_samples):
+        print(f"Warning: {len(gap_samples)} gaps in recording, {gap_durations.sum():.3f} s of data missing")
+        # The missing samples are not in the data, so mark the sample where the gap is
+        onset.extend(gap_samples / sfreq)
+        duration.extend(np.full(len(gap_samples), 1.0 / sfreq))
+        description.extend(["BAD_gap"] * len(gap_samples))
+    
+    if onset:
+        annotations = mne.Annotations(onset=onset, duration=duration, description=description)
+        raw.set_annotations(annotations)
+
+    return raw
+
+
+def unique_path(base, suffix="") -> str:
+    """base + suffix, or base_<n> + suffix with the lowest n >= 2 if that is taken."""
+    path = base + suffix
+    n = 2
+    while os.path.exists(path):
+        path = f"{base}_{n}{suffix}"
+        n += 1
+    return path
+
+
+def save_raw(raw, save_dir, subject_id, run_id) -> str:
+    """
+    Save raw as <subject>_run<run>_<datetime>_raw.fif in save_dir and return the
+    filename. A recording saved within the same second gets a _<n> suffix; an
+    existing file is never overwritten.
+    """
+    timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = unique_path(os.path.join(save_dir, f"{subject_id}_run{run_id}_{timestamp_str}"), "_raw.fif")
+    
+    raw.save(filename, overwrite=False)
+    print(f"Saved data to {filename}") 
+    return filename
+
+
+def sidecar_path(filename, suffix) -> str:
+    """Path of a file stored next to a recording, e.g. <base>_clock.csv for <base>_raw.fif."""
+    base = filename[:-len("_raw.fif")] if filename.endswith("_raw.fif") else os.path.splitext(filename)[0]
+    return f"{base}_{suffix}"
+
+
+def save_clock_offsets(filename, clock_offsets):
+    """Save (local_time, offset) measurements next to the recording, for post-hoc re-alignment."""
+    if not clock_offsets:
+        return
+    path = sidecar_path(filename, "clock.csv")
+    np.savetxt(path, np.array(clock_offsets), delimiter=",", header="local_time,offset", comments="", fmt="%.9f")
+
+
+def save_trial_info(filename, trials):
+    """Save per-trial metadata (one dict per trial) next to the recording."""
+    if not trials:
+        return
+    path = sidecar_path(filename, "trials.csv")
+    pd.DataFrame(trials).to_csv(path, index=False)
+
+
+def save_metrics(filename, registry):
+    """Save the session's hot-path metrics (histogram summaries) next to the recording."""
+    registry.save(sidecar_path(filename, "metrics.json"))
+
+
+def save_models(filename, models, epochs, labels):
+    """
+    Save the models calibrated during the session next to the recording.
+
+    Every version goes to <base>_model_v<n>.pkl (loadable as a CSPSVMClassifier
+    model, with its ModelRegistry metadata in <base>_model_v<n>.json), the filtered epochs and cued markers they were fitted on to
+    <base>_calibration_epochs.npz (version n used the first n_epochs), and
+    <base>_models.json lists the versions with their cross-validated accuracy.
+    """
+    if not models:
+        return
+    import joblib
+    manifest = []
+    for version in models:
+        path = sidecar_path(filename, f"model_v{version['version']}.pkl")
+        joblib.dump(version['model'], path)
+        if 'metadata' in version:
+            with open(os.path.splitext(path)[0] + ".json", 'w') as f:
+                json.dump(version['metadata'], f, indent=2)
+        entry = {k: version[k] for k in ('version', 'n_epochs', 'cv_accuracy', 'fit_s', 'wait_s')}
+        entry['file'] = os.path.basename(path)
+        manifest.append(entry)
+    np.savez(sidecar_path(filename, "calibration_epochs.npz"), epochs=epochs, labels=labels)
+    with open(sidecar_path(filename, "models.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Saved {len(models)} calibrated models next to {filename}")
+
+
+def channel_names(lsl_info):
+    """Channel labels from the stream description, EEG_nnn where missing."""
+    names = []
+    ch = lsl_info.desc().child("channels").child("channel")
+    for k in range(lsl_info.channel_count()):
+        name = ch.child_value("label")
+        names.append(name if name else f"EEG_{k:03d}")
+        ch = ch.next_sibling()
+    return names
+
+
+def save_aux_streams(filename, primary_times, sfreq, aux_streams, markers):
+    """
+    Save auxiliary streams next to the primary recording.
+
+    Every sampled stream goes to <base>_<key>_raw.fif (gaps annotated) with
+    its per-sample timestamps in <base>_<key>_times.npy; marker streams go to
+    <base>_markers.csv with the primary sample each marker falls on. All
+    timestamps are in the primary stream's clock, samples in the units the
+    stream sends them in. <base>_streams.json lists
+    the files and where each stream starts relative to the first EEG sample.
+    """
+    if not aux_streams:
+        return
+    manifest = {'primary': {'file': os.path.basename(filename), 'first_timestamp': float(primary_times[0])},
+                'streams': {}}
+    for key, stream in aux_streams.items():
+        entry = {'type': stream['type'], 'kind': 'markers' if stream['store'] is None else 'samples'}
+        store = stream['store']
+        if store is not None and len(store) > 0:
+            times = store.get_timestamps()
+            raw = create_raw(store.to_array(release=True), times, [], stream['info'], drift_fit=False)
+            path = sidecar_path(filename, f"{key}_raw.fif")
+            raw.save(path, overwrite=False)
+            np.save(sidecar_path(filename, f"{key}_times.npy"), times)
+            entry.update(file=os.path.basename(path), sfreq=stream['info']['sfreq'], n_samples=len(times),
+                         first_timestamp=float(times[0]), start_offset=float(times[0] - primary_times[0]))
+        if store is not None:
+            store.close()
+        manifest['streams'][key] = entry
+
+    if markers:
+        keys, times, values = zip(*markers)
+        samples = events_to_samples(np.array(times), primary_times, sfreq)
+        pd.DataFrame({'stream': keys, 'timestamp': times, 'sample': samples, 'value': values}).to_csv(
+            sidecar_path(filename, "markers.csv"), index=False)
+        manifest['markers'] = os.path.basename(sidecar_path(filename, "markers.csv"))
+
+    with open(sidecar_path(filename, "streams.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Saved {len(aux_streams)} auxiliary streams next to {filename}")
+
+
+def spool_to_raw(spool_dir, info=None, drift_fit=True):
+    """
+    Build the Raw of a spool (see StreamWriter) with its event annotations.
+
+    The samples are read through a memory map and transposed to channel-major
+    float64 in one pass, so this is the only copy of the session in memory when
+    saving (the mapped file pages are page cache the kernel can drop). The
+    spool stays sample-major because it is appended to as data arrives and
+    must be readable after a crash; the transpose costs ~3 ms per million
+    values.
+
+    Returns:
+        (raw, timestamps), raw None if the spool holds no samples.
+    """
+    data, times, events, spool_info = read_spool(spool_dir)
+    if len(times) == 0:
+        return None, times
+    if info is None:
+        info = mne.create_info(ch_names=spool_info["ch_names"], sfreq=spool_info["sfreq"], ch_types='eeg')
+    # Spool is (n_samples, n_channels) float32, MNE expects (n_channels, n_times) float64
+    full_data = np.asarray(data.T, dtype=np.float64)
+    del data
+    return create_raw(full_data, times, events, info, drift_fit=drift_fit), times
+
+
+def recover_spool(spool_dir, save_dir, subject_id="recovered", run_id="recovered") -> str:
+    """
+    Convert a spool left behind by an interrupted session into a .fif file.
+    The spool itself is kept; delete it once the recovered file is checked.
+    """
+    raw, _ = spool_to_raw(spool_dir)
+    if raw is None:
+        raise RuntimeError(f"No samples in {spool_dir}")
+    filename = save_raw(raw, save_dir, subject_id, run_id)
+    save_clock_offsets(filename, read_spool_clock(spool_dir))
+    return filename
+
 
 class DataLogger:
-    def __init__(self, save_dir="data"):
+    def __init__(self, save_dir="data", max_memory_bytes=2 * 1024**3, history_duration=60.0, drift_fit=True):
         self.save_dir = save_dir
         if not os.path.exists(self.save_dir):
             os.makedirs(self.save_dir)
         
-        self.raw_data = []
-        self.timestamps = []
+        # Above this many bytes of auxiliary samples their stores spill blocks to save_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.n_samples = 0 # Primary samples recorded; they are kept in the spool and the history only
+        # Recent samples kept for windowed access (classification)
+        self.history_duration = history_duration
+        self.history = None
         self.events = [] # List of (timestamp, value)
+        self.clock_offsets = [] # List of (local_time, offset) measurements
+        self.trials = [] # Per-trial metadata dicts (prediction, latency, ...)
+        # Auxiliary streams: key -> {'type', 'info', 'store'} (store None for marker streams)
+        self.aux_streams = {}
+        self.markers = [] # List of (stream key, timestamp, value) from marker streams
+        self.dropped_samples = 0 # Lost between the LSL puller and the logger, saved with the recording
+        self.models = [] # Models calibrated during the session, see save_models
+        self.calibration = None # (epochs, labels) the latest model was fitted on
         self.info = None
+        # Align events on a linear fit of the sample clock when saving
+        self.drift_fit = drift_fit
+        # Streams the session to disk as it is recorded; save() converts it to
+        # the .fif, recover_session.py does the same after a crash
+        self.writer = None
         
     def set_stream_info(self, lsl_info):
         # Convert LSL info to MNE info
         n_channels = lsl_info.channel_count()
         sfreq = lsl_info.nominal_srate()
-        ch_names = []
-        
-        # Try to get channel names from description
-        ch = lsl_info.desc().child("channels").child("channel")
-        for k in range(n_channels):
-            name = ch.child_value("label")
-            if name:
-                ch_names.append(name)
-            else:
-                ch_names.append(f"EEG_{k:03d}")
-            ch = ch.next_sibling()
+        ch_names = channel_names(lsl_info)
             
         self.info = mne.create_info(ch_names=ch_names, sfreq=sfreq, ch_types='eeg')
         
+        # New session: start with empty storage
+        self.n_samples = 0
+        self.history = HistoryBuffer(int(self.history_duration * sfreq), n_channels)
+        self.events = []
+        self.clock_offsets = []
+        self.trials = []
+        for stream in self.aux_streams.values():
+            if stream['store'] is not None:
+                stream['store'].close()
+        self.aux_streams = {}
+        self.markers = []
+        self.dropped_samples = 0
+        self.models = []
+        self.calibration = None
+        
+        # A spool that was never saved (e.g. after a crash) is left on disk for recovery
+        if self.writer is not None:
+            self.writer.close()
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        spool_dir = unique_path(os.path.join(self.save_dir, f"session_{timestamp_str}"), ".spool")
+        self.writer = StreamWriter(spool_dir, ch_names, sfreq)
+        
     def add_data(self, data, timestamps):
-        """Append new data chunk."""
+        """Append new data chunk of shape (n_samples, n_channels)."""
         if len(data) > 0:
-            self.raw_data.append(data)
-            self.timestamps.append(timestamps)
+            self.n_samples += len(data)
+            self.history.append(data, timestamps)
+            if self.writer is not None:
+                self.writer.write_data(data, timestamps)
             
+    def add_aux_stream(self, key, lsl_info):
+        """Record an auxiliary stream (after set_stream_info) under `key`."""
+        stream_type = lsl_info.type()
+        stream = {'type': stream_type, 'info': None, 'store': None}
+        if not is_marker_stream(lsl_info):
+            ch_type = AUX_CHANNEL_TYPES.get(stream_type.upper(), 'misc')
+            stream['info'] = mne.create_info(ch_names=channel_names(lsl_info), sfreq=lsl_info.nominal_srate(),
+                                             ch_types=ch_type)
+            stream['store'] = SampleStore(lsl_info.channel_count(), initial_block_samples=2**12,
+                                          max_memory_bytes=self.max_memory_bytes, spill_dir=self.save_dir)
+        self.aux_streams[key] = stream
+
+    def add_aux_data(self, key, data, timestamps):
+        """Samples (n_samples, n_channels) or marker strings of an auxiliary stream, timestamps in the primary clock."""
+        stream = self.aux_streams[key]
+        if stream['store'] is None:
+            self.markers.extend((key, float(t), value) for t, value in zip(timestamps, data))
+        elif len(data) > 0:
+            stream['store'].append(data, timestamps)
+
     def add_event(self, timestamp, marker):
         """Add an event marker."""
         self.events.append((timestamp, marker))
+        if self.writer is not None:
+            self.writer.write_event(timestamp, marker)
         print("event added:", timestamp, marker)
         
     def remove_last_event(self):
         """Remove the last added event."""
         if self.events:
             self.events.pop()
+            if self.writer is not None:
+                self.writer.remove_last_event()
+        
+    def add_clock_offsets(self, offsets):
+        """Record (local_time, offset) clock measurements of the stream."""
+        for local_time, offset in offsets:
+            self.clock_offsets.append((local_time, offset))
+            if self.writer is not None:
+                self.writer.write_clock_offset(local_time, offset)
+
+    def set_dropped_samples(self, n: int):
+        """Running count of samples the acquisition lost before they reached the logger."""
+        self.dropped_samples = int(n)
+
+    def add_model(self, version: dict, epochs: np.ndarray, labels: np.ndarray):
+        """Record a model calibrated in the session with the epochs it was fitted on."""
+        self.models.append(version)
+        self.calibration = (epochs, labels)
+
+    def add_trial_info(self, trial: dict):
+        """Record metadata of a finished trial, saved as <base>_trials.csv."""
+        self.trials.append(trial)
         
     def save(self, subject_id, run_id):
-        if not self.raw_data:
+        t0 = time.perf_counter()
+        if self.writer is not None:
+            self.writer.close()
+            
+        if self.writer is None or self.n_samples == 0:
             print("No data to save.")
+            if self.writer is not None:
+                self.writer.discard()
+                self.writer = None
             return
+        if self.writer.error is not None:
+            print(f"Warning: the spool stopped at a write error ({self.writer.error}), saving what reached the disk")
             
-        # Concatenate all data
-        full_data = np.concatenate(self.raw_data, axis=0).T # MNE expects (n_channels, n_times)
-        full_times = np.concatenate(self.timestamps)
-        
-        # Create Raw object
-        raw = mne.io.RawArray(full_data, self.info)
-        
-        # Handle events
-        # We need to map LSL timestamps to sample indices
-        # This is tricky because LSL timestamps are absolute, but MNE expects samples relative to start.
-        # We assume the data is continuous.
-        
-        start_time = full_times[0]
-        
-        mne_events = []
-        for ts, marker in self.events:
-            # Find sample index closest to timestamp
-            # This is a simple approximation. 
-            # Ideally we use the LSL timestamps to interpolate or just find nearest.
-            
-            # relative time
-            rel_time = ts - start_time
-            if rel_time < 0:
-                continue # Event happened before recording?
-                
-            sample_idx = int(rel_time * self.info['sfreq'])
-            
-            if sample_idx < full_data.shape[1]:
-                mne_events.append([sample_idx, 0, marker])
-                
-        if mne_events:
-            mne_events = np.array(mne_events)
-            # Add annotations or events
-            # For .fif, we can usually just save the raw. 
-            # But adding events is good.
-            # MNE Raw doesn't store events directly in the same way as Epochs, 
-            # but we can create Annotations.
-            
-            mapping = {v: k for k, v in {1:'Relax', 2:'Left', 3:'Right', 4:'Both', 5:'Feet'}.items()} 
-            # We should pass the mapping from config, but for now hardcode or just save events array separately?
-            # Standard way: Save events as a separate file or use Annotations.
-            
-            onset = (mne_events[:, 0] / self.info['sfreq'])
-            duration = np.zeros_like(onset)
-            description = [str(m) for m in mne_events[:, 2]]
-            
-            annotations = mne.Annotations(onset=onset, duration=duration, description=description)
-            raw.set_annotations(annotations)
-
-        # Filename
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(self.save_dir, f"{subject_id}_run{run_id}_{timestamp_str}_raw.fif")
+        # The spool is the session's only copy on disk: the .fif is converted from it
+        raw, full_times = spool_to_raw(self.writer.spool_dir, self.info, drift_fit=self.drift_fit)
+        if raw is None:
+            print("No data to save.")
+            return
+        # The gaps themselves are annotated BAD_gap from the timestamps
+        raw.info['description'] = f"dropped_samples={self.dropped_samples}"
+        if self.dropped_samples:
+            print(f"Warning: {self.dropped_samples} samples dropped by the acquisition buffer")
+        filename = save_raw(raw, self.save_dir, subject_id, run_id)
+        save_clock_offsets(filename, self.clock_offsets)
+        save_trial_info(filename, self.trials)
+        save_aux_streams(filename, full_times, self.info['sfreq'], self.aux_streams, self.markers)
+        self.aux_streams = {}
+        if self.models:
+            save_models(filename, self.models, *self.calibration)
+        if metrics.enabled:
+            metrics.observe("logger.save_ms", (time.perf_counter() - t0) * 1e3)
+            save_metrics(filename, metrics)
         
-        raw.save(filename, overwrite=True)
-        print(f"Saved data to {filename}") 
+        # Everything is in the .fif now, the crash-recovery spool is no longer needed
+        if self.writer is not None:
+            self.writer.discard()
+            self.writer = None
+        return filename
 
     def get_recent_data(self, duration: float) -> np.ndarray:
         """
         Get the most recent data of specified duration.
         Returns numpy array (n_channels, n_samples).
-        If not enough data, returns what is available.
+        If not enough data (or duration exceeds history_duration), returns what is available.
         """
-        if not self.raw_data or self.info is None:
+        if self.history is None or len(self.history) == 0:
             return np.array([])
             
         required_samples = int(duration * self.info['sfreq'])
-        
-        # Collect data backwards
-        collected_samples = 0
-        chunks = []
-        
-        for chunk in reversed(self.raw_data):
-            # chunk is (n_samples, n_channels) (from LSL code analysis)
-            # Wait, LSL pull_chunk returns (n_samples, n_channels)?
-            # Code says: self.data_buffer.extend(chunk)
-            # LSL pull_chunk returns list of samples. Each sample is a list of channels.
-            # So data_buffer is list of [ch1, ch2, ...]
-            # np.array(d) makes it (n_samples, n_channels).
-            # So chunk in raw_data is (n_samples, n_channels).
-            
-            # We want (n_channels, n_samples) for processing usually, or keep (samples, channels) 
-            # and transpose at the end.
-            # MNE expects (n_channels, n_samples).
-            
-            chunks.insert(0, chunk)
-            collected_samples += len(chunk)
-            if collected_samples >= required_samples:
-                break
-                
-        if not chunks:
+        return self.history.latest(required_samples)
+
+    def get_window(self, t_start: float, t_end: float) -> np.ndarray:
+        """
+        Get the samples recorded between two LSL timestamps (t_start <= t < t_end).
+        Returns numpy array (n_channels, n_samples).
+        Only the last history_duration seconds are available.
+        """
+        if self.history is None or len(self.history) == 0:
             return np.array([])
-            
-        full_data = np.concatenate(chunks, axis=0) # (total_samples, n_channels)
-        
-        # Take last required_samples
-        if len(full_data) > required_samples:
-            full_data = full_data[-required_samples:]
-            
-        # Transpose to (n_channels, n_samples)
-        return full_data.T
+
+        data, _ = self.history.window(t_start, t_end)
+        return data
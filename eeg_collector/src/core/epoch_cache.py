@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from .epochs import EpochReader, find_trials
+
+EPOCHS_FILE = "epochs.npy"
+LABELS_FILE = "labels.npy"
+ONSETS_FILE = "onsets.npy"
+META_FILE = "meta.json"
+
+
+def preprocessing_params(classifier, config) -> dict:
+    """Everything that changes the cached epochs besides the recording itself."""
+    return {
+        "device_sampling_rate": classifier.device_sampling_rate,
+        "classifier_sampling_rate": classifier.classifier_sampling_rate,
+        "lowcut": classifier.lowcut,
+        "highcut": classifier.highcut,
+        "filter_samples": classifier.filter_samples,
+        "target_samples": classifier.target_samples,
+        "edge_samples": classifier.edge_samples,
+        # Where the decision window ends relative to the cue
+        "decision_delay": config.preparation_duration + config.recording_duration,
+    }
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(path: str, marker_map: dict, params: dict) -> str:
+    """Hash of the recording's content, the marker map and the preprocessing parameters."""
+    h = hashlib.sha256(file_hash(path).encode())
+    markers = {str(k): v.name if hasattr(v, "name") else str(v) for k, v in marker_map.items()}
+    h.update(json.dumps(markers, sort_keys=True).encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def load_epochs(path: str, classifier, config, cache_dir: str, event_id=None, batch_trials: int = 16):
+    """
+    Preprocessed trial windows of a recording, from cache when possible.
+
+    The cache entry lives in cache_dir/<recording>_<key>/ and holds the
+    filtered epochs (n_trials, n_channels, target_samples) as a .npy file that
+    is returned memory-mapped, plus markers and onsets. When the recording,
+    the marker map or the preprocessing parameters change, the key changes and
+    the entry is rebuilt; older entries of the same recording are removed.
+
+    Safe to call from several processes at once: every build writes to its own
+    temporary directory and renaming it into place is the commit, the first
+    build to finish wins and the others discard their copy.
+
+    Returns:
+        (epochs, markers, onsets)
+    """
+    marker_map = {v: k for k, v in config.markers.items()}
+    params = preprocessing_params(classifier, config)
+    name = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, f"{name}_{cache_key(path, marker_map, params)}")
+
+    for attempt in range(2):
+        if not os.path.exists(os.path.join(entry, META_FILE)):
+            if _build_entry(path, entry, classifier, marker_map, params, event_id, batch_trials):
+                _remove_stale_entries(cache_dir, name, entry)
+        try:
+            epochs = np.load(os.path.join(entry, EPOCHS_FILE), mmap_mode="r")
+            markers = np.load(os.path.join(entry, LABELS_FILE))
+            onsets = np.load(os.path.join(entry, ONSETS_FILE))
+            return epochs, markers, onsets
+        except FileNotFoundError:
+            # Removed as stale by a concurrent build with other parameters, build it again
+            if attempt:
+                raise
+
+
+def _remove_stale_entries(cache_dir, name, entry):
+    # Entries are only ever complete directories, and an open memory map keeps
+    # its file readable after it is removed, so readers of a stale entry are unaffected
+    for other in os.listdir(cache_dir):
+        stale = os.path.join(cache_dir, other)
+        # <name>_<16 hex digits>, not another recording whose name starts with <name>_
+        if other[:-17] == name and other[-17] == "_" and stale != entry and os.path.exists(os.path.join(stale, META_FILE)):
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def _build_entry(path, entry, classifier, marker_map, params, event_id, batch_trials) -> bool:
+    """Build a cache entry, returns False if a concurrent build committed it first."""
+    reader = EpochReader(path, event_id=event_id)
+    # Written next to the final location and renamed, so a crash never leaves a half entry;
+    # a directory of its own, so concurrent builds of the same entry do not share files
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(entry) + ".", suffix=".tmp", dir=os.path.dirname(entry))
+    try:
+        if reader.sfreq != params["device_sampling_rate"]:
+            raise ValueError(f"File fs ({reader.sfreq}) != Classifier expected fs ({params['device_sampling_rate']}).")
+        starts, markers, onsets = find_trials(reader.events, reader.sfreq, reader.n_times, marker_map,
+                                              params["decision_delay"], classifier.filter_samples)
+        n_channels = len(range(len(reader.ch_names))[classifier.preprocessor.channels])
+        epochs = np.lib.format.open_memmap(os.path.join(tmp, EPOCHS_FILE), mode="w+", dtype=np.float64,
+                                           shape=(len(starts), n_channels, classifier.target_samples))
+        for b in range(0, len(starts), batch_trials):
+            windows = reader.get_windows(starts[b:b + batch_trials], classifier.filter_samples)
+            epochs[b:b + batch_trials] = classifier._preprocess(windows)[..., -classifier.target_samples:]
+        epochs.flush()
+        del epochs
+        np.save(os.path.join(tmp, LABELS_FILE), markers)
+        np.save(os.path.join(tmp, ONSETS_FILE), onsets)
+        with open(os.path.join(tmp, META_FILE), "w") as f:
+            json.dump({"source": os.path.abspath(path), "sfreq": reader.sfreq, "params": params,
+                       "n_trials": int(len(starts))}, f, indent=2)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            if not os.path.exists(os.path.join(entry, META_FILE)):
+                raise
+            # Another process committed the same entry meanwhile, it is identical
+            return False
+        return True
+    finally:
+        reader.close()
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import mne
+import numpy as np
+
+
+def find_trials(events: np.ndarray, sfreq: float, n_times: int, marker_ids, decision_delay: float, window_samples: int):
+    """
+    Locate the classifier input window of every task event.
+
+    Returns:
+        (starts, markers, onsets): first sample of every window, its marker
+        and its onset sample, for the events whose window lies in the recording.
+    """
+    events = events[np.isin(events[:, 2], list(marker_ids))]
+    # The decision is taken at the end of the recording period
+    pred_samples = (events[:, 0] + decision_delay * sfreq).astype(np.int64)
+    starts = pred_samples - window_samples
+    valid = (starts >= 0) & (pred_samples <= n_times)
+    for onset, marker_id, start in zip(events[~valid, 0], events[~valid, 2], starts[~valid]):
+        reason = "not enough history" if start < 0 else "end of file"
+        print(f"Skipping marker {marker_id} event at {onset} ({reason})")
+    return starts[valid], events[valid, 2], events[valid, 0]
+
+
+class EpochReader:
+    """
+    Lazy, windowed access to a recorded .fif file.
+
+    The file is opened with preload=False: only the header and annotations are
+    read up front, and the event index is built from the annotations. Samples
+    are read from disk in fixed, aligned segments of `segment_samples`; the
+    last `cache_segments` decoded segments are kept in an LRU cache, so windows
+    that overlap (consecutive trials, repeated reads) are decoded once. Memory
+    use is bounded by the cache and the requested windows, not the file size.
+    """
+
+    def __init__(self, path: str, event_id=None, segment_samples: int = 1 << 14, cache_segments: int = 8):
+        self.path = path
+        self.raw = mne.io.read_raw_fif(path, preload=False, verbose="WARNING")
+        self.sfreq = self.raw.info['sfreq']
+        self.n_times = self.raw.n_times
+        self.ch_names = self.raw.ch_names
+        self.segment_samples = int(segment_samples)
+        self.cache_segments = int(cache_segments)
+        self.cache = OrderedDict() # segment index -> (n_channels, segment_samples) array
+
+        # Event index: (sample, 0, id) with samples counted from the first recorded sample
+        events, self.event_id = mne.events_from_annotations(self.raw, event_id=event_id, verbose="WARNING")
+        events[:, 0] -= self.raw.first_samp
+        self.events = events
+
+    def _segment(self, k: int) -> np.ndarray:
+        if k in self.cache:
+            self.cache.move_to_end(k)
+            return self.cache[k]
+        start = k * self.segment_samples
+        stop = min(start + self.segment_samples, self.n_times)
+        segment = self.raw.get_data(start=start, stop=stop)
+        self.cache[k] = segment
+        if len(self.cache) > self.cache_segments:
+            self.cache.popitem(last=False)
+        return segment
+
+    def get_window(self, start: int, stop: int) -> np.ndarray:
+        """Samples [start, stop) of every channel as (n_channels, stop - start)."""
+        if start < 0 or stop > self.n_times or stop < start:
+            raise ValueError(f"Window [{start}, {stop}) outside recording of {self.n_times} samples")
+        out = np.empty((len(self.ch_names), stop - start))
+        pos = start
+        while pos < stop:
+            k = pos // self.segment_samples
+            seg_start = k * self.segment_samples
+            segment = self._segment(k)
+            n = min(stop, seg_start + segment.shape[1]) - pos
+            out[:, pos - start:pos - start + n] = segment[:, pos - seg_start:pos - seg_start + n]
+            pos += n
+        return out
+
+    def get_windows(self, starts, length: int) -> np.ndarray:
+        """Windows of `length` samples from every start, as (n_windows, n_channels, length)."""
+        starts = np.asarray(starts, dtype=np.int64)
+        out = np.empty((len(starts), len(self.ch_names), int(length)))
+        # In file order, so the cache sees every segment once
+        for i in np.argsort(starts, kind='stable'):
+            out[i] = self.get_window(int(starts[i]), int(starts[i]) + int(length))
+        return out
+
+    def close(self):
+        self.cache.clear()
+        self.raw.close()
@@ -1,10 +1,15 @@
 import random
 import time
 from enum import Enum, auto
-from PyQt6.QtCore import QObject, pyqtSignal, QTimer
-from pylsl import local_clock
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
 from ..config import ExperimentConfig, TaskType
-from ..core.classifier import MockClassifier, CSPSVMClassifier
+from ..core.classifier import MockClassifier, CSPSVMClassifier, ShadowClassifier
+from ..core.scheduler import QtScheduler
+from ..core.continuous import ContinuousDecoder
+from ..core.calibration import Calibrator
+from ..core.model_registry import ModelRegistry
+from ..core.metrics import metrics
 
 class ExperimentState(Enum):
     IDLE = auto()
@@ -20,18 +25,76 @@ class ExperimentSession(QObject):
     task_changed = pyqtSignal(str) # e.g. "Left Hand"
     feedback_ready = pyqtSignal(str, bool) # prediction_name, is_correct
     progress_updated = pyqtSignal(int, int) # current_trial, total_trials
+    prediction_updated = pyqtSignal(float, str, object) # continuous decoding: timestamp, prediction_name, probabilities
     finished = pyqtSignal()
+    # Future of a finished shadow prediction, emitted from the shadow thread and queued to this one
+    shadow_ready = pyqtSignal(object)
     
-    def __init__(self, config: ExperimentConfig, lsl_client, data_logger):
+    def __init__(self, config: ExperimentConfig, lsl_client, data_logger, clock=None, script=None, classifier=None,
+                 scheduler=None, registry=None):
+        """
+        Args:
+            clock: Time source for markers and timers (WallClock by default,
+                a VirtualClock when replaying a recording). Used by the
+                default QtScheduler only.
+            script: Optional list of (cue_time, TaskType) to follow instead of a
+                random sequence, e.g. the trials of a replayed recording.
+            classifier: Classifier to use instead of the one chosen by config.
+            scheduler: Timers and background work, QtScheduler by default or a
+                SimulatedScheduler to run headless on virtual time.
+            registry: ModelRegistry holding config.model_name, ideally
+                preloaded; a new one (loading the model now) by default.
+        """
         super().__init__()
         self.config = config
         self.lsl_client = lsl_client
         self.data_logger = data_logger
+        self.scheduler = scheduler if scheduler is not None else QtScheduler(clock)
+        self.clock = self.scheduler.clock
+        self.script = script
+        # Trial order, relax durations and the mock classifier follow config.random_seed
+        self.rng = random.Random(config.random_seed)
         
-        if not config.use_mock_classifier:
-            self.classifier = CSPSVMClassifier()
+        # In-session calibration: mock feedback until a model fitted on this session's trials is swapped in
+        self.calibrator = None
+        self.model_version = 0 # Calibrated model in use, 0 before the first
+        if config.calibration_trials > 0:
+            self.calibrator = Calibrator(self.scheduler.make_process_worker(), config.calibration_trials,
+                                         refit_every=config.recalibrate_every, seed=config.random_seed)
+            self.calibrator.model_ready.connect(self._on_model_ready)
+        
+        if classifier is not None:
+            self.classifier = classifier
+        elif self.calibrator is not None:
+            self.classifier = MockClassifier(accuracy=config.mock_classifier_accuracy, seed=config.random_seed)
+        elif not config.use_mock_classifier:
+            if registry is None:
+                registry = ModelRegistry(config.models_dir, config.model_cache_size)
+            self.classifier = registry.get(config.model_name)
         else:
-            self.classifier = MockClassifier(accuracy=config.mock_classifier_accuracy)
+            self.classifier = MockClassifier(accuracy=config.mock_classifier_accuracy, seed=config.random_seed)
+        
+        # Shadow models see the same windows as the classifier, their predictions only go to trials.csv
+        if config.shadow_models and self.calibrator is not None:
+            print("Shadow models are not evaluated while calibrating")
+        elif config.shadow_models:
+            if registry is None:
+                registry = ModelRegistry(config.models_dir, config.model_cache_size)
+            shadows = {name: registry.get(name) for name in config.shadow_models}
+            self.classifier = ShadowClassifier(self.classifier, shadows)
+        self.pending_shadows = {} # Future -> (trial record, shadow name) of the predictions not recorded yet
+        self.shadow_ready.connect(self._record_shadow)
+            
+        # Stateful filtering fed from _poll_data, so feedback only reads the filtered window
+        self.preprocessor = None
+        if self.calibrator is not None:
+            # Calibration epochs are cut from the filtered data the fitted models will see
+            self.preprocessor = self.calibrator.template.make_online_preprocessor()
+        elif config.online_preprocessing or getattr(self.classifier, 'filter_mode', None) == "causal":
+            # A causally trained model is always fed causally filtered data
+            if getattr(self.classifier, 'filter_mode', "causal") != "causal":
+                print("Warning: online preprocessing feeds causally filtered data to a model trained zero-phase")
+            self.preprocessor = self.classifier.make_online_preprocessor()
         
         self.state = ExperimentState.IDLE
         self.current_trial_idx = 0
@@ -39,29 +102,78 @@ class ExperimentSession(QObject):
         self.current_task = None
         self.running = False
         self.paused = False
+        self.window_margin = 0.25 # seconds of extra history requested for classification
         
-        self.timer = QTimer()
-        self.timer.setSingleShot(True)
-        self.timer.timeout.connect(self._on_timeout)
+        self.timer = self.scheduler.trial_timer(self._on_timeout)
+        self.timer_start = 0.0 # Clock time the trial timer was started at
+        self.timer_duration = 0.0 # and its interval, to measure when it really fires
         
         # Data polling timer
-        self.poll_timer = QTimer()
-        self.poll_timer.timeout.connect(self._poll_data)
+        self.poll_timer = self.scheduler.timer(self._poll_data)
+        
+        # Classification runs in the background, the deadline timer bounds the wait
+        # (results are emitted from the worker thread, so Qt queues them to this one)
+        self.worker = self.scheduler.make_worker()
+        self.worker.result_ready.connect(self._on_classification_done)
+        self.pending_request = None # Id of the request whose result is awaited
+        self.request_time = 0.0 # perf_counter() at submission
+        self.request_model_version = 0 # Calibrated model the request was submitted to
+        self.deadline_timer = self.scheduler.realtime_timer(self._on_deadline)
+        
+        # Sliding-window predictions between and during trials, from the same (filtered) data
+        self.decoder = None
+        if config.continuous_decoding:
+            self.decoder = ContinuousDecoder(
+                self.classifier,
+                source=lambda: self.preprocessor.history if self.preprocessor is not None else self.data_logger.history,
+                scheduler=self.scheduler, window=config.continuous_window, hop=config.continuous_hop,
+                preprocessed=self.preprocessor is not None, poll=self._poll_data,
+                stream_time=lambda: self.lsl_client.to_stream_time(self.clock.now()),
+                true_label=self._decoder_label, outlet_name=config.continuous_outlet)
+            self.decoder.prediction_ready.connect(self.prediction_updated)
+        
+    def _decoder_label(self):
+        # What the mock classifier "sees": the cued task while it is performed, rest otherwise
+        if self.state in (ExperimentState.CUE, ExperimentState.RECORDING):
+            return self.current_task
+        return TaskType.RELAX
         
     def start(self):
         self.running = True
         self.paused = False
         self.current_trial_idx = 0
         self._generate_sequence()
+        metrics.enabled = self.config.metrics_enabled
+        metrics.reset()
+        if self.preprocessor is not None:
+            self.preprocessor.reset()
+        if self.calibrator is not None:
+            self.calibrator.start()
         
         self.lsl_client.start_recording()
-        self.poll_timer.start(100) # Poll every 100ms
+        self.poll_timer.start(0.1) # Poll every 100ms
+        if self.decoder is not None:
+            sfreq = self.preprocessor.fs_out if self.preprocessor is not None else self.data_logger.info['sfreq']
+            self.decoder.start(sfreq)
         self._next_trial()
         
     def stop(self):
         self.running = False
         self.timer.stop()
         self.poll_timer.stop()
+        if self.decoder is not None:
+            self.decoder.stop()
+        self._cancel_classification()
+        self.worker.shutdown()
+        if isinstance(self.classifier, ShadowClassifier) and self.classifier.executor is not None:
+            # The trial records are complete once the last shadow predictions are in;
+            # record those whose signal is still queued now rather than after the save
+            self.classifier.shutdown(wait=True)
+            for future in list(self.pending_shadows):
+                self._record_shadow(future)
+            self._report_shadows()
+        if self.calibrator is not None:
+            self.calibrator.shutdown()
         self.lsl_client.stop_recording()
         self.state = ExperimentState.IDLE
         self.state_changed.emit(self.state)
@@ -73,6 +185,7 @@ class ExperimentSession(QObject):
             
         self.paused = True
         self.timer.stop()
+        self._cancel_classification()
         self.state = ExperimentState.IDLE # Or a PAUSED state?
         # Let's add PAUSED state to Enum if needed, or just handle logic.
         # User wants "reset only current task".
@@ -94,20 +207,41 @@ class ExperimentSession(QObject):
         self._next_trial()
 
     def _generate_sequence(self):
+        if self.script is not None:
+            self.trial_sequence = [task for _, task in self.script]
+            return
         # Balanced block randomization
         # Create blocks of all tasks, shuffle each block, then concatenate
         tasks = self.config.tasks
         sequence = []
         for _ in range(self.config.repetitions_per_run):
             block = tasks.copy()
-            random.shuffle(block)
+            self.rng.shuffle(block)
             sequence.extend(block)
         self.trial_sequence = sequence
         
     def _poll_data(self):
+        t0 = time.perf_counter() if metrics.enabled else 0.0
         # Fetch data from LSL client and push to DataLogger
         data, timestamps = self.lsl_client.get_data()
-        self.data_logger.add_data(data*1e-6, timestamps)
+        data = data*1e-6
+        self.data_logger.add_data(data, timestamps)
+        if self.preprocessor is not None:
+            self.preprocessor.process(data, timestamps)
+        self.data_logger.add_clock_offsets(self.lsl_client.get_clock_offsets())
+        self.data_logger.set_dropped_samples(getattr(self.lsl_client, 'dropped_samples', 0))
+        # EMG, eye tracking, marker streams... when acquired through an AcquisitionManager
+        get_aux_data = getattr(self.lsl_client, 'get_aux_data', None)
+        if get_aux_data is not None:
+            for key, (aux_data, aux_timestamps) in get_aux_data().items():
+                self.data_logger.add_aux_data(key, aux_data, aux_timestamps)
+        if metrics.enabled:
+            metrics.observe("session.poll_ms", (time.perf_counter() - t0) * 1e3)
+            metrics.observe("session.poll_samples", len(timestamps))
+            if len(timestamps):
+                # Age of the newest sample once stored, on the stream's clock
+                age = self.lsl_client.to_stream_time(self.clock.now()) - timestamps[-1]
+                metrics.observe("session.sample_age_ms", age * 1e3)
         
     def _next_trial(self):
         if not self.running or self.paused:
@@ -133,9 +267,12 @@ class ExperimentSession(QObject):
         # If "Relax" is also a task, we need to distinguish "Inter-trial Relax" from "Task Relax".
         # Let's assume Inter-trial is just a break.
         
-        # Random duration
-        duration = random.uniform(self.config.min_relax_duration, self.config.max_relax_duration)
-        self.timer.start(int(duration * 1000))
+        # Random duration, or up to the scripted cue
+        if self.script is not None:
+            duration = self.script[self.current_trial_idx][0] - self.clock.now()
+        else:
+            duration = self.rng.uniform(self.config.min_relax_duration, self.config.max_relax_duration)
+        self._start_timer(duration)
         
     def _enter_cue(self):
         self.state = ExperimentState.CUE
@@ -145,41 +282,185 @@ class ExperimentSession(QObject):
         self.task_changed.emit(task_name)
         
         # Log event (Cue onset)
-        event_timestamp = local_clock()-self.lsl_client.lsl_offset
+        event_timestamp = self.lsl_client.to_stream_time(self.clock.now())
         self.data_logger.add_event(event_timestamp, self.config.get_marker(self.current_task))
         
-        self.timer.start(int(self.config.preparation_duration * 1000))
+        self._start_timer(self.config.preparation_duration)
         
     def _enter_recording(self):
         self.state = ExperimentState.RECORDING
         self.state_changed.emit(self.state)
         
-        self.timer.start(int(self.config.recording_duration * 1000))
+        self._start_timer(self.config.recording_duration)
         
     def _enter_feedback(self):
         self.state = ExperimentState.FEEDBACK
         self.state_changed.emit(self.state)
         
-        samples = getattr(self.classifier, 'filter_samples', 0)
-        recent_data = self.data_logger.get_recent_data(samples)
+        # A virtual clock stands still from the decision moment until the feedback
+        # is shown, so replay timing does not depend on compute speed (no-op on the wall clock)
+        self.clock.pause()
+        
+        # Drain samples that arrived since the last poll, then cut the classifier
+        # input by time, ending at the decision moment. The extra margin covers
+        # transport latency, the classifier keeps only the trailing samples it needs.
+        self._poll_data()
+        t_end = self.lsl_client.to_stream_time(self.clock.now())
+        
+        if self.preprocessor is not None:
+            # Already filtered while recording, only the decision window is read
+            # The mock classifier used while calibrating takes any window, cut it for the model being fitted
+            target_samples = getattr(self.classifier, 'target_samples', None) or self.calibrator.template.target_samples
+            t_start = t_end - target_samples / self.preprocessor.fs_out - self.window_margin
+            window = self.preprocessor.get_window(t_start, t_end)
+            predict_batch = self.classifier.predict_preprocessed_batch
+            if self.calibrator is not None:
+                self.calibrator.add_epoch(window, self.config.get_marker(self.current_task))
+        else:
+            samples = getattr(self.classifier, 'filter_samples', 0)
+            t_start = t_end - samples / self.data_logger.info['sfreq'] - self.window_margin
+            window = self.data_logger.get_window(t_start, t_end)
+            predict_batch = self.classifier.predict_batch
+        
+        # The window is a copy, so the worker can use it while polling goes on
+        self.request_time = time.perf_counter()
+        self.request_model_version = self.model_version
+        take_shadows = self.classifier.take_shadows if isinstance(self.classifier, ShadowClassifier) else None
+        self.pending_request = self.worker.submit(self._classify, predict_batch, window, self.current_task, take_shadows)
+        # The deadline bounds compute time, so it stays in real time
+        self.deadline_timer.start(self.config.classification_deadline)
         
-        prediction = self.classifier.predict(recent_data, self.current_task)
+    def _on_model_ready(self, version):
+        # Swapped between two trials' feedback or mid-trial alike, a classification
+        # already submitted finishes on the model it started with
+        self.classifier = CSPSVMClassifier(model=version['model'], filter_mode="causal")
+        self.model_version = version['version']
+        version['metadata'] = self.classifier.metadata()
+        if self.decoder is not None:
+            self.decoder.set_classifier(self.classifier)
+        epochs, labels = self.calibrator.training_data()
+        self.data_logger.add_model(version, epochs[:version['n_epochs']], labels[:version['n_epochs']])
+        
+    @staticmethod
+    def _classify(predict_batch, window, task, take_shadows=None):
+        # Runs on the worker thread: a batch of one window
+        labels, probabilities = predict_batch(np.asarray(window)[np.newaxis], [task])
+        # Futures of the shadow predictions this thread just started, if any
+        shadows = take_shadows() if take_shadows is not None else {}
+        return labels[0], probabilities[0], shadows
+        
+    def _on_classification_done(self, request_id, result, inference_time):
+        if request_id != self.pending_request:
+            # Arrived after its deadline, or the trial was paused/stopped meanwhile
+            print(f"Discarded late classification result ({inference_time*1000:.1f} ms)")
+            return
+        self.deadline_timer.stop()
+        self.pending_request = None
+        self.clock.resume()
+        prediction, probabilities, shadows = result if result is not None else (TaskType.ERROR, None, {})
+        self._show_feedback(prediction, inference_time, late=False, probabilities=probabilities, shadows=shadows)
+        
+    def _on_deadline(self):
+        if self.pending_request is None:
+            return
+        self.pending_request = None
+        self.clock.resume()
+        print(f"Classification missed its {self.config.classification_deadline*1000:.0f} ms deadline")
+        self._show_feedback(TaskType.ERROR, None, late=True)
+        
+    def _cancel_classification(self):
+        # A result still on its way is ignored once its id is no longer pending
+        self.deadline_timer.stop()
+        if self.pending_request is not None:
+            self.pending_request = None
+            self.clock.resume()
+        
+    def _show_feedback(self, prediction, inference_time, late, probabilities=None, shadows=None):
         is_correct = (prediction == self.current_task)
         
-        # Emit signal to GUI
+        # Emit signal to GUI, which repaints the stimulus before returning
         self.feedback_ready.emit(prediction.name, is_correct)
         
-        # Log event (Feedback onset + Prediction marker)
-        event_timestamp = local_clock()-self.lsl_client.lsl_offset
+        # Log event (Feedback onset + Prediction marker), taken once the decision is on screen
+        event_timestamp = self.lsl_client.to_stream_time(self.clock.now())
         self.data_logger.add_event(event_timestamp, self.config.get_feedback_marker(prediction))
         
         # Log Binary Correct/Wrong marker
         quality_marker = self.config.marker_correct if is_correct else self.config.marker_wrong
         self.data_logger.add_event(event_timestamp, quality_marker)
         
-        self.timer.start(int(self.config.feedback_duration * 1000))
+        decision_time = time.perf_counter() - self.request_time
+        inference_ms = inference_time * 1000 if inference_time is not None else float('nan')
+        metrics.observe("session.decision_ms", decision_time * 1000)
+        if inference_time is not None:
+            metrics.observe("session.inference_ms", inference_ms)
+        if late:
+            metrics.increment("session.missed_deadlines")
+        print(f"Trial {self.current_trial_idx + 1}: inference {inference_ms:.1f} ms, "
+              f"feedback shown {decision_time*1000:.1f} ms after submission")
+        trial = {
+            'trial': self.current_trial_idx + 1,
+            'task': self.current_task.name,
+            'prediction': prediction.name,
+            'correct': is_correct,
+            'late': late,
+            'inference_ms': inference_ms,
+            'decision_ms': decision_time * 1000,
+            'feedback_time': event_timestamp,
+        }
+        for k, task in enumerate(self.classifier.classes):
+            trial[f"prob_{task.name}"] = float(probabilities[k]) if probabilities is not None else float('nan')
+        if self.calibrator is not None:
+            trial['model_version'] = self.request_model_version
+        self.data_logger.add_trial_info(trial)
+        # Filled in on this thread as the shadow models finish, possibly after the feedback;
+        # stop() waits for them
+        for name, future in (shadows or {}).items():
+            self.pending_shadows[future] = (trial, name)
+            future.add_done_callback(self.shadow_ready.emit)
+        
+        self._start_timer(self.config.feedback_duration)
         
+    def _record_shadow(self, future):
+        if future not in self.pending_shadows:
+            return # Already recorded by stop()
+        trial, name = self.pending_shadows.pop(future)
+        try:
+            labels, probabilities, elapsed = future.result()
+        except Exception as e:
+            print(f"Shadow model {name} error: {e}")
+            labels, probabilities, elapsed = [TaskType.ERROR], None, float('nan')
+        trial[f"shadow_{name}_prediction"] = labels[0].name
+        trial[f"shadow_{name}_correct"] = labels[0].name == trial['task']
+        trial[f"shadow_{name}_inference_ms"] = elapsed * 1000
+        for k, task in enumerate(self.classifier.classes):
+            trial[f"shadow_{name}_prob_{task.name}"] = float(probabilities[0][k]) if probabilities is not None else float('nan')
+
+    def _report_shadows(self):
+        """Accuracy of the classifier and every shadow model over the trials so far."""
+        trials = [t for t in self.data_logger.trials if not t['late']]
+        if not trials:
+            return
+        accuracy = sum(t['correct'] for t in trials) / len(trials)
+        print(f"Classifier accuracy {accuracy:.2f} over {len(trials)} trials")
+        for name in self.classifier.shadows:
+            done = [t for t in trials if f"shadow_{name}_correct" in t]
+            if done:
+                accuracy = sum(t[f"shadow_{name}_correct"] for t in done) / len(done)
+                agree = sum(t[f"shadow_{name}_prediction"] == t['prediction'] for t in done) / len(done)
+                print(f"Shadow model {name}: accuracy {accuracy:.2f}, agrees with the classifier on {agree:.0%} "
+                      f"of {len(done)} trials")
+
+    def _start_timer(self, duration):
+        self.timer_start = self.clock.now()
+        self.timer_duration = duration
+        self.timer.start(duration)
+
     def _on_timeout(self):
+        if metrics.enabled:
+            # How far off the configured duration the state really lasted
+            jitter = self.clock.now() - self.timer_start - self.timer_duration
+            metrics.observe(f"state.{self.state.name.lower()}.jitter_ms", jitter * 1e3)
         if self.state == ExperimentState.RELAX:
             self._enter_cue()
         elif self.state == ExperimentState.CUE:
@@ -0,0 +1,94 @@
+import itertools
+import multiprocessing as mp
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class ClassificationWorker(QObject):
+    """
+    Runs classifier calls on a background thread so the GUI thread keeps
+    rendering while a model predicts.
+
+    The classifier (and its model) is loaded once by its owner and shared
+    with the worker thread; numpy, scipy and sklearn release the GIL for the
+    heavy parts. Every submitted job gets a request id, and its result comes
+    back through `result_ready`, which Qt delivers on the thread that owns the
+    worker (the GUI thread).
+    """
+
+    # request_id, return value of the job (None if it raised), inference time in seconds
+    result_ready = pyqtSignal(int, object, float)
+
+    def __init__(self, max_workers: int = 1):
+        super().__init__()
+        self.max_workers = max_workers
+        self.executor = None
+        self.request_ids = itertools.count(1)
+
+    def submit(self, func, *args) -> int:
+        """Run func(*args) in the background and return the id its result will carry."""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="classifier")
+        request_id = next(self.request_ids)
+        self.executor.submit(self._run, request_id, func, args)
+        return request_id
+
+    def _run(self, request_id, func, args):
+        t0 = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            print(f"Classification error: {e}")
+            result = None
+        # Emitted from the worker thread, queued to the receiver's thread by Qt
+        self.result_ready.emit(request_id, result, time.perf_counter() - t0)
+
+    def shutdown(self):
+        """Drop queued jobs; a running one finishes but nobody waits for it."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class ProcessWorker(QObject):
+    """
+    ClassificationWorker counterpart running jobs in a separate (spawned)
+    process, for CPU-heavy Python work such as fitting a model, which would
+    hold the GIL and stall acquisition if run on a thread. Jobs and their
+    results are pickled, so func must be a module-level function.
+
+    The process is started by the first job and kept for the next ones.
+    """
+
+    # request_id, return value of the job (None if it raised), seconds from submission to result
+    result_ready = pyqtSignal(int, object, float)
+
+    def __init__(self):
+        super().__init__()
+        self.executor = None
+        self.request_ids = itertools.count(1)
+
+    def submit(self, func, *args) -> int:
+        """Run func(*args) in the worker process and return the id its result will carry."""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"))
+        request_id = next(self.request_ids)
+        t0 = time.perf_counter()
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(lambda f: self._done(request_id, f, t0))
+        return request_id
+
+    def _done(self, request_id, future, t0):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Background job error: {e!r}")
+            result = None
+        # Called on the executor's thread, queued to the receiver's thread by Qt
+        self.result_ready.emit(request_id, result, time.perf_counter() - t0)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -2,19 +2,55 @@ import threading
 import time
 import numpy as np
 from pylsl import StreamInlet, resolve_streams, local_clock
-from collections import deque
+from .ring_buffer import RingBuffer
+from .clock_sync import ClockOffsetTracker
+from .metrics import metrics
+
+# pylsl channel_format codes -> numpy dtypes usable as pull_chunk destination
+CHANNEL_FORMAT_DTYPES = {
+    1: np.float32,  # cf_float32
+    2: np.float64,  # cf_double64
+    4: np.int32,    # cf_int32
+    5: np.int16,    # cf_int16
+    6: np.int8,     # cf_int8
+    7: np.int64,    # cf_int64
+}
 
 class LSLClient:
-    def __init__(self, stream_name=None, buffer_duration=30):
+    """
+    Pulls one LSL stream on a background thread into a RingBuffer, from
+    which the GUI thread takes everything new with get_data().
+
+    The puller is the single producer and get_data() the single consumer of
+    the ring. With overflow="block" (the default) a full ring applies
+    backpressure: the puller stops pulling and the samples wait in liblsl's
+    inlet queue (minutes long) until the consumer catches up, so a stalled
+    GUI thread delays samples but loses none. With "drop_oldest" the newest
+    samples always go into the ring and unread ones are overwritten.
+
+    Ring positions are the samples' sequence numbers: `sequence` is the
+    number of the first sample returned by the last get_data() call, and a
+    jump in sequence is counted in `dropped_samples`.
+    """
+
+    def __init__(self, stream_name=None, buffer_duration=30, max_chunk_samples=1024, idle_sleep=0.001,
+                 overflow="block"):
         self.stream_name = stream_name
         self.inlet = None
         self.buffer_duration = buffer_duration
+        self.max_chunk_samples = max_chunk_samples
+        self.idle_sleep = idle_sleep # Seconds the puller waits when nothing arrived
+        self.metrics_prefix = "lsl" # Auxiliary streams report under their own name
+        self.overflow = overflow # Policy of the ring when the consumer falls behind
         self.running = False
         self.thread = None
-        self.data_buffer = deque()
-        self.timestamp_buffer = deque()
+        self.ring = None
+        self.read_cursor = 0
+        self.sequence = 0 # Sequence number of the first sample of the last get_data() chunk
+        self.dropped_samples = 0
+        self.pull_buffer = None
         self.info = None
-        self.lsl_offset = None
+        self.clock = None
         
     def find_streams(self):
         """Resolve all EEG streams on the network."""
@@ -25,16 +61,41 @@ class LSLClient:
         """Connect to a specific stream."""
         self.inlet = StreamInlet(stream_info)
         self.info = self.inlet.info()
-        self.lsl_offset = self.inlet.time_correction()
+        
+        # Keep measuring the clock offset for as long as we are connected
+        if self.clock is not None:
+            self.clock.stop()
+        self.clock = ClockOffsetTracker(self.inlet)
+        self.clock.start()
         print(f"Connected to {self.info.name()} at {self.info.nominal_srate()} Hz")
+        self._allocate_buffers()
+
+    def _allocate_buffers(self):
+        """Preallocate the ring and the pull destination from the stream info."""
+        channel_format = self.info.channel_format()
+        if channel_format not in CHANNEL_FORMAT_DTYPES:
+            raise RuntimeError(f"Unsupported channel format: {channel_format}")
+
+        n_channels = self.info.channel_count()
+        # Irregular streams report 0 Hz, size those as if they were 100 Hz
+        srate = self.info.nominal_srate() or 100.0
+        capacity = int(self.buffer_duration * srate)
+        
+        self.ring = RingBuffer(capacity, n_channels, overflow=self.overflow)
+        self.pull_buffer = np.zeros((self.max_chunk_samples, n_channels), dtype=CHANNEL_FORMAT_DTYPES[channel_format])
+        self.read_cursor = 0
+        self.sequence = 0
+        self.dropped_samples = 0
         
     def start_recording(self):
         if self.inlet is None:
             raise RuntimeError("Stream not connected")
         
         self.running = True
-        self.data_buffer.clear()
-        self.timestamp_buffer.clear()
+        self.ring.clear()
+        self.read_cursor = 0
+        self.sequence = 0
+        self.dropped_samples = 0
         self.thread = threading.Thread(target=self._record_loop, daemon=True)
         self.thread.start()
         
@@ -44,43 +105,76 @@ class LSLClient:
             self.thread.join()
             
     def _record_loop(self):
+        last_pull = None
+        block = self.overflow == "block"
         while self.running:
-            chunk, timestamps = self.inlet.pull_chunk(timeout=1.0)
-            if timestamps:
-                self.data_buffer.extend(chunk)
-                self.timestamp_buffer.extend(timestamps)
+            max_samples = self.max_chunk_samples
+            if block:
+                # Backpressure: leave what does not fit in the inlet's queue
+                max_samples = min(max_samples, self.ring.free_space())
+                if max_samples == 0:
+                    if metrics.enabled:
+                        metrics.increment(f"{self.metrics_prefix}.backpressure_waits")
+                    time.sleep(self.idle_sleep)
+                    continue
+            # liblsl writes straight into pull_buffer, no Python lists are built.
+            # With a timeout liblsl waits until the whole buffer is filled (0.5 s at
+            # 2048 Hz), so only take what is already there and sleep when idle.
+            _, timestamps = self.inlet.pull_chunk(
+                timeout=0.0, max_samples=max_samples, dest_obj=self.pull_buffer)
+            n = len(timestamps)
+            if n:
+                self.ring.write(self.pull_buffer[:n], np.asarray(timestamps, dtype=np.float64))
+                if metrics.enabled:
+                    now = time.perf_counter()
+                    metrics.observe(f"{self.metrics_prefix}.pull_samples", n)
+                    if last_pull is not None:
+                        metrics.observe(f"{self.metrics_prefix}.pull_interval_ms", (now - last_pull) * 1e3)
+                    last_pull = now
             else:
-                time.sleep(0.001)
+                time.sleep(self.idle_sleep)
 
     def get_data(self):
-        """Return currently buffered data and clear buffer."""
-        # In a real experiment, we might want to keep a rolling buffer or 
-        # extract specific windows. For this simple logger, we can just 
-        # dump what we have.
-        # However, for precise slicing, we should probably just return everything 
-        # and let the DataLogger handle the slicing based on event timestamps.
-        
-        # For simplicity in this phase: return all data accumulated since last call
-        # CAUTION: This is not thread-safe if _record_loop is appending while we pop.
-        # A safer way is to make a copy.
-        
-        # Actually, for the experiment, we likely want to fetch data *after* a trial 
-        # or continuously save it.
-        # Let's implement a method to get all available data without clearing, 
-        # or a method to pop.
-        
-        # Let's just return lists for now.
-        d = list(self.data_buffer)
-        t = list(self.timestamp_buffer)
-        
-        # Clear for next batch to avoid memory issues if running long
-        # But we need to be careful not to lose data if we are just polling.
-        # Better approach: The DataLogger should poll frequently or we use a callback.
-        
-        self.data_buffer.clear()
-        self.timestamp_buffer.clear()
-        
-        return np.array(d), np.array(t)
+        """
+        Return samples received since the previous call.
+
+        Returns:
+            (data, timestamps): float32 array (n_samples, n_channels) and
+            float64 array (n_samples,). With the "drop_oldest" policy, samples
+            older than `buffer_duration` that were never read are dropped
+            (counted in `dropped_samples`).
+        """
+        if metrics.enabled:
+            # Unread part of the ring, as a fraction of its capacity (1.0: samples are being dropped)
+            fill = min(self.ring.write_pos - self.read_cursor, self.ring.capacity) / self.ring.capacity
+            metrics.observe(f"{self.metrics_prefix}.buffer_fill", fill)
+            metrics.set_gauge(f"{self.metrics_prefix}.buffer_fill", fill)
+        data, timestamps, end = self.ring.read_since(self.read_cursor)
+        self.sequence = end - len(data)
+        if self.sequence != self.read_cursor:
+            # Overwritten before they were read
+            self.dropped_samples += self.sequence - self.read_cursor
+        self.read_cursor = end
+        if metrics.enabled:
+            metrics.set_gauge(f"{self.metrics_prefix}.dropped_samples", self.dropped_samples)
+        return data, timestamps
+
+    @property
+    def lsl_offset(self):
+        """Current offset between the local and the stream clock (local = stream + offset)."""
+        if self.clock is None:
+            return None
+        return self.clock.offset_at(local_clock())
+
+    def to_stream_time(self, local_ts):
+        """Convert a local_clock() timestamp into the stream's clock."""
+        return self.clock.to_stream_time(local_ts)
+
+    def get_clock_offsets(self):
+        """Return (local_time, offset) measurements taken since the previous call."""
+        if self.clock is None:
+            return []
+        return self.clock.get_samples()
 
     def get_info(self):
         return self.info
@@ -0,0 +1,183 @@
+import bisect
+import json
+import math
+import threading
+import time
+
+
+def log_edges(lo: float = 1e-3, hi: float = 1e6, per_decade: int = 8):
+    """Bucket edges spaced logarithmically from lo to hi, mirrored for negative values."""
+    n = int(round(math.log10(hi / lo) * per_decade))
+    positive = [lo * 10 ** (k / per_decade) for k in range(n + 1)]
+    return [-e for e in reversed(positive)] + [0.0] + positive
+
+
+DEFAULT_EDGES = log_edges()
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram: O(log buckets) per observation and constant
+    memory, whatever the number of observations. Count, sum, min and max are
+    exact; percentiles are interpolated within their bucket.
+    """
+
+    def __init__(self, edges=DEFAULT_EDGES):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        k = bisect.bisect_right(self.edges, value)
+        with self.lock:
+            self.counts[k] += 1
+            self.count += 1
+            self.total += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Estimated q-th percentile (0-100), NaN when empty."""
+        if self.count == 0:
+            return float('nan')
+        rank = q / 100.0 * self.count
+        seen = 0
+        for k, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.edges[k - 1] if k > 0 else self.min
+                hi = self.edges[k] if k < len(self.edges) else self.max
+                lo, hi = max(lo, self.min), min(hi, self.max)
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def summary(self) -> dict:
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class _Timer:
+    """Context manager observing its duration in milliseconds."""
+
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, (time.perf_counter() - self.start) * 1e3)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    """
+    In-process metrics: histograms (durations in ms, sizes), counters and
+    gauges, keyed by dotted names such as "lsl.pull_samples".
+
+    Everything is a no-op while `enabled` is False: observe() returns at its
+    first line and timer() hands out a shared do-nothing context manager.
+    Code on the very hot paths checks `metrics.enabled` itself before taking
+    timestamps, so a disabled registry costs one attribute lookup there.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+            self.started = time.time()
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(name, Histogram())
+        return hist
+
+    def observe(self, name: str, value: float):
+        if not self.enabled:
+            return
+        self.histogram(name).observe(value)
+
+    def timer(self, name: str):
+        """`with metrics.timer("stage_ms"):` observes the block's duration in ms."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def increment(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_gauge(self, name: str, value: float):
+        if not self.enabled:
+            return
+        self.gauges[name] = value
+
+    def get(self, name: str, stat: str = 'p50') -> float:
+        """One statistic of a histogram (or a gauge/counter value), NaN when unknown."""
+        if name in self.histograms:
+            return self.histograms[name].summary().get(stat, float('nan'))
+        if name in self.gauges:
+            return self.gauges[name]
+        return self.counters.get(name, float('nan'))
+
+    def snapshot(self) -> dict:
+        return {
+            'started': self.started,
+            'duration_s': time.time() - self.started,
+            'histograms': {name: hist.summary() for name, hist in sorted(self.histograms.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'gauges': dict(sorted(self.gauges.items())),
+        }
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+# Shared by all components of the process
+metrics = MetricsRegistry()
@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from PyQt6.QtCore import QObject, pyqtSignal
+from .classifier import CSPSVMClassifier
+from .inference import ClassificationWorker
+from .metrics import metrics
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'models')
+
+
+def metadata_path(model_path) -> str:
+    """<model>.json next to <model>.pkl."""
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+def load_classifier(model_path, filter_mode: str = "zero-phase") -> CSPSVMClassifier:
+    """Load a model and run one prediction through it. Runs on the registry's worker thread."""
+    t0 = time.perf_counter()
+    classifier = CSPSVMClassifier(model_path, filter_mode=filter_mode)
+    t1 = time.perf_counter()
+    classifier.warm_up()
+    metrics.observe("registry.load_ms", (t1 - t0) * 1e3)
+    metrics.observe("registry.warm_ms", (time.perf_counter() - t1) * 1e3)
+    return classifier
+
+
+class ModelRegistry(QObject):
+    """
+    Index of the pickled models in `models_dir`, loaded in the background and
+    kept warm.
+
+    Every <name>.pkl is a model, indexed under <name> with the metadata of
+    <name>.json: classes, classifier sampling rate, channel picks, window
+    length and the preprocessing the model was trained on (see
+    CSPSVMClassifier.metadata). A model is loaded with the filter mode of its
+    .json, so a causally trained (calibrated) model is fed causally filtered
+    windows; a model without one is taken to be zero-phase. The .json is written with the model, when it
+    is trained or calibrated (see save_models), so a model whose .json names
+    other preprocessing than the classifier applies is flagged when loaded.
+    A model without one gets its metadata from the loaded classifier, kept
+    in memory only: it describes the model but cannot flag it.
+
+    preload() loads a model on a background thread and runs a warm-up
+    prediction, so the session that starts with it does not block the GUI;
+    get() returns it from an LRU cache of the last `cache_size` models, so
+    switching between subjects' models or restarting a run costs nothing.
+    A model that was not preloaded is loaded by get() itself.
+    """
+
+    # Name of a model whose background load finished, see state()
+    model_loaded = pyqtSignal(str)
+
+    def __init__(self, models_dir: str = None, cache_size: int = 3):
+        super().__init__()
+        self.models_dir = models_dir if models_dir is not None else MODELS_DIR
+        self.cache_size = max(1, cache_size)
+        self.entries = {} # name -> {'path', 'metadata' (None until known), 'generated' (metadata not from a .json)}
+        self.cache = OrderedDict() # name -> loaded classifier, least recently used first
+        self.loading = {} # name -> {'request_id', 'done' (Event), 'classifier'} of the models being preloaded
+        self.worker = ClassificationWorker()
+        self.worker.result_ready.connect(self._on_loaded)
+        self.scan()
+
+    def scan(self) -> list:
+        """Re-read the models directory, returns the model names."""
+        previous = self.entries
+        self.entries = {}
+        if os.path.isdir(self.models_dir):
+            for filename in sorted(os.listdir(self.models_dir)):
+                name, ext = os.path.splitext(filename)
+                if ext != ".pkl":
+                    continue
+                path = os.path.join(self.models_dir, filename)
+                metadata = None
+                if os.path.exists(metadata_path(path)):
+                    try:
+                        with open(metadata_path(path)) as f:
+                            metadata = json.load(f)
+                    except (OSError, ValueError) as e:
+                        print(f"Ignoring metadata of model {name}: {e}")
+                self.entries[name] = {'path': path, 'metadata': metadata}
+                if metadata is None and previous.get(name, {}).get('generated'):
+                    # Still known from the model loaded before
+                    self.entries[name].update(metadata=previous[name]['metadata'], generated=True)
+        return self.names()
+
+    def names(self) -> list:
+        return list(self.entries)
+
+    def metadata(self, name) -> dict:
+        """Metadata of a model, None if it has none and was never loaded."""
+        return self.entries[name]['metadata']
+
+    def is_compatible(self, name) -> bool:
+        """
+        False once a model's .json says it was trained on other preprocessing
+        than the classifier applies (checked when it is loaded), True
+        otherwise, including for models without a .json.
+        """
+        return self.entries[name].get('compatible', True)
+
+    def state(self, name) -> str:
+        """'ready' (cached), 'loading', 'failed' (last preload) or 'unloaded'."""
+        if name in self.cache:
+            return 'ready'
+        if name in self.loading:
+            return 'loading'
+        return 'failed' if self.entries[name].get('failed') else 'unloaded'
+
+    def preload(self, name):
+        """Start loading and warming a model in the background, unless it is cached or on its way."""
+        if name not in self.entries or name in self.cache or name in self.loading:
+            return
+        job = {'done': threading.Event(), 'classifier': None}
+        job['request_id'] = self.worker.submit(self._load, self.entries[name]['path'], self._filter_mode(name), job)
+        self.loading[name] = job
+
+    def _filter_mode(self, name) -> str:
+        entry = self.entries[name]
+        if entry['metadata'] is None or entry.get('generated'):
+            return "zero-phase"
+        return entry['metadata'].get('filter_mode', "zero-phase")
+
+    @staticmethod
+    def _load(path, filter_mode, job):
+        # On the worker thread; get() may be waiting for `done`
+        try:
+            job['classifier'] = load_classifier(path, filter_mode)
+        finally:
+            job['done'].set()
+        return job['classifier']
+
+    def get(self, name) -> CSPSVMClassifier:
+        """
+        Loaded classifier of a model: from the cache, waiting for its preload
+        to finish, or loading it here if it was not preloaded (or that failed).
+        """
+        if name not in self.entries:
+            raise ValueError(f"No model {name} in {self.models_dir}")
+        if name not in self.cache and name in self.loading:
+            self.loading[name]['done'].wait()
+            if self.loading[name]['classifier'] is not None:
+                self._add(name, self.loading[name]['classifier'])
+        if name not in self.cache:
+            self._add(name, load_classifier(self.entries[name]['path'], self._filter_mode(name)))
+        self.cache.move_to_end(name)
+        return self.cache[name]
+
+    def shutdown(self):
+        self.loading = {}
+        self.worker.shutdown()
+
+    def _on_loaded(self, request_id, classifier, elapsed):
+        name = next((name for name, job in self.loading.items() if job['request_id'] == request_id), None)
+        if name is None:
+            return
+        del self.loading[name]
+        self.entries[name]['failed'] = classifier is None
+        if classifier is None:
+            print(f"Failed to preload model {name}")
+        else:
+            if name not in self.cache:
+                self._add(name, classifier)
+            print(f"Model {name} loaded and warmed up in {elapsed:.2f} s")
+        self.model_loaded.emit(name)
+
+    def _add(self, name, classifier):
+        self.cache[name] = classifier
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        entry = self.entries[name]
+        expected = classifier.preprocessing_signature()
+        if entry['metadata'] is None:
+            entry['metadata'] = classifier.metadata()
+            entry['generated'] = True
+        elif not entry.get('generated') and entry['metadata'].get('preprocessing', expected) != expected:
+            print(f"Warning: model {name} was trained on \"{entry['metadata']['preprocessing']}\", "
+                  f"the classifier applies \"{expected}\"")
+            entry['compatible'] = False
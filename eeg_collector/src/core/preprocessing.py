@@ -0,0 +1,206 @@
+from functools import lru_cache
+from math import gcd
+import numpy as np
+from scipy import signal
+from .ring_buffer import HistoryBuffer
+from .metrics import metrics
+
+
+@lru_cache(maxsize=None)
+def design_filters(fs: float, lowcut: float, highcut: float, notch_freq: float = 50.0,
+                   notch_q: float = 30.0, order: int = 5):
+    """
+    Design the notch and band-pass filters in SOS form.
+    Cached per parameter set, so every classifier with the same band shares them.
+
+    Returns:
+        (notch_sos, band_sos)
+    """
+    b_notch, a_notch = signal.iirnotch(notch_freq, notch_q, fs)
+    notch_sos = signal.tf2sos(b_notch, a_notch)
+    band_sos = signal.butter(order, [lowcut, highcut], btype='band', fs=fs, output='sos')
+    return notch_sos, band_sos
+
+
+def settle_samples(sos: np.ndarray, tol: float = 1e-6, max_samples: int = 1 << 16) -> int:
+    """
+    Number of samples after which the impulse response of `sos` has decayed,
+    i.e. the energy left in the tail is below `tol` of the total.
+    A filter started with wrong initial conditions is exact to `tol` after that.
+    """
+    impulse = np.zeros(max_samples)
+    impulse[0] = 1.0
+    response = np.abs(signal.sosfilt(sos, impulse))
+    tail = np.cumsum(response[::-1])[::-1]
+    return int(np.argmax(tail < tol * tail[0])) or max_samples
+
+
+class Preprocessor:
+    """
+    Offline (zero-phase) preprocessing: channel pick, polyphase resampling,
+    50 Hz notch and band-pass, all designed once at construction.
+
+    When only the last `n_out` output samples are needed, the input is cropped
+    to those plus `settle` samples, by which point the start-up transient of the
+    filters has decayed (to ~1e-4 of the signal RMS with BioSemi-like DC
+    offsets). On a 50 s window of which 5 s are used this does a fifth of the
+    work of the original pipeline.
+
+    The final `edge_samples` output samples (250 ms) depend on how the end of
+    the window is extended: the original resample + filtfilt pipeline of
+    CSPSVMClassifier wrapped it around to the window's start (FFT resampling),
+    this one extends it linearly, and the two differ there by up to ~5e-2 of
+    the signal RMS on periodic test signals, more on real recordings.
+    CSPSVMClassifier therefore leaves them out of its window. Everywhere else
+    the output differs from the original pipeline's by less than 5e-3 of the
+    RMS (about 3e-3 measured), which benchmark_preprocessing.py checks on the
+    samples the classifier consumes.
+    """
+
+    def __init__(self, fs_in: int, fs_out: int, lowcut: float, highcut: float,
+                 channels=slice(1, 17), notch_freq: float = 50.0, notch_q: float = 30.0, order: int = 5):
+        self.fs_in = fs_in
+        self.fs_out = fs_out
+        self.channels = channels
+
+        g = gcd(int(fs_in), int(fs_out))
+        self.up = int(fs_out) // g
+        self.down = int(fs_in) // g
+
+        self.notch_sos, self.band_sos = design_filters(fs_out, lowcut, highcut, notch_freq, notch_q, order)
+        # Same edge padding as filtfilt with the equivalent (b, a) filters
+        self.notch_padlen = 3 * 3
+        self.band_padlen = 3 * (2 * order + 1)
+        # Newest output samples shaped by the edge handling rather than by data, see above
+        self.edge_samples = int(fs_out) // 4
+        # Output samples needed before a cropped window is exact, plus the resampler's FIR
+        self.settle = settle_samples(np.vstack([self.notch_sos, self.band_sos])) + 10 * max(self.up, self.down)
+
+    def resample(self, data: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return data
+        # 'line' padding keeps DC offsets and drift from ringing at the edges
+        return signal.resample_poly(data, self.up, self.down, axis=-1, padtype='line')
+
+    def input_samples(self, n_out: int) -> int:
+        """Input samples (at fs_in) that __call__ uses to produce the last n_out output samples."""
+        n_in = -(-(n_out + self.settle) * self.down // self.up)
+        # Keep whole resampling periods so the output grid does not shift
+        return -(-n_in // self.down) * self.down
+
+    def __call__(self, data: np.ndarray, n_out: int = None) -> np.ndarray:
+        """
+        Args:
+            data: EEG data of shape (..., n_channels, n_samples) at fs_in.
+            n_out: Output samples actually needed (the trailing ones). The
+                returned array may be longer; take its last n_out samples.
+
+        Returns:
+            Filtered data of shape (..., n_picked_channels, n_resampled) at fs_out.
+        """
+        if n_out is not None:
+            data = data[..., -self.input_samples(n_out):]
+        data = data[..., self.channels, :]
+        with metrics.timer("preprocess.resample_ms"):
+            data = self.resample(data)
+        with metrics.timer("preprocess.notch_ms"):
+            data = signal.sosfiltfilt(self.notch_sos, data, axis=-1, padlen=self.notch_padlen)
+        with metrics.timer("preprocess.bandpass_ms"):
+            return signal.sosfiltfilt(self.band_sos, data, axis=-1, padlen=self.band_padlen)
+
+
+class OnlinePreprocessor:
+    """
+    Causal, stateful counterpart of Preprocessor, fed chunk by chunk as data
+    arrives. Anti-aliasing low-pass, decimation, notch and band-pass all keep
+    their `sosfilt` state between chunks, and the filtered fs_out signal is
+    kept in a HistoryBuffer, so at decision time the classifier window is read
+    out instead of being recomputed from a long history.
+
+    Being causal, it is not a drop-in replacement for the zero-phase offline
+    pipeline: the output is phase-shifted, and a single pass applies the
+    magnitude response |H| where filtfilt applies |H|^2, so band power (what
+    CSP features are built on) differs as well, by about 10% on EEG-like data
+    and more near the band edges. A model must be trained on this output to be
+    fed from it, as the in-session calibration does.
+    """
+
+    def __init__(self, fs_in: int, fs_out: int, lowcut: float, highcut: float,
+                 channels=slice(1, 17), history_duration: float = 10.0,
+                 notch_freq: float = 50.0, notch_q: float = 30.0, order: int = 5):
+        if fs_in % fs_out:
+            raise ValueError(f"Online preprocessing needs an integer decimation factor, got {fs_in} -> {fs_out} Hz")
+
+        self.fs_in = fs_in
+        self.fs_out = fs_out
+        self.channels = channels
+        self.history_duration = history_duration
+        self.down = int(fs_in // fs_out)
+
+        self.notch_sos, self.band_sos = design_filters(fs_out, lowcut, highcut, notch_freq, notch_q, order)
+        # Anti-aliasing below the new Nyquist frequency
+        self.aa_sos = None if self.down == 1 else signal.butter(8, 0.4 * fs_out, fs=fs_in, output='sos')
+
+        self.history = None
+        self.reset()
+
+    def reset(self):
+        """Forget filter state and history, e.g. when a new recording starts."""
+        self.zi = None
+        self.phase = 0 # Index, within the next chunk, of the next sample kept by decimation
+        self.history = None
+
+    def _init_state(self, first_sample: np.ndarray):
+        # Start in steady state for the first sample, so DC offsets do not ring
+        def steady(sos):
+            return signal.sosfilt_zi(sos)[:, None, :] * first_sample[None, :, None]
+        self.zi = {
+            'aa': steady(self.aa_sos) if self.aa_sos is not None else None,
+            'notch': steady(self.notch_sos),
+            'band': steady(self.band_sos),
+        }
+        capacity = int(self.history_duration * self.fs_out)
+        self.history = HistoryBuffer(capacity, len(first_sample))
+
+    def process(self, data: np.ndarray, timestamps: np.ndarray):
+        """
+        Filter a new chunk and append the result to the history.
+
+        Args:
+            data: Samples of shape (n_samples, n_channels) at fs_in.
+            timestamps: Timestamps of shape (n_samples,).
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+        x = np.asarray(data[:, self.channels], dtype=np.float64).T # (n_channels, n_samples)
+        if self.zi is None:
+            self._init_state(x[:, 0])
+
+        if self.aa_sos is not None:
+            with metrics.timer("online.resample_ms"):
+                x, self.zi['aa'] = signal.sosfilt(self.aa_sos, x, axis=-1, zi=self.zi['aa'])
+                x = x[:, self.phase::self.down]
+            timestamps = timestamps[self.phase::self.down]
+            self.phase = (self.phase - n) % self.down
+            if len(timestamps) == 0:
+                return
+
+        with metrics.timer("online.notch_ms"):
+            x, self.zi['notch'] = signal.sosfilt(self.notch_sos, x, axis=-1, zi=self.zi['notch'])
+        with metrics.timer("online.bandpass_ms"):
+            x, self.zi['band'] = signal.sosfilt(self.band_sos, x, axis=-1, zi=self.zi['band'])
+        self.history.append(x.T, timestamps)
+
+    def latest(self, n_samples: int) -> np.ndarray:
+        """Newest `n_samples` filtered samples as (n_channels, n_samples)."""
+        if self.history is None:
+            return np.zeros((0, 0))
+        return self.history.latest(n_samples)
+
+    def get_window(self, t_start: float, t_end: float) -> np.ndarray:
+        """Filtered samples with t_start <= timestamp < t_end as (n_channels, n_samples)."""
+        if self.history is None:
+            return np.zeros((0, 0))
+        data, _ = self.history.window(t_start, t_end)
+        return data
@@ -0,0 +1,147 @@
+import numpy as np
+from pylsl import StreamInfo
+from .clocks import VirtualClock
+from .epochs import EpochReader
+
+
+class ReplaySource:
+    """
+    Plays a recorded .fif back in place of an LSLClient, without LSL.
+
+    Samples become available as the VirtualClock passes their timestamp
+    (sample index / sfreq from the start of the recording), and get_data()
+    returns whatever is due, exactly like the live client. Recordings hold
+    volts while the amplifier streams microvolts, so data is returned in
+    microvolts to go through ExperimentSession's usual 1e-6 scaling.
+
+    The recording is read lazily through EpochReader. Pass a scheduler's
+    clock (e.g. SimulatedScheduler().clock) to replay on that timeline
+    instead of a free-running VirtualClock.
+    """
+
+    def __init__(self, path: str, speed: float = 50.0, clock=None):
+        self.path = path
+        # Our annotations are marker numbers, keep them as event ids
+        self.reader = EpochReader(path, event_id=lambda desc: int(desc) if desc.isdigit() else None)
+        self.sfreq = self.reader.sfreq
+        self.clock = clock if clock is not None else VirtualClock(speed=speed, start=0.0)
+        self.read_pos = 0 # Next sample to hand out
+        self.info = None
+
+    # --- LSLClient surface ---
+
+    def find_streams(self):
+        return []
+
+    def connect(self, stream_info=None):
+        self.info = self.get_info()
+
+    def start_recording(self):
+        self.read_pos = 0
+        self.clock.start()
+
+    def stop_recording(self):
+        self.clock.pause()
+
+    def get_data(self):
+        """Samples whose timestamp has passed on the virtual clock, as (n_samples, n_channels)."""
+        due = min(int(np.floor(self.clock.now() * self.sfreq)) + 1, self.reader.n_times)
+        if due <= self.read_pos:
+            return np.zeros((0, len(self.reader.ch_names)), dtype=np.float32), np.zeros(0)
+        data = self.reader.get_window(self.read_pos, due).T * 1e6
+        timestamps = np.arange(self.read_pos, due) / self.sfreq
+        self.read_pos = due
+        return data.astype(np.float32), timestamps
+
+    def get_info(self):
+        info = StreamInfo("Replay", "EEG", len(self.reader.ch_names), self.sfreq, "float32", "replay")
+        channels = info.desc().append_child("channels")
+        for name in self.reader.ch_names:
+            channels.append_child("channel").append_child_value("label", name)
+        return info
+
+    @property
+    def lsl_offset(self):
+        # The stream and the session share the virtual clock
+        return 0.0
+
+    def to_stream_time(self, local_ts: float) -> float:
+        return local_ts
+
+    def get_clock_offsets(self):
+        return []
+
+    # --- Replay specific ---
+
+    @property
+    def finished(self) -> bool:
+        return self.read_pos >= self.reader.n_times
+
+    @property
+    def duration(self) -> float:
+        return self.reader.n_times / self.sfreq
+
+    def original_events(self):
+        """(time, marker) of every event in the recording, on the replay's timeline."""
+        events = self.reader.events
+        return [(sample / self.sfreq, int(marker)) for sample, _, marker in events]
+
+    def close(self):
+        self.reader.close()
+
+
+class SyntheticSource:
+    """
+    White-noise EEG on a scheduler's clock, with the LSLClient surface, for
+    running sessions headless without any stream. Seeded, so the data (and
+    everything computed from it) is the same on every run.
+    """
+
+    def __init__(self, clock, n_channels: int = 17, sfreq: float = 2048.0, amplitude: float = 10.0, seed: int = 0):
+        self.clock = clock
+        self.n_channels = n_channels
+        self.sfreq = sfreq
+        self.amplitude = amplitude # microvolts RMS
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.read_pos = 0
+        self.start_time = 0.0
+
+    def find_streams(self):
+        return []
+
+    def connect(self, stream_info=None):
+        pass
+
+    def start_recording(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.read_pos = 0
+        self.start_time = self.clock.now()
+
+    def stop_recording(self):
+        pass
+
+    def get_data(self):
+        due = int(np.floor((self.clock.now() - self.start_time) * self.sfreq)) + 1
+        n = max(0, due - self.read_pos)
+        data = (self.rng.standard_normal((n, self.n_channels)) * self.amplitude).astype(np.float32)
+        timestamps = self.start_time + np.arange(self.read_pos, self.read_pos + n) / self.sfreq
+        self.read_pos += n
+        return data, timestamps
+
+    def get_info(self):
+        info = StreamInfo("Synthetic", "EEG", self.n_channels, self.sfreq, "float32", "synthetic")
+        channels = info.desc().append_child("channels")
+        for k in range(self.n_channels):
+            channels.append_child("channel").append_child_value("label", f"EEG_{k:03d}")
+        return info
+
+    @property
+    def lsl_offset(self):
+        return 0.0
+
+    def to_stream_time(self, local_ts: float) -> float:
+        return local_ts
+
+    def get_clock_offsets(self):
+        return []
@@ -0,0 +1,226 @@
+import threading
+import numpy as np
+
+# What a full ring does with new samples: "drop_oldest" overwrites the unread
+# tail, "block" refuses them so the producer has to wait for the reader
+OVERFLOW_POLICIES = ("drop_oldest", "block")
+
+
+class RingBuffer:
+    """
+    Fixed-capacity ring of (n_samples, n_channels) float32 samples with a
+    parallel float64 timestamp ring.
+
+    Positions are absolute sample counts (the number of samples ever written),
+    so a reader only has to remember the position it last read up to; they
+    double as sequence numbers of the samples. With the "drop_oldest" policy,
+    when a reader falls more than `capacity` samples behind, the oldest
+    samples are overwritten and counted in `dropped_samples` instead of
+    growing the buffer. With "block", the ring tracks its (single) reader and
+    write() never overwrites unread samples: the producer asks free_space()
+    first and holds back whatever does not fit.
+    """
+
+    def __init__(self, capacity: int, n_channels: int, dtype=np.float32, overflow: str = "drop_oldest"):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self.capacity = int(capacity)
+        self.n_channels = int(n_channels)
+        self.data = np.zeros((self.capacity, self.n_channels), dtype=dtype)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.overflow = overflow
+        self.write_pos = 0 # Total samples written so far
+        self.read_pos = 0 # Position the reader of read_since() has reached
+        self.dropped_samples = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.write_pos = 0
+            self.read_pos = 0
+            self.dropped_samples = 0
+
+    def free_space(self) -> int:
+        """Samples that can be written without overwriting unread ones."""
+        with self.lock:
+            return self.capacity - (self.write_pos - self.read_pos)
+
+    def write(self, data: np.ndarray, timestamps: np.ndarray):
+        """
+        Copy a chunk into the ring (at most two memcpy's, one per wrap segment).
+
+        Args:
+            data: Samples of shape (n_samples, n_channels).
+            timestamps: LSL timestamps of shape (n_samples,).
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+        if self.overflow == "block" and n > self.free_space():
+            raise OverflowError(f"{n} samples do not fit, {self.free_space()} free")
+        skipped = 0
+        if n > self.capacity:
+            # Only the newest samples fit, the rest would be overwritten anyway. They
+            # still take their positions, so readers count them as dropped
+            skipped = n - self.capacity
+            data = data[-self.capacity:]
+            timestamps = timestamps[-self.capacity:]
+            n = self.capacity
+
+        with self.lock:
+            self.write_pos += skipped
+            start = self.write_pos % self.capacity
+            first = min(n, self.capacity - start)
+            self.data[start:start + first] = data[:first]
+            self.timestamps[start:start + first] = timestamps[:first]
+            if first < n:
+                self.data[:n - first] = data[first:]
+                self.timestamps[:n - first] = timestamps[first:]
+            self.write_pos += n
+
+    def read_since(self, cursor: int):
+        """
+        Return all samples written after `cursor`.
+
+        Args:
+            cursor: Absolute position returned by the previous call (0 at start).
+
+        Returns:
+            (data, timestamps, new_cursor). data and timestamps are copies,
+            made with a single allocation, so they stay valid after the ring wraps.
+        """
+        with self.lock:
+            end = self.write_pos
+            oldest = max(0, end - self.capacity)
+            if cursor < oldest:
+                # Reader fell behind, the skipped samples are gone
+                self.dropped_samples += oldest - cursor
+                cursor = oldest
+            self.read_pos = end
+            return self._copy_range(cursor, end) + (end,)
+
+    def latest(self, n_samples: int):
+        """Return a copy of the newest `n_samples` samples (or fewer if not yet available)."""
+        with self.lock:
+            end = self.write_pos
+            start = max(0, end - self.capacity, end - int(n_samples))
+            return self._copy_range(start, end)
+
+    def _copy_range(self, start: int, end: int):
+        # Caller holds the lock
+        n = end - start
+        data = np.empty((n, self.n_channels), dtype=self.data.dtype)
+        timestamps = np.empty(n, dtype=np.float64)
+        if n == 0:
+            return data, timestamps
+
+        first_idx = start % self.capacity
+        first = min(n, self.capacity - first_idx)
+        data[:first] = self.data[first_idx:first_idx + first]
+        timestamps[:first] = self.timestamps[first_idx:first_idx + first]
+        if first < n:
+            data[first:] = self.data[:n - first]
+            timestamps[first:] = self.timestamps[:n - first]
+        return data, timestamps
+
+    def __len__(self):
+        with self.lock:
+            return min(self.write_pos, self.capacity)
+
+
+class HistoryBuffer:
+    """
+    Channel-major circular history of the newest `capacity` samples.
+
+    Every sample is stored twice, at i and i + capacity, so any window of up
+    to `capacity` samples is a contiguous slice of the backing array and can
+    be returned with a single memcpy, no matter where the ring wraps.
+    Not thread-safe: writer and readers must live on the same thread.
+    """
+
+    def __init__(self, capacity: int, n_channels: int, dtype=np.float64):
+        if capacity <= 0:
+            raise ValueError("History capacity must be positive")
+
+        self.capacity = int(capacity)
+        self.n_channels = int(n_channels)
+        # Written through here, so the pages are committed now instead of on the first
+        # append, which for a long many-channel history would stall the caller's thread
+        self.data = np.empty((self.n_channels, 2 * self.capacity), dtype=dtype)
+        self.data.fill(0)
+        self.timestamps = np.empty(2 * self.capacity, dtype=np.float64)
+        self.timestamps.fill(0)
+        self.write_pos = 0 # Total samples written so far
+
+    def __len__(self):
+        return min(self.write_pos, self.capacity)
+
+    def append(self, data: np.ndarray, timestamps: np.ndarray):
+        """
+        Append a chunk.
+
+        Args:
+            data: Samples of shape (n_samples, n_channels).
+            timestamps: Timestamps of shape (n_samples,).
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+        if n > self.capacity:
+            data = data[-self.capacity:]
+            timestamps = timestamps[-self.capacity:]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        segments = [(start, 0, first)]
+        if first < n:
+            segments.append((0, first, n))
+        for dst, src_start, src_end in segments:
+            k = src_end - src_start
+            for offset in (dst, dst + self.capacity):
+                self.data[:, offset:offset + k] = data[src_start:src_end].T
+                self.timestamps[offset:offset + k] = timestamps[src_start:src_end]
+        self.write_pos += n
+
+    def _available(self):
+        # Contiguous view bounds of everything still held: [start, end)
+        end = self.write_pos % self.capacity + self.capacity
+        return end - len(self), end
+
+    def latest(self, n_samples: int) -> np.ndarray:
+        """Return a copy of the newest `n_samples` samples (or fewer) as (n_channels, n_samples)."""
+        start, end = self._available()
+        start = max(start, end - int(n_samples))
+        return self.data[:, start:end].copy()
+
+    def window(self, t_start: float, t_end: float):
+        """
+        Return a copy of the samples with t_start <= timestamp < t_end.
+
+        Returns:
+            (data, timestamps): (n_channels, n_samples) and (n_samples,) arrays.
+            Parts of the window older than the history are silently missing.
+        """
+        start, end = self._available()
+        timestamps = self.timestamps[start:end]
+        i = np.searchsorted(timestamps, t_start, side='left')
+        j = np.searchsorted(timestamps, t_end, side='left')
+        return self.data[:, start + i:start + j].copy(), timestamps[i:j].copy()
+
+    def read_since(self, position: int):
+        """
+        Return a copy of the samples written after absolute `position` (the
+        newest `capacity` of them if the reader fell further behind).
+
+        Returns:
+            (data, timestamps, new_position): (n_channels, n_samples) and
+            (n_samples,) arrays, and the position to pass next time.
+        """
+        start, end = self._available()
+        start = max(start, end - (self.write_pos - int(position)))
+        return self.data[:, start:end].copy(), self.timestamps[start:end].copy(), self.write_pos
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+class SampleStore:
+    """
+    Append-only, channel-major storage for a whole recording session: the
+    auxiliary streams of DataLogger (the primary stream is saved from its
+    spool, see spool_to_raw).
+
+    Samples are written into preallocated (n_channels, block_samples) blocks,
+    so the data never has to be transposed or concatenated chunk by chunk.
+    Block size doubles from `initial_block_samples` up to `max_block_samples`,
+    which keeps appends amortised O(chunk). Once the in-memory blocks reach
+    `max_memory_bytes`, new blocks are allocated as memory maps in `spill_dir`.
+    """
+
+    def __init__(self, n_channels: int, initial_block_samples: int = 2**16,
+                 max_block_samples: int = 2**19, max_memory_bytes: int = 2 * 1024**3,
+                 spill_dir: str = None, dtype=np.float64):
+        self.n_channels = int(n_channels)
+        self.initial_block_samples = int(initial_block_samples)
+        self.max_block_samples = int(max_block_samples)
+        self.max_memory_bytes = int(max_memory_bytes)
+        self.spill_dir = spill_dir
+        self.dtype = np.dtype(dtype)
+
+        self.blocks = []            # (n_channels, block_samples) arrays or memmaps
+        self.timestamp_blocks = []  # (block_samples,) float64 arrays
+        self.block_fill = 0         # Samples used in the last block
+        self.n_samples = 0
+        self.memory_bytes = 0
+        self._spill_path = None     # Created lazily, removed in close()
+
+    def __len__(self):
+        return self.n_samples
+
+    def _new_block(self):
+        if self.blocks:
+            size = min(2 * self.blocks[-1].shape[1], self.max_block_samples)
+        else:
+            size = self.initial_block_samples
+
+        nbytes = size * self.n_channels * self.dtype.itemsize
+        if self.memory_bytes + nbytes <= self.max_memory_bytes:
+            block = np.empty((self.n_channels, size), dtype=self.dtype)
+            self.memory_bytes += nbytes
+        else:
+            if self._spill_path is None:
+                self._spill_path = tempfile.mkdtemp(prefix="eeg_spill_", dir=self.spill_dir)
+            path = os.path.join(self._spill_path, f"block_{len(self.blocks):05d}.dat")
+            block = np.memmap(path, dtype=self.dtype, mode="w+", shape=(self.n_channels, size))
+
+        self.blocks.append(block)
+        self.timestamp_blocks.append(np.empty(size, dtype=np.float64))
+        self.block_fill = 0
+
+    def append(self, data: np.ndarray, timestamps: np.ndarray):
+        """
+        Append a chunk.
+
+        Args:
+            data: Samples of shape (n_samples, n_channels), as delivered by LSL.
+            timestamps: Timestamps of shape (n_samples,).
+        """
+        n = len(data)
+        written = 0
+        while written < n:
+            if not self.blocks or self.block_fill == self.blocks[-1].shape[1]:
+                self._new_block()
+            block = self.blocks[-1]
+            k = min(n - written, block.shape[1] - self.block_fill)
+            # Transposed copy straight into the channel-major block
+            block[:, self.block_fill:self.block_fill + k] = data[written:written + k].T
+            self.timestamp_blocks[-1][self.block_fill:self.block_fill + k] = timestamps[written:written + k]
+            self.block_fill += k
+            written += k
+        self.n_samples += n
+
+    def _block_lengths(self):
+        lengths = [len(b) for b in self.timestamp_blocks]
+        if lengths:
+            lengths[-1] = self.block_fill
+        return lengths
+
+    def get_last(self, n_samples: int) -> np.ndarray:
+        """Return a copy of the newest `n_samples` samples as (n_channels, n_samples)."""
+        n_samples = min(int(n_samples), self.n_samples)
+        out = np.empty((self.n_channels, n_samples), dtype=self.dtype)
+        pos = n_samples
+        for block, length in zip(reversed(self.blocks), reversed(self._block_lengths())):
+            if pos == 0:
+                break
+            k = min(pos, length)
+            out[:, pos - k:pos] = block[:, length - k:length]
+            pos -= k
+        return out
+
+    def get_timestamps(self) -> np.ndarray:
+        """Return all timestamps as one contiguous array."""
+        out = np.empty(self.n_samples, dtype=np.float64)
+        pos = 0
+        for block, length in zip(self.timestamp_blocks, self._block_lengths()):
+            out[pos:pos + length] = block[:length]
+            pos += length
+        return out
+
+    def to_array(self, release: bool = False) -> np.ndarray:
+        """
+        Return the whole session as one (n_channels, n_samples) array.
+
+        Args:
+            release: Free each block as soon as it has been copied, so peak
+                memory stays at one copy of the session plus one block.
+                Only the timestamps can be read from the store afterwards.
+        """
+        out = np.empty((self.n_channels, self.n_samples), dtype=self.dtype)
+        pos = 0
+        for i, length in enumerate(self._block_lengths()):
+            out[:, pos:pos + length] = self.blocks[i][:, :length]
+            pos += length
+            if release:
+                self.blocks[i] = None
+
+        if release:
+            self.blocks = []
+            self.memory_bytes = 0
+            self._remove_spill()
+        return out
+
+    def _remove_spill(self):
+        if self._spill_path is not None:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
+            self._spill_path = None
+
+    def close(self):
+        """Drop all data and remove spilled blocks from disk."""
+        self.blocks = []
+        self.timestamp_blocks = []
+        self.block_fill = 0
+        self.n_samples = 0
+        self.memory_bytes = 0
+        self._remove_spill()
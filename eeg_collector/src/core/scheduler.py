@@ -0,0 +1,211 @@
+import heapq
+import itertools
+import time
+from PyQt6.QtCore import QObject, QTimer, Qt, pyqtSignal
+from .clocks import WallClock
+from .inference import ClassificationWorker, ProcessWorker
+
+
+class QtTimer:
+    """QTimer taking its interval in seconds of the scheduler's clock."""
+
+    def __init__(self, callback, single_shot: bool, to_ms, on_fire=None, precise: bool = False):
+        self.callback = callback
+        self.to_ms = to_ms
+        self.on_fire = on_fire
+        self.qtimer = QTimer()
+        self.qtimer.setSingleShot(single_shot)
+        if precise:
+            self.qtimer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.qtimer.timeout.connect(self._fire)
+
+    def _fire(self):
+        if self.on_fire is not None:
+            self.on_fire()
+        self.callback()
+
+    def start(self, seconds: float):
+        self.qtimer.start(self.to_ms(seconds))
+
+    def stop(self):
+        self.qtimer.stop()
+
+    def isActive(self) -> bool:
+        return self.qtimer.isActive()
+
+
+class QtScheduler:
+    """
+    Timers and background work on the Qt event loop, timed by `clock`
+    (WallClock for live sessions, VirtualClock for accelerated replay).
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else WallClock()
+
+    def now(self) -> float:
+        return self.clock.now()
+
+    def timer(self, callback, single_shot: bool = False) -> QtTimer:
+        """Timer on the clock's timeline (e.g. data polling)."""
+        return QtTimer(callback, single_shot, self.clock.to_wall_ms)
+
+    def trial_timer(self, callback) -> QtTimer:
+        """Single-shot timer driving the trial states; the clock keeps it exact."""
+        return QtTimer(callback, True, self.clock.timer_interval, on_fire=self.clock.timer_expired, precise=True)
+
+    def realtime_timer(self, callback) -> QtTimer:
+        """Single-shot timer in real seconds, for compute deadlines."""
+        return QtTimer(callback, True, lambda seconds: max(0, int(seconds * 1000)))
+
+    def make_worker(self) -> ClassificationWorker:
+        return ClassificationWorker()
+
+    def make_process_worker(self) -> ProcessWorker:
+        """Worker for heavy jobs (model fitting) that must not share the GIL."""
+        return ProcessWorker()
+
+
+class SimulatedClock(WallClock):
+    """Time of a SimulatedScheduler; intervals are used as they are."""
+
+    def __init__(self, start: float = 0.0):
+        self.time = float(start)
+
+    def start(self):
+        pass
+
+    def now(self) -> float:
+        return self.time
+
+
+class SimulatedTimer:
+    def __init__(self, scheduler, callback, single_shot: bool):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.single_shot = single_shot
+        self.interval = 0.0
+        self.generation = 0 # Bumped on start/stop, queued firings of older generations are ignored
+        self.active = False
+
+    def start(self, seconds: float):
+        self.generation += 1
+        self.active = True
+        self.interval = max(0.0, float(seconds))
+        self.scheduler._push(self.scheduler.now() + self.interval, self._fire, self.generation)
+
+    def stop(self):
+        self.generation += 1
+        self.active = False
+
+    def isActive(self) -> bool:
+        return self.active
+
+    def _fire(self, generation):
+        if generation != self.generation:
+            return
+        if self.single_shot:
+            self.active = False
+        else:
+            self.scheduler._push(self.scheduler.now() + self.interval, self._fire, generation)
+        self.callback()
+
+
+class InlineWorker(QObject):
+    """
+    ClassificationWorker stand-in for SimulatedScheduler: the job runs at
+    submission and its result is delivered `latency` virtual seconds later
+    through the same `result_ready` signal (a direct call, no event loop).
+    """
+
+    result_ready = pyqtSignal(int, object, float)
+
+    def __init__(self, scheduler, latency: float = 0.0):
+        super().__init__()
+        self.scheduler = scheduler
+        self.latency = latency
+        self.request_ids = itertools.count(1)
+
+    def submit(self, func, *args) -> int:
+        request_id = next(self.request_ids)
+        t0 = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            print(f"Classification error: {e}")
+            result = None
+        elapsed = time.perf_counter() - t0
+        # Delivered later, never from inside submit()
+        self.scheduler._push(self.scheduler.now() + self.latency,
+                             lambda _: self.result_ready.emit(request_id, result, elapsed), None)
+        return request_id
+
+    def shutdown(self):
+        pass
+
+
+class SimulatedScheduler:
+    """
+    Deterministic discrete-event scheduler on virtual time.
+
+    Timers are entries in a priority queue; run() pops them in time order
+    (ties in the order they were scheduled) and jumps the clock to each one,
+    so a session runs as fast as its callbacks do, without a Qt event loop.
+    Classifier jobs run inline and report back after `inference_latency`.
+    """
+
+    def __init__(self, start: float = 0.0, inference_latency: float = 0.0):
+        self.clock = SimulatedClock(start)
+        self.inference_latency = inference_latency
+        self.queue = []
+        self.sequence = itertools.count()
+        self.stopped = False
+
+    def now(self) -> float:
+        return self.clock.time
+
+    def _push(self, when, func, arg):
+        heapq.heappush(self.queue, (when, next(self.sequence), func, arg))
+
+    def timer(self, callback, single_shot: bool = False) -> SimulatedTimer:
+        return SimulatedTimer(self, callback, single_shot)
+
+    def trial_timer(self, callback) -> SimulatedTimer:
+        return SimulatedTimer(self, callback, True)
+
+    def realtime_timer(self, callback) -> SimulatedTimer:
+        # Compute is instantaneous here, deadlines live on virtual time too
+        return SimulatedTimer(self, callback, True)
+
+    def make_worker(self) -> InlineWorker:
+        return InlineWorker(self, self.inference_latency)
+
+    def make_process_worker(self) -> InlineWorker:
+        # Jobs run inline here too, the run stays deterministic
+        return InlineWorker(self, self.inference_latency)
+
+    def stop(self):
+        """Make run() return after the current event."""
+        self.stopped = True
+
+    def run(self, until: float = None, max_events: int = None) -> int:
+        """
+        Process events until the queue is empty, stop() is called, virtual
+        time would pass `until`, or `max_events` were handled.
+
+        Returns:
+            Number of events processed.
+        """
+        self.stopped = False
+        n = 0
+        while self.queue and not self.stopped:
+            if until is not None and self.queue[0][0] > until:
+                self.clock.time = until
+                break
+            if max_events is not None and n >= max_events:
+                break
+            when, _, func, arg = heapq.heappop(self.queue)
+            self.clock.time = when
+            func(arg)
+            n += 1
+        return n
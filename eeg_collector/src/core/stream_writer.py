@@ -0,0 +1,171 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import numpy as np
+
+DATA_FILE = "data.f32"
+TIMESTAMPS_FILE = "timestamps.f64"
+EVENTS_FILE = "events.csv"
+CLOCK_FILE = "clock.csv"
+INFO_FILE = "info.json"
+
+
+class StreamWriter:
+    """
+    Streams a session to an append-only spool directory while it is recorded.
+
+    Layout of the spool:
+        info.json       channel names, sampling rate, start time
+        data.f32        raw float32 samples, (n_samples, n_channels) row-major
+        timestamps.f64  raw float64 LSL timestamps, one per sample
+        events.csv      event log, "add,<timestamp>,<marker>" or "remove,,"
+        clock.csv       clock offset measurements, "<local_time>,<offset>"
+
+    All file I/O happens on a background thread; callers only enqueue.
+    A spool left behind by a crash can be read back with `read_spool`.
+    """
+
+    def __init__(self, spool_dir: str, ch_names, sfreq: float, fsync_interval: float = 1.0):
+        self.spool_dir = spool_dir
+        self.fsync_interval = fsync_interval
+        # A new spool every time: appending to another session's files would merge the two
+        os.makedirs(self.spool_dir, exist_ok=False)
+
+        with open(os.path.join(self.spool_dir, INFO_FILE), "w") as f:
+            json.dump({
+                "ch_names": list(ch_names),
+                "sfreq": sfreq,
+                "start_time": time.time(),
+            }, f)
+
+        self.data_file = open(os.path.join(self.spool_dir, DATA_FILE), "ab")
+        self.timestamps_file = open(os.path.join(self.spool_dir, TIMESTAMPS_FILE), "ab")
+        self.events_file = open(os.path.join(self.spool_dir, EVENTS_FILE), "a")
+        self.clock_file = open(os.path.join(self.spool_dir, CLOCK_FILE), "a")
+
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def write_data(self, data: np.ndarray, timestamps: np.ndarray):
+        """Enqueue a (n_samples, n_channels) chunk."""
+        self.queue.put(("data", data, timestamps))
+
+    def write_event(self, timestamp: float, marker: int):
+        self.queue.put(("event", f"add,{float(timestamp)!r},{int(marker)}\n"))
+
+    def remove_last_event(self):
+        self.queue.put(("event", "remove,,\n"))
+
+    def write_clock_offset(self, local_time: float, offset: float):
+        self.queue.put(("clock", f"{float(local_time)!r},{float(offset)!r}\n"))
+
+    def close(self):
+        """Flush everything queued so far and close the spool files."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        for f in (self.data_file, self.timestamps_file, self.events_file, self.clock_file):
+            f.close()
+
+    def discard(self):
+        """Close and delete the spool, once its content has been saved elsewhere."""
+        self.close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def _write_loop(self):
+        files = (self.data_file, self.timestamps_file, self.events_file, self.clock_file)
+        last_sync = time.monotonic()
+        while True:
+            item = self.queue.get()
+            try:
+                while item is not None:
+                    if self.error is None:
+                        self._write_item(item)
+                    # Drain whatever else is queued before flushing
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+            except Exception as e:
+                # Keep draining so producers are never blocked, but stop writing
+                print(f"Spool writer error: {e}")
+                self.error = e
+
+            if self.error is None:
+                for f in files:
+                    f.flush()
+                if time.monotonic() - last_sync >= self.fsync_interval or item is None:
+                    for f in files:
+                        os.fsync(f.fileno())
+                    last_sync = time.monotonic()
+
+            if item is None:
+                return
+
+    def _write_item(self, item):
+        if item[0] == "data":
+            _, data, timestamps = item
+            self.data_file.write(np.ascontiguousarray(data, dtype=np.float32).tobytes())
+            self.timestamps_file.write(np.ascontiguousarray(timestamps, dtype=np.float64).tobytes())
+        elif item[0] == "clock":
+            self.clock_file.write(item[1])
+        else:
+            self.events_file.write(item[1])
+
+
+def read_spool(spool_dir: str):
+    """
+    Read a (possibly incomplete) spool directory.
+
+    Returns:
+        (data, timestamps, events, info): data is a read-only memmap of shape
+        (n_samples, n_channels), truncated to the samples that have both data
+        and a timestamp on disk; events is a list of (timestamp, marker).
+    """
+    with open(os.path.join(spool_dir, INFO_FILE)) as f:
+        info = json.load(f)
+    n_channels = len(info["ch_names"])
+
+    data_path = os.path.join(spool_dir, DATA_FILE)
+    timestamps = np.fromfile(os.path.join(spool_dir, TIMESTAMPS_FILE), dtype=np.float64)
+    # A crash can leave a partially written sample at the end of either file
+    n_samples = min(os.path.getsize(data_path) // (4 * n_channels), len(timestamps))
+    timestamps = timestamps[:n_samples]
+    if n_samples > 0:
+        data = np.memmap(data_path, dtype=np.float32, mode="r", shape=(n_samples, n_channels))
+    else:
+        data = np.zeros((0, n_channels), dtype=np.float32)
+
+    events = []
+    with open(os.path.join(spool_dir, EVENTS_FILE)) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) != 3:
+                continue # Truncated last line
+            if parts[0] == "add":
+                events.append((float(parts[1]), int(parts[2])))
+            elif parts[0] == "remove" and events:
+                events.pop()
+
+    return data, timestamps, events, info
+
+
+def read_spool_clock(spool_dir: str):
+    """Return the clock offset measurements of a spool as a list of (local_time, offset)."""
+    path = os.path.join(spool_dir, CLOCK_FILE)
+    offsets = []
+    if not os.path.exists(path):
+        return offsets
+    with open(path) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) == 2 and all(parts):
+                offsets.append((float(parts[0]), float(parts[1])))
+    return offsets
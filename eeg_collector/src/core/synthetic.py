@@ -0,0 +1,141 @@
+from typing import Optional
+import numpy as np
+from scipy import signal
+from ..config import ExperimentConfig, TaskType
+
+# BioSemi 16-channel cap, in amplifier order (A1-A16)
+BIOSEMI_16 = ["Fp1", "Fp2", "F4", "Fz", "F3", "T7", "C3", "Cz", "C4", "T8", "P4", "Pz", "P3", "O1", "Oz", "O2"]
+
+# 3-pole/3-zero approximation of a 1/f (pink) spectrum for white-noise input
+PINK_B = [0.049922035, -0.095993537, 0.050612699, -0.004408786]
+PINK_A = [1.0, -2.494956002, 2.017265875, -0.522189400]
+
+# Rhythm sources: (band in Hz, weight per channel label, other channels)
+SOURCES = {
+    "alpha": ((8.0, 12.0), {"O1": 1.0, "Oz": 1.0, "O2": 1.0, "P3": 0.6, "Pz": 0.6, "P4": 0.6}, 0.15),
+    "mu_left": ((9.0, 13.0), {"C3": 1.0, "F3": 0.3, "P3": 0.3, "Cz": 0.3, "T7": 0.2}, 0.0),
+    "mu_right": ((9.0, 13.0), {"C4": 1.0, "F4": 0.3, "P4": 0.3, "Cz": 0.3, "T8": 0.2}, 0.0),
+    "mu_central": ((9.0, 13.0), {"Cz": 1.0, "C3": 0.2, "C4": 0.2, "Fz": 0.3, "Pz": 0.3}, 0.0),
+}
+
+# Motor imagery desynchronises the mu rhythm over the contralateral motor cortex
+ERD_SOURCES = {
+    TaskType.LEFT_HAND: ("mu_right",),
+    TaskType.RIGHT_HAND: ("mu_left",),
+    TaskType.BOTH_HANDS: ("mu_left", "mu_right"),
+    TaskType.FEET: ("mu_central",),
+}
+
+def channel_labels(n_channels: int):
+    """Trigger channel, the 16 cap electrodes, then numbered extra channels."""
+    labels = ["TRIG"] + BIOSEMI_16
+    labels += [f"EEG_{k:03d}" for k in range(len(labels), n_channels)]
+    return labels[:n_channels]
+
+def _unit_gain(b, a=None, sos=None, n=1 << 16):
+    """Scale giving unit-variance output for unit-variance white noise input."""
+    impulse = np.zeros(n)
+    impulse[0] = 1.0
+    h = signal.sosfilt(sos, impulse) if sos is not None else signal.lfilter(b, a, impulse)
+    return 1.0 / np.sqrt(np.sum(h ** 2))
+
+
+class SyntheticEEG:
+    """
+    Streaming generator of EEG-like data in microvolts.
+
+    Every channel gets independent 1/f background noise; alpha (occipital)
+    and mu (sensorimotor) rhythms are narrow-band noise sources mixed into
+    the channels they project to, so they wax and wane in bursts like the
+    real ones; 50 Hz line noise is added everywhere. set_task() suppresses
+    the mu source contralateral to the imagined movement (ERD on C3/C4, Cz
+    for feet) with a smooth onset, and writes the task's marker into the
+    trigger channel. All filters keep their state between generate() calls,
+    so the output does not depend on how it is chunked, and the same seed
+    always produces the same data.
+    """
+
+    def __init__(self, n_channels: int = 17, sfreq: float = 2048.0, seed: int = 0,
+                 background: float = 10.0, alpha: float = 8.0, mu: float = 6.0,
+                 line: float = 5.0, line_freq: float = 50.0, erd: float = 0.6, erd_tau: float = 0.3,
+                 config: ExperimentConfig = None):
+        self.n_channels = n_channels
+        self.sfreq = float(sfreq)
+        self.labels = channel_labels(n_channels)
+        self.config = config or ExperimentConfig()
+        # Separate streams, so chunking does not change which draw goes where
+        background_seed, rhythm_seed, line_seed = np.random.SeedSequence(seed).spawn(3)
+        self.background_rng = np.random.default_rng(background_seed)
+        self.rhythm_rng = np.random.default_rng(rhythm_seed)
+        line_rng = np.random.default_rng(line_seed)
+        self.line = line
+        self.line_freq = line_freq
+        self.erd = erd # Fraction of mu amplitude suppressed during imagery
+        self.erd_tau = erd_tau # Seconds
+
+        self.eeg = eeg = np.array([label != "TRIG" for label in self.labels])
+
+        # Background: pink noise per channel
+        self.pink_gain = background * _unit_gain(PINK_B, PINK_A)
+        self.pink_zi = np.zeros((len(PINK_A) - 1, n_channels))
+
+        # Rhythms: one narrow-band source each, mixed into the channels
+        self.source_names = list(SOURCES)
+        self.sos = []
+        self.source_zi = []
+        self.source_gain = []
+        self.mixing = np.zeros((len(SOURCES), n_channels))
+        for k, name in enumerate(self.source_names):
+            band, weights, default = SOURCES[name]
+            sos = signal.butter(2, band, btype="band", fs=self.sfreq, output="sos")
+            self.sos.append(sos)
+            self.source_zi.append(np.zeros((sos.shape[0], 2)))
+            self.source_gain.append((alpha if name == "alpha" else mu) * _unit_gain(None, sos=sos))
+            self.mixing[k] = [weights.get(label, default) for label in self.labels]
+        self.mixing[:, ~eeg] = 0.0
+
+        # Line noise: per-channel amplitude and phase, as from unequal electrode impedances
+        self.line_amplitude = np.where(eeg, line_rng.uniform(0.5, 1.5, n_channels), 0.0)
+        self.line_phase = line_rng.uniform(0, 2 * np.pi, n_channels)
+
+        self.sample = 0 # Samples generated so far
+        self.task = None
+        self.gain = np.ones(len(SOURCES)) # Current rhythm amplitude factors
+        self.target_gain = np.ones(len(SOURCES))
+        self.pending_marker = 0 # Written to the trigger channel on the next sample
+
+    def set_task(self, task: Optional[TaskType]):
+        """Imagery from the next generated sample on (None or RELAX: rest)."""
+        self.task = task
+        self.target_gain = np.ones(len(SOURCES))
+        for name in ERD_SOURCES.get(task, ()):
+            self.target_gain[self.source_names.index(name)] = 1.0 - self.erd
+        self.pending_marker = self.config.get_marker(task) if task is not None else 0
+
+    def generate(self, n: int) -> np.ndarray:
+        """The next `n` samples as (n, n_channels) float64 microvolts."""
+        white = self.background_rng.standard_normal((n, self.n_channels))
+        data, self.pink_zi = signal.lfilter(PINK_B, PINK_A, white, axis=0, zi=self.pink_zi)
+        data *= self.pink_gain
+
+        # Rhythm amplitudes approach their target exponentially
+        decay = np.exp(-np.arange(1, n + 1) / (self.erd_tau * self.sfreq))[:, None]
+        gain = self.target_gain + (self.gain - self.target_gain) * decay
+        self.gain = gain[-1].copy() if n else self.gain
+
+        sources = np.empty((n, len(SOURCES)))
+        drive = self.rhythm_rng.standard_normal((n, len(SOURCES)))
+        for k in range(len(SOURCES)):
+            sources[:, k], self.source_zi[k] = signal.sosfilt(self.sos[k], drive[:, k], zi=self.source_zi[k])
+            sources[:, k] *= self.source_gain[k]
+        data += (sources * gain) @ self.mixing
+
+        t = (self.sample + np.arange(n)) / self.sfreq
+        data += self.line * self.line_amplitude * np.sin(2 * np.pi * self.line_freq * t[:, None] + self.line_phase)
+
+        data[:, ~self.eeg] = 0.0
+        if n and self.pending_marker:
+            data[0, ~self.eeg] = self.pending_marker
+            self.pending_marker = 0
+        self.sample += n
+        return data
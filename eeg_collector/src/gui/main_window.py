@@ -1,9 +1,11 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLabel, QLineEdit, QPushButton, QComboBox, QGroupBox)
+                             QLabel, QLineEdit, QPushButton, QComboBox, QGroupBox, QListWidget, QListWidgetItem)
 from PyQt6.QtCore import QTimer, pyqtSlot, Qt
-from ..core.lsl_client import LSLClient
+from ..core.acquisition import AcquisitionManager
 from ..core.experiment import ExperimentSession, ExperimentState
 from ..core.data_handler import DataLogger
+from ..core.model_registry import ModelRegistry
+from ..core.metrics import metrics
 from ..config import ExperimentConfig
 from .stimulus_window import StimulusWindow
 
@@ -13,9 +15,12 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("EEG Data Collector")
         self.resize(400, 300)
         
-        self.lsl_client = LSLClient()
-        self.data_logger = DataLogger()
         self.config = ExperimentConfig()
+        self.lsl_client = AcquisitionManager(overflow=self.config.overflow_policy)
+        self.data_logger = DataLogger()
+        # Models are loaded and warmed in the background while the run is configured
+        self.model_registry = ModelRegistry(self.config.models_dir, self.config.model_cache_size)
+        self.model_registry.model_loaded.connect(self.on_model_loaded)
         self.experiment = None
         self.stimulus_window = None
         
@@ -27,6 +32,11 @@ class MainWindow(QMainWindow):
         self.refresh_timer.start(2000)
         self.refresh_streams()
         
+        # Live hot-path metrics in the status group
+        self.metrics_timer = QTimer()
+        self.metrics_timer.timeout.connect(self.update_metrics)
+        self.metrics_timer.start(1000)
+        
     def _init_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -53,6 +63,27 @@ class MainWindow(QMainWindow):
         h_layout.addWidget(self.refresh_btn)
         config_layout.addLayout(h_layout)
         
+        # Classifier model, preloaded as soon as it is selected
+        h_layout = QHBoxLayout()
+        h_layout.addWidget(QLabel("Model:"))
+        self.model_combo = QComboBox()
+        self.model_combo.addItem("Mock classifier", None)
+        for name in self.model_registry.names():
+            self.model_combo.addItem(name, name)
+        if not self.config.use_mock_classifier:
+            self.model_combo.setCurrentIndex(max(0, self.model_combo.findData(self.config.model_name)))
+        self.model_combo.currentIndexChanged.connect(self.on_model_selected)
+        h_layout.addWidget(self.model_combo)
+        config_layout.addLayout(h_layout)
+        self.model_label = QLabel("")
+        config_layout.addWidget(self.model_label)
+        
+        # Auxiliary streams (EMG, eye tracker, markers) recorded alongside the EEG
+        config_layout.addWidget(QLabel("Auxiliary streams:"))
+        self.aux_list = QListWidget()
+        self.aux_list.setMaximumHeight(80)
+        config_layout.addWidget(self.aux_list)
+        
         config_group.setLayout(config_layout)
         layout.addWidget(config_group)
         
@@ -63,6 +94,11 @@ class MainWindow(QMainWindow):
         status_layout.addWidget(self.status_label)
         self.progress_label = QLabel("Trial: 0 / 0")
         status_layout.addWidget(self.progress_label)
+        self.decoder_label = QLabel("") # Continuous decoding output, when enabled
+        status_layout.addWidget(self.decoder_label)
+        self.metrics_label = QLabel("")
+        self.metrics_label.setStyleSheet("font-family: monospace;")
+        status_layout.addWidget(self.metrics_label)
         status_group.setLayout(status_layout)
         layout.addWidget(status_group)
         
@@ -78,6 +114,7 @@ class MainWindow(QMainWindow):
         btn_layout.addWidget(self.stop_btn)
         
         layout.addLayout(btn_layout)
+        self.on_model_selected()
         
     def refresh_streams(self):
         streams = self.lsl_client.find_streams()
@@ -91,6 +128,16 @@ class MainWindow(QMainWindow):
         if index >= 0:
             self.stream_combo.setCurrentIndex(index)
             
+        # Same for the auxiliary streams that were ticked
+        checked = {self.aux_list.item(k).text() for k in range(self.aux_list.count())
+                   if self.aux_list.item(k).checkState() == Qt.CheckState.Checked}
+        self.aux_list.clear()
+        for s in streams:
+            item = QListWidgetItem(f"{s.name()} ({s.type()})")
+            item.setData(Qt.ItemDataRole.UserRole, s)
+            item.setCheckState(Qt.CheckState.Checked if item.text() in checked else Qt.CheckState.Unchecked)
+            self.aux_list.addItem(item)
+            
     def start_experiment(self):
         # Get selected stream
         idx = self.stream_combo.currentIndex()
@@ -100,24 +147,40 @@ class MainWindow(QMainWindow):
             
         stream_info = self.stream_combo.itemData(idx)
         
+        primary_name = self.stream_combo.currentText()
+        aux_infos = [self.aux_list.item(k).data(Qt.ItemDataRole.UserRole) for k in range(self.aux_list.count())
+                     if self.aux_list.item(k).checkState() == Qt.CheckState.Checked
+                     and self.aux_list.item(k).text() != primary_name]
+        
         try:
+            self.lsl_client.remove_aux_streams()
             self.lsl_client.connect(stream_info)
             self.data_logger.set_stream_info(self.lsl_client.get_info())
+            for info in aux_infos:
+                key = self.lsl_client.add_aux_stream(info)
+                self.data_logger.add_aux_stream(key, self.lsl_client.aux[key].info)
         except Exception as e:
             self.status_label.setText(f"Error: {e}")
             return
             
+        # A model still loading in the background is waited for by the session
+        name = self.model_combo.currentData()
+        self.config.use_mock_classifier = name is None
+        if name is not None:
+            self.config.model_name = name
+            
         # Create Stimulus Window
         self.stimulus_window = StimulusWindow()
         self.stimulus_window.keyPressed.connect(self.on_stimulus_key_pressed)
         self.stimulus_window.show()
         
         # Create Experiment Session
-        self.experiment = ExperimentSession(self.config, self.lsl_client, self.data_logger)
+        self.experiment = ExperimentSession(self.config, self.lsl_client, self.data_logger, registry=self.model_registry)
         self.experiment.state_changed.connect(self.on_state_changed)
         self.experiment.task_changed.connect(self.on_task_changed)
         self.experiment.feedback_ready.connect(self.on_feedback_ready)
         self.experiment.progress_updated.connect(self.on_progress_updated)
+        self.experiment.prediction_updated.connect(self.on_prediction_updated)
         self.experiment.finished.connect(self.on_finished)
         
         self.experiment.start()
@@ -126,6 +189,8 @@ class MainWindow(QMainWindow):
         self.stop_btn.setEnabled(True)
         self.subject_input.setEnabled(False)
         self.stream_combo.setEnabled(False)
+        self.aux_list.setEnabled(False)
+        self.model_combo.setEnabled(False)
         
     def stop_experiment(self):
         if self.experiment:
@@ -151,11 +216,65 @@ class MainWindow(QMainWindow):
         self.stop_btn.setEnabled(False)
         self.subject_input.setEnabled(True)
         self.stream_combo.setEnabled(True)
+        self.aux_list.setEnabled(True)
+        self.model_combo.setEnabled(True)
         self.status_label.setText("Status: Stopped & Saved")
 
+    def update_metrics(self):
+        if not (self.experiment and self.experiment.running):
+            return
+        # Shown even without metrics: a non-zero count means the recording has holes
+        dropped = f"Dropped samples: {self.lsl_client.dropped_samples} ({self.config.overflow_policy} on overflow)"
+        if not metrics.enabled:
+            self.metrics_label.setText(dropped)
+            return
+        def value(name, stat='p95', scale=1.0, digits=1):
+            v = metrics.get(name, stat)
+            return "-" if v != v else f"{v * scale:.{digits}f}" # NaN: nothing measured yet
+        lines = [
+            f"LSL pull: {value('lsl.pull_samples', 'p50', digits=0)} samples every {value('lsl.pull_interval_ms', 'p50')} ms, "
+            f"buffer {value('lsl.buffer_fill', 'max', 100, 0)}% max, "
+            f"{metrics.counters.get('lsl.backpressure_waits', 0)} backpressure waits",
+            dropped,
+            f"Poll p95: {value('session.poll_ms')} ms, newest sample {value('session.sample_age_ms')} ms old",
+            f"Inference p95: {value('session.inference_ms')} ms, feedback {value('session.decision_ms')} ms, "
+            f"{metrics.counters.get('session.missed_deadlines', 0)} missed",
+            f"Timer jitter p95: relax {value('state.relax.jitter_ms')}, cue {value('state.cue.jitter_ms')}, "
+            f"recording {value('state.recording.jitter_ms')}, feedback {value('state.feedback.jitter_ms')} ms",
+        ]
+        self.metrics_label.setText("\n".join(lines))
+
+    def on_model_selected(self):
+        name = self.model_combo.currentData()
+        if name is not None:
+            self.model_registry.preload(name)
+        self.update_model_label()
+
+    @pyqtSlot(str)
+    def on_model_loaded(self, name):
+        if name == self.model_combo.currentData():
+            self.update_model_label()
+
+    def update_model_label(self):
+        name = self.model_combo.currentData()
+        if name is None:
+            self.model_label.setText("")
+            return
+        metadata = self.model_registry.metadata(name)
+        state = {'ready': "ready", 'loading': "loading...", 'failed': "failed to load",
+                 'unloaded': "not loaded"}[self.model_registry.state(name)]
+        if not self.model_registry.is_compatible(name):
+            state = "trained on other preprocessing!"
+        text = f"Model {state}"
+        if metadata is not None:
+            text += (f"\n{', '.join(metadata['classes'])}\n{metadata['sfreq']} Hz, "
+                     f"{len(metadata['channels'])} channels, {metadata['preprocessing']}")
+        self.model_label.setText(text)
+
     def closeEvent(self, event):
         if self.experiment and self.experiment.running:
             self.stop_experiment()
+        self.model_registry.shutdown()
         event.accept()
         
     @pyqtSlot(ExperimentState)
@@ -179,6 +298,10 @@ class MainWindow(QMainWindow):
             self.stimulus_window.show_feedback(prediction, is_correct)
             self.status_label.setText(f"Feedback: {prediction} ({'Correct' if is_correct else 'Wrong'})")
         
+    def on_prediction_updated(self, timestamp, prediction, probabilities):
+        probability = max((p for p in probabilities if p == p), default=float('nan')) # Ignore NaN
+        self.decoder_label.setText(f"Decoder: {prediction} ({probability:.2f})")
+        
     def on_finished(self):
         # Save data
         subject_id = self.subject_input.text()
@@ -209,6 +332,8 @@ class MainWindow(QMainWindow):
         self.stop_btn.setEnabled(False)
         self.subject_input.setEnabled(True)
         self.stream_combo.setEnabled(True)
+        self.aux_list.setEnabled(True)
+        self.model_combo.setEnabled(True)
         
         self.status_label.setText("Status: Finished & Saved")
 
@@ -1,14 +1,19 @@
+import argparse
+import glob
 import sys
 import os
+import time
 import numpy as np
 import mne
-from collections import defaultdict
-from sklearn.metrics import confusion_matrix, accuracy_score, classification_report
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.metrics import confusion_matrix, classification_report
 
 # Add src to path
 sys.path.append(os.path.join(os.getcwd()))
 
 from src.core.classifier import CSPSVMClassifier
+from src.core.epochs import EpochReader, find_trials
+from src.core.epoch_cache import load_epochs
 from src.config import TaskType, ExperimentConfig
 
 # File to load
@@ -27,167 +32,252 @@ events_predicted = {"relax_predicted": 11, "left_hand_predicted": 12, "right_han
 classification_result = {"correct": 20, "incorrect": 21}
 all_possible_events_id = {**events_real, **events_predicted, **classification_result}
 
+LABELS = ["RELAX", "LEFT_HAND", "RIGHT_HAND", "BOTH_HANDS", "FEET"]
+
+# Trials read and classified together, bounds memory to this many windows
+BATCH_TRIALS = 16
+
+# Preprocessed epochs are cached here, see src/core/epoch_cache.py
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'epoch_cache')
+
+# Classifiers loaded by this (worker) process, one per model path
+_classifiers = {}
+
 def get_marker_to_task_map(config: ExperimentConfig):
     return {v: k for k, v in config.markers.items()}
 
-def verify_classifier():
-    global_true_labels = []
-    global_predicted_labels = []
-    run_results = []
-
-    for file_path in FILE_PATHS:
-        print(f"Loading data from: {file_path}")
-        if not os.path.exists(file_path):
-            # Try finding it relative to current script if the relative path failed
-            abs_path = os.path.join(os.path.dirname(__file__), file_path)
-            if os.path.exists(abs_path):
-                file_path_to_use = abs_path
-            else:
-                print(f"Error: File not found at {file_path} or {abs_path}")
-                continue
-        else:
-            file_path_to_use = file_path
+def resolve_path(file_path):
+    """Return file_path, or the same path relative to this script, or None if neither exists."""
+    if os.path.exists(file_path):
+        return file_path
+    # Try finding it relative to current script if the relative path failed
+    abs_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path)
+    return abs_path if os.path.exists(abs_path) else None
+
+def expand_globs(patterns):
+    """Expand glob patterns, keeping plain paths that match nothing (reported later as missing)."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches if matches else [pattern])
+    return list(dict.fromkeys(paths))
+
+def get_classifier(model_path):
+    """Load a model once per process and keep it for every file this process evaluates."""
+    if model_path not in _classifiers:
+        _classifiers[model_path] = CSPSVMClassifier(model_path)
+    return _classifiers[model_path]
 
+def init_worker():
+    # One BLAS/OpenMP thread per process, parallelism comes from the pool
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    mne.set_log_level("WARNING")
+
+def evaluate_file(model_path, file_path, debug=False, cache_dir=None):
+    """
+    Score one recording with one model. Runs in a worker process.
+
+    With cache_dir the preprocessed epochs come from the epoch cache (built on
+    first use), so no signal processing runs on repeat evaluations. Without
+    it the recording is read lazily (EpochReader), BATCH_TRIALS windows at a
+    time. Either way memory does not grow with the file size.
+
+    Returns:
+        dict with the file, model, true and predicted label names, the
+        confusion matrix over LABELS and, with debug, per-trial lines.
+    """
+    result = {'file': os.path.basename(file_path), 'model': model_path, 'true': [], 'pred': [],
+              'confusion': np.zeros((len(LABELS), len(LABELS)), dtype=np.int64), 'lines': []}
+
+    path = resolve_path(file_path)
+    if path is None:
+        result['error'] = f"File not found at {file_path}"
+        return result
+
+    try:
+        classifier = get_classifier(model_path)
+    except Exception as e:
+        result['error'] = f"Failed to initialize classifier: {e}"
+        return result
+
+    config = ExperimentConfig()
+    marker_map = get_marker_to_task_map(config)
+    # Only tasks the model knows are scored
+    marker_ids = [m for m in marker_map if m in classifier.model.classes_]
+    description_code_to_consistent_id = {str(v): v for v in all_possible_events_id.values()}
+
+    if cache_dir:
         try:
-            raw = mne.io.read_raw_fif(file_path_to_use, preload=True)
+            epochs, markers, onsets = load_epochs(path, classifier, config, cache_dir,
+                                                  event_id=description_code_to_consistent_id,
+                                                  batch_trials=BATCH_TRIALS)
         except Exception as e:
-            print(f"Failed to load raw file: {e}")
-            continue
-
-        print("Initializing classifier...")
+            result['error'] = f"Failed to load epochs: {e}"
+            return result
+        known = np.flatnonzero(np.isin(markers, marker_ids))
+        onsets = onsets[known]
+        tasks = [marker_map[m] for m in markers[known]]
+        fs_raw = classifier.device_sampling_rate
+        # Rows of the memory-mapped cache, read batch by batch
+        batches = ((np.asarray(epochs[known[b:b + BATCH_TRIALS]]), classifier.predict_preprocessed_batch)
+                   for b in range(0, len(known), BATCH_TRIALS))
+    else:
         try:
-            classifier = CSPSVMClassifier(MODEL_PATH)
-            print("Classifier initialized successfully.")
+            reader = EpochReader(path, event_id=description_code_to_consistent_id)
         except Exception as e:
-            print(f"Failed to initialize classifier: {e}")
-            continue
-        
-        config = ExperimentConfig()
-        marker_map = get_marker_to_task_map(config)
-
-        description_code_to_consistent_id = {str(v): v for v in all_possible_events_id.values()}
-        events, event_id = mne.events_from_annotations(raw, event_id=description_code_to_consistent_id)
-        model_classes = classifier.model.classes_
-        
-        file_true_labels = []
-        file_predicted_labels = []
-        
-        # Prepare counters
-        correct_counts = defaultdict(int)
-        total_counts = defaultdict(int)
-        
-        if DEBUG_RUN:
-            print(f"\nStarting verification for {os.path.basename(file_path)}...")
-            print("-" * 50)
-            print(f"{'Time':<10} | {'True Label':<10} | {'Predicted':<10} | {'Result':<10}")
-            print("-" * 50)
-
-        fs_raw = raw.info['sfreq']
-        
+            result['error'] = f"Failed to load raw file: {e}"
+            return result
+        fs_raw = reader.sfreq
         # Check if we need to adjust expectations
         if fs_raw != classifier.device_sampling_rate:
-            assert False, f"File fs ({fs_raw}) != Classifier expected fs ({classifier.device_sampling_rate})."
-
-        for event in events:
-            start_sample = event[0]
-            marker_id = event[2]
-            
-            # Check if this marker is a known task
-            if marker_id not in marker_map:
-                if DEBUG_RUN:
-                    print("Warning: Unknown marker id: ", marker_id)
-                continue
-            
-            if marker_id not in model_classes:
-                if DEBUG_RUN:
-                    print("Info: Model does not know task ", marker_map[marker_id])
-                continue
-                
-            task_type = marker_map[marker_id]
-            
-            pred_sample = int(start_sample + (config.preparation_duration * fs_raw) + (config.recording_duration * fs_raw))
-            start_extract_sample = pred_sample - classifier.filter_samples
-            
-            if start_extract_sample < 0:
-                print(f"Skipping {task_type.name} event at {start_sample} (not enough history)")
-                continue
-                
-            if pred_sample > raw.n_times:
-                print(f"Skipping {task_type.name} event at {start_sample} (end of file)")
-                continue
-            
-            data_segment, _ = raw[:, start_extract_sample:pred_sample]
-            
-            # Predict
-            try:
-                prediction = classifier.predict(data_segment, task_type)
-            except Exception as e:
-                print(f"Error predicting: {e}")
-                prediction = TaskType.ERROR
-                
-            file_true_labels.append(task_type)
-            file_predicted_labels.append(prediction)
-            
-            is_correct = (prediction == task_type)
-            result_str = "CORRECT" if is_correct else "WRONG"
-            
-            if DEBUG_RUN:
-                print(f"{start_sample/fs_raw:<10.1f} | {task_type.name:<10} | {prediction.name:<10} | {result_str:<10}")
-                print("-" * 50)
-            
-            total_counts[task_type] += 1
-            if is_correct:
-                correct_counts[task_type] += 1
-        
-        y_true_names = [t.name for t in file_true_labels]
-        y_pred_names = [t.name for t in file_predicted_labels]
-        
-        acc = accuracy_score(y_true_names, y_pred_names)
-        
-        run_results.append({
-                'file': os.path.basename(file_path),
-                'accuracy': acc,
-                'correct': sum(1 for t, p in zip(file_true_labels, file_predicted_labels) if t == p),
-                'total': len(file_true_labels)
-            })
-
-        global_true_labels.extend(y_true_names)
-        global_predicted_labels.extend(y_pred_names)
-        
-        print(f"File Accuracy: {acc*100:.2f}%")
-
-    # --- Overall Summary ---
+            reader.close()
+            result['error'] = f"File fs ({fs_raw}) != Classifier expected fs ({classifier.device_sampling_rate})."
+            return result
+        starts, markers, onsets = find_trials(reader.events, fs_raw, reader.n_times, marker_ids,
+                                              config.preparation_duration + config.recording_duration,
+                                              classifier.filter_samples)
+        tasks = [marker_map[m] for m in markers]
+        batches = ((reader.get_windows(starts[b:b + BATCH_TRIALS], classifier.filter_samples), classifier.predict_batch)
+                   for b in range(0, len(starts), BATCH_TRIALS))
+
+    predictions = []
+    probabilities = []
+    for b in range(0, len(tasks), BATCH_TRIALS):
+        batch_tasks = tasks[b:b + BATCH_TRIALS]
+        # Predict
+        try:
+            windows, predict_batch = next(batches)
+            labels, probs = predict_batch(windows, batch_tasks)
+        except Exception as e:
+            print(f"Error predicting: {e}")
+            labels = [TaskType.ERROR] * len(batch_tasks)
+            probs = np.full((len(batch_tasks), len(classifier.classes)), np.nan)
+        predictions.extend(labels)
+        probabilities.extend(probs)
+    if not cache_dir:
+        reader.close()
+    if not tasks:
+        return result
+
+    result['true'] = [t.name for t in tasks]
+    result['pred'] = [p.name for p in predictions]
+    result['confusion'] = confusion_matrix(result['true'], result['pred'], labels=LABELS)
+
+    if debug:
+        for onset, task_type, prediction, probs in zip(onsets, tasks, predictions, probabilities):
+            result_str = "CORRECT" if prediction == task_type else "WRONG"
+            result['lines'].append(f"{onset/fs_raw:<10.1f} | {task_type.name:<10} | {prediction.name:<10} | {result_str:<10} | {np.round(probs, 3)}")
+    return result
+
+def print_file_result(res):
+    if 'error' in res:
+        print(f"Error ({res['file']}): {res['error']}")
+        return
+    if res['lines']:
+        print(f"\nVerification of {res['file']} with {os.path.basename(res['model'])}")
+        print("-" * 50)
+        print(f"{'Time':<10} | {'True Label':<10} | {'Predicted':<10} | {'Result':<10} | Probabilities")
+        print("-" * 50)
+        print("\n".join(res['lines']))
+    correct = sum(t == p for t, p in zip(res['true'], res['pred']))
+    total = len(res['true'])
+    acc_str = f"{correct / total * 100:.2f}%" if total else "N/A"
+    print(f"{res['file']} ({os.path.basename(res['model'])}): File Accuracy: {acc_str}")
+
+def print_summary(model_path, results):
+    """Per-run table and merged confusion matrix of one model."""
     print("\n" + "=" * 60)
-    print("SUMMARY OF ALL RUNS")
+    print(f"SUMMARY OF ALL RUNS - {os.path.basename(model_path)}")
     print("=" * 60)
     print(f"{'File Name':<40} | {'Accuracy':<10} | {'Correct/Total':<15}")
     print("-" * 70)
-    
-    for res in run_results:
-        if 'note' in res:
+
+    global_true_labels = []
+    global_predicted_labels = []
+    merged = np.zeros((len(LABELS), len(LABELS)), dtype=np.int64)
+    for res in results:
+        correct = sum(t == p for t, p in zip(res['true'], res['pred']))
+        total = len(res['true'])
+        if 'error' in res or total == 0:
             acc_str = "N/A"
-            ct_str = "0/0"
         else:
-            acc_str = f"{res['accuracy']*100:.2f}%"
-            ct_str = f"{res['correct']}/{res['total']}"
-        print(f"{res['file']:<40} | {acc_str:<10} | {ct_str:<15}")
+            acc_str = f"{correct / total * 100:.2f}%"
+        print(f"{res['file']:<40} | {acc_str:<10} | {f'{correct}/{total}':<15}")
+        global_true_labels.extend(res['true'])
+        global_predicted_labels.extend(res['pred'])
+        merged += res['confusion']
 
     print("-" * 70)
 
     if global_true_labels:
-        overall_acc = accuracy_score(global_true_labels, global_predicted_labels)
-        print(f"Overall Accuracy: {overall_acc*100:.2f}% ({sum(1 for t, p in zip(global_true_labels, global_predicted_labels) if t == p)}/{len(global_true_labels)})")
-        
+        n_correct = sum(t == p for t, p in zip(global_true_labels, global_predicted_labels))
+        overall_acc = n_correct / len(global_true_labels)
+        print(f"Overall Accuracy: {overall_acc*100:.2f}% ({n_correct}/{len(global_true_labels)})")
+
+        # Summed per-file matrices; ERROR predictions fall outside LABELS
         print("\nOverall Confusion Matrix:")
-        labels = ["RELAX", "LEFT_HAND", "RIGHT_HAND", "BOTH_HANDS", "FEET"]
-        cm = confusion_matrix(global_true_labels, global_predicted_labels, labels=labels)
-        print(cm)
+        print(merged)
 
         print ("\nClassification report:")
-        print(classification_report(global_true_labels, global_predicted_labels, labels=labels))
+        print(classification_report(global_true_labels, global_predicted_labels, labels=LABELS, zero_division=0))
     else:
         print("No events processed across all files.")
 
+def verify_classifier(file_paths=None, model_paths=None, jobs=None, debug=None, cache_dir=CACHE_DIR):
+    """
+    Evaluate every model on every recording, one (model, file) pair per task,
+    fanned out across a process pool. Each worker loads a model at most once.
+    """
+    file_paths = file_paths or FILE_PATHS
+    model_paths = model_paths or [MODEL_PATH]
+    debug = DEBUG_RUN if debug is None else debug
+    jobs = jobs or os.cpu_count() or 1
+    pairs = [(m, f) for m in model_paths for f in file_paths]
+    jobs = min(jobs, len(pairs))
+
+    print(f"Evaluating {len(model_paths)} model(s) on {len(file_paths)} recording(s) with {jobs} process(es)")
+    t0 = time.perf_counter()
+    results = {}
+    if jobs <= 1:
+        init_worker()
+        for m, f in pairs:
+            res = evaluate_file(m, f, debug, cache_dir)
+            print_file_result(res)
+            results[(m, f)] = res
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as pool:
+            futures = {pool.submit(evaluate_file, m, f, debug, cache_dir): (m, f) for m, f in pairs}
+            for future in as_completed(futures):
+                res = future.result()
+                print_file_result(res)
+                results[futures[future]] = res
+    elapsed = time.perf_counter() - t0
+
+    # Summaries in input order, whatever order the workers finished in
+    for m in model_paths:
+        print_summary(m, [results[(m, f)] for f in file_paths])
+    print(f"\nEvaluated {len(pairs)} file(s) in {elapsed:.1f} s")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Score recorded sessions with one or more trained models.")
+    parser.add_argument("recordings", nargs="*", help="Recordings (_raw.fif) or glob patterns, default FILE_PATHS")
+    parser.add_argument("--models", nargs="+", default=None, help="Model files or glob patterns, default MODEL_PATH")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--debug", action="store_true", help="Print every trial")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Preprocessed epoch cache")
+    parser.add_argument("--no-cache", action="store_true", help="Preprocess every trial from the recording")
+    args = parser.parse_args()
+
+    file_paths = expand_globs(args.recordings) if args.recordings else None
+    model_paths = expand_globs(args.models) if args.models else None
+    verify_classifier(file_paths, model_paths, args.jobs, args.debug or DEBUG_RUN,
+                      cache_dir=None if args.no_cache else args.cache_dir)
+
 
 if __name__ == "__main__":
-    verify_classifier()
+    main()
@@ -1,7 +1,10 @@
+import argparse
 import time
 import threading
 import sys
 import os
+import shutil
+import tempfile
 from PyQt6.QtCore import QCoreApplication, QTimer
 
 # Add current dir to path
@@ -10,6 +13,8 @@ sys.path.append(os.getcwd())
 from src.core.lsl_client import LSLClient
 from src.core.experiment import ExperimentSession, ExperimentState
 from src.core.data_handler import DataLogger
+from src.core.scheduler import SimulatedScheduler
+from src.core.replay import SyntheticSource
 from src.config import ExperimentConfig
 
 def run_verification():
@@ -112,5 +117,65 @@ def run_verification():
     app.exec()
     print("Verification done.")
 
+def run_simulated_session(seed, repetitions, sfreq):
+    """
+    One full protocol on a SimulatedScheduler with synthetic data, no Qt event
+    loop and no LSL. Returns the state sequence, the marker stream and the
+    time it took.
+    """
+    scheduler = SimulatedScheduler()
+    source = SyntheticSource(scheduler.clock, sfreq=sfreq, seed=seed)
+    save_dir = tempfile.mkdtemp(prefix="eeg_sim_")
+    logger = DataLogger(save_dir=save_dir)
+    logger.set_stream_info(source.get_info())
+    
+    config = ExperimentConfig()
+    config.repetitions_per_run = repetitions
+    config.random_seed = seed
+    
+    session = ExperimentSession(config, source, logger, scheduler=scheduler)
+    states = []
+    session.state_changed.connect(lambda state: states.append((scheduler.now(), state.name)))
+    
+    t0 = time.perf_counter()
+    session.start()
+    scheduler.run()
+    elapsed = time.perf_counter() - t0
+    
+    events = list(logger.events)
+    logger.writer.close()
+    shutil.rmtree(save_dir, ignore_errors=True)
+    return states, events, elapsed
+
+def run_simulated_verification(seed, repetitions, sfreq):
+    print(f"Simulating {repetitions * 5} trials twice with seed {seed} at {sfreq:g} Hz...")
+    first = run_simulated_session(seed, repetitions, sfreq)
+    second = run_simulated_session(seed, repetitions, sfreq)
+    
+    states, events, elapsed = first
+    feedback_events = [e for e in events if 11 <= e[1] <= 15]
+    print(f"Run 1: {len(states)} state changes, {len(events)} events, "
+          f"{states[-1][0]:.1f} s of session time in {elapsed*1000:.0f} ms")
+    print(f"Run 2: {second[2]*1000:.0f} ms")
+    print(f"Found {len(feedback_events)} prediction events")
+    
+    same_states = first[0] == second[0]
+    same_events = first[1] == second[1]
+    print(f"Same state sequence: {same_states}")
+    print(f"Same marker stream: {same_events}")
+    if not (same_states and same_events):
+        sys.exit(1)
+
 if __name__ == "__main__":
-    run_verification()
+    parser = argparse.ArgumentParser(description="Run an experiment session headless.")
+    parser.add_argument("--simulated", action="store_true",
+                        help="Virtual time and synthetic data instead of a live LSL stream")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repetitions", type=int, default=10, help="Repetitions of every task (simulated only)")
+    parser.add_argument("--sfreq", type=float, default=2048.0, help="Synthetic sampling rate (simulated only)")
+    args = parser.parse_args()
+    
+    if args.simulated:
+        run_simulated_verification(args.seed, args.repetitions, args.sfreq)
+    else:
+        run_verification()